@@ -0,0 +1,101 @@
+"""Measures the cost of encoding and compressing lookup service responses.
+
+A workshop catalog response of the same shape as returned by the workshops
+route is generated for a range of catalog sizes. For each, the time taken to
+encode it with the standard library JSON encoder and with the encoder used by
+the lookup service is reported, along with the size and time taken for each
+content coding the compression middleware can use.
+
+    python benchmark.py --workshops 10 100 1000
+"""
+
+import argparse
+import gzip
+import json
+import timeit
+
+from service.config import (
+    RESPONSE_COMPRESSION_BROTLI_QUALITY,
+    RESPONSE_COMPRESSION_GZIP_LEVEL,
+    RESPONSE_COMPRESSION_THRESHOLD,
+)
+from service.helpers.responses import json_dumps, orjson
+from service.routes.compression import brotli, compress_body
+
+
+def workshop_catalog(count):
+    return {
+        "workshops": [
+            {
+                "name": f"lab-workshop-{index:04}",
+                "title": f"Workshop {index}",
+                "description": "Workshop description which would be displayed "
+                "to the user in the catalog of available workshops.",
+                "labels": {"difficulty": "beginner", "duration": "30m"},
+            }
+            for index in range(count)
+        ]
+    }
+
+
+def best_of(func, repeat):
+    # Returns the best time in milliseconds for a single call of the function.
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark lookup service response encoding."
+    )
+
+    parser.add_argument(
+        "--workshops",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+        help="number of workshops in the catalog",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats")
+
+    args = parser.parse_args()
+
+    print(
+        f"encoder={'orjson' if orjson else 'json'} "
+        f"threshold={RESPONSE_COMPRESSION_THRESHOLD} "
+        f"gzip-level={RESPONSE_COMPRESSION_GZIP_LEVEL} "
+        f"brotli-quality={RESPONSE_COMPRESSION_BROTLI_QUALITY if brotli else '-'}"
+    )
+
+    for count in args.workshops:
+        data = workshop_catalog(count)
+
+        stdlib = best_of(lambda: json.dumps(data).encode("UTF-8"), args.repeat)
+        encoded = best_of(lambda: json_dumps(data), args.repeat)
+
+        body = json_dumps(data)
+
+        print(
+            f"workshops={count} bytes={len(body)} "
+            f"json={stdlib:.3f}ms encoder={encoded:.3f}ms"
+        )
+
+        codings = ["gzip"] + (["br"] if brotli else [])
+
+        for coding in codings:
+            elapsed = best_of(lambda: compress_body(body, coding), args.repeat)
+            compressed = compress_body(body, coding)
+
+            print(
+                f"  {coding}: bytes={len(compressed)} "
+                f"ratio={len(compressed) / len(body):.2f} time={elapsed:.3f}ms"
+            )
+
+        assert gzip.decompress(compress_body(body, "gzip")) == body
+
+
+if __name__ == "__main__":
+    main()
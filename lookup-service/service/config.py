@@ -1,8 +1,21 @@
 """Configuration for the lookup service."""
 
 import functools
+import os
 import random
 
+# Minimum size in bytes of a HTTP response body before it will be compressed,
+# and the compression level to use for gzip and brotli encoded responses.
+
+RESPONSE_COMPRESSION_THRESHOLD = int(
+    os.getenv("RESPONSE_COMPRESSION_THRESHOLD", "1024")
+)
+
+RESPONSE_COMPRESSION_GZIP_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_GZIP_LEVEL", "6"))
+RESPONSE_COMPRESSION_BROTLI_QUALITY = int(
+    os.getenv("RESPONSE_COMPRESSION_BROTLI_QUALITY", "4")
+)
+
 
 @functools.lru_cache(maxsize=1)
 def jwt_token_secret() -> str:
@@ -3,7 +3,7 @@
 import asyncio
 import base64
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
 
 import kopf
 import yaml
@@ -188,6 +188,13 @@ def clusterconfigs_delete(name: str, meta: kopf.Meta, memo: ServiceState, **_):
     cluster_database.remove_cluster(name)
 
 
+# Delay in seconds before recalculating the capacity of a training portal after
+# a change to one of its workshop environments or sessions. Changes occurring
+# within this window are coalesced into a single recalculation.
+
+CAPACITY_RECALCULATION_DELAY = 0.5
+
+
 class ClusterOperator(GenericOperator):
     """Operator for interacting with training platform on separate cluster."""
 
@@ -196,6 +203,49 @@ class ClusterOperator(GenericOperator):
 
         super().__init__(cluster_name, service_state=service_state)
 
+        # Pending capacity recalculations for training portals, keyed by the
+        # name of the portal. This is only accessed from the event loop of the
+        # operator so does not need to be protected by a lock.
+
+        self._pending_recalculations: Dict[
+            str, Tuple[asyncio.AbstractEventLoop, asyncio.TimerHandle]
+        ] = {}
+
+    def schedule_capacity_recalculation(self, portal_name: str) -> None:
+        """Schedule a recalculation of the capacity of the training portal. If
+        a recalculation is already pending for the portal then nothing is done,
+        so a burst of events for the same portal results in only a single
+        recalculation once the delay has expired."""
+
+        loop = asyncio.get_running_loop()
+
+        pending = self._pending_recalculations.get(portal_name)
+
+        # The event loop is recreated if the operator is restarted, in which
+        # case any callback which was pending on the old event loop will never
+        # be run and so is replaced.
+
+        if pending and pending[0] is loop:
+            return
+
+        handle = loop.call_later(
+            CAPACITY_RECALCULATION_DELAY, self.recalculate_capacity, portal_name
+        )
+
+        self._pending_recalculations[portal_name] = (loop, handle)
+
+    def recalculate_capacity(self, portal_name: str) -> None:
+        """Recalculate the capacity of the training portal, if it still
+        exists."""
+
+        self._pending_recalculations.pop(portal_name, None)
+
+        with synchronized(self.cluster_config):
+            portal = self.cluster_config.get_portal(portal_name)
+
+            if portal:
+                portal.recalculate_capacity()
+
     def register_handlers(self) -> None:
         """Register the handlers for the training platform operator."""
 
@@ -288,7 +338,7 @@ class ClusterOperator(GenericOperator):
                             spec, "portal.sessions.maximum", 0
                         )
 
-                    portal_state.recalculate_capacity()
+                    self.schedule_capacity_recalculation(portal_name)
 
         @kopf.on.event(
             "workshopenvironments.training.educates.dev",
@@ -334,7 +384,8 @@ class ClusterOperator(GenericOperator):
                         )
 
                         portal.remove_environment(environment_name)
-                        portal.recalculate_capacity()
+
+                        self.schedule_capacity_recalculation(portal_name)
 
                         if portal.phase == "Unknown" and not portal.get_environments():
                             logger.info(
@@ -413,6 +464,24 @@ class ClusterOperator(GenericOperator):
                             )
                         )
 
+                    elif (
+                        environment_state.generation == workshop_generation
+                        and environment_state.title == xgetattr(workshop_spec, "title")
+                        and environment_state.description
+                        == xgetattr(workshop_spec, "description")
+                        and environment_state.labels
+                        == xgetattr(workshop_spec, "labels", [])
+                        and environment_state.phase == xgetattr(status, "educates.phase")
+                        and environment_state.capacity
+                        == xgetattr(status, "educates.capacity", 0)
+                        and environment_state.reserved
+                        == xgetattr(status, "educates.reserved", 0)
+                    ):
+                        # None of the fields we track for the workshop
+                        # environment have changed so there is nothing to do.
+
+                        return
+
                     else:
                         logger.info(
                             "Updating workshop environment %s for workshop %s from portal %s of cluster %s",  # pylint: disable=line-too-long
@@ -438,7 +507,7 @@ class ClusterOperator(GenericOperator):
                             status, "educates.reserved", 0
                         )
 
-                    portal.recalculate_capacity()
+                    self.schedule_capacity_recalculation(portal_name)
 
         @kopf.on.event(
             "workshopsessions.training.educates.dev",
@@ -491,7 +560,8 @@ class ClusterOperator(GenericOperator):
                             )
 
                             environment.remove_session(session_name)
-                            portal.recalculate_capacity()
+
+                            self.schedule_capacity_recalculation(portal_name)
 
                             if environment.phase == "Unknown" and not environment.get_sessions():
                                 logger.info(
@@ -610,6 +680,16 @@ class ClusterOperator(GenericOperator):
                             )
                         )
 
+                    elif (
+                        session_state.generation == xgetattr(metadata, "generation")
+                        and session_state.phase == xgetattr(status, "educates.phase")
+                        and session_state.user == xgetattr(status, "educates.user")
+                    ):
+                        # None of the fields we track for the workshop session
+                        # have changed so there is nothing to do.
+
+                        return
+
                     else:
                         logger.info(
                             "Updating workshop session %s for environment %s from portal %s of cluster %s, where user is %r",  # pylint: disable=line-too-long
@@ -624,7 +704,7 @@ class ClusterOperator(GenericOperator):
                         session_state.phase = xgetattr(status, "educates.phase")
                         session_state.user = xgetattr(status, "educates.user")
 
-                    portal.recalculate_capacity()
+                    self.schedule_capacity_recalculation(portal_name)
 
 
 @kopf.daemon(
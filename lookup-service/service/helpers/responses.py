@@ -0,0 +1,33 @@
+"""Helper functions for generating HTTP API responses."""
+
+import json
+from typing import Any
+
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def json_dumps(data: Any) -> bytes:
+    """Serializes the data as JSON and returns it encoded as UTF-8 bytes. The
+    orjson package is used if it is available as it is significantly faster
+    than the encoder from the Python standard library, falling back to the
+    standard library encoder otherwise."""
+
+    if orjson is not None:
+        return orjson.dumps(data)
+
+    return json.dumps(data, separators=(",", ":")).encode("UTF-8")
+
+
+def json_response(data: Any, *, status: int = 200) -> web.Response:
+    """Returns a HTTP response with the data serialized as JSON. This should be
+    used in place of the aiohttp json_response() function so that the faster
+    JSON encoder is used when available."""
+
+    return web.Response(
+        body=json_dumps(data), status=status, content_type="application/json"
+    )
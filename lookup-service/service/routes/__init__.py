@@ -2,12 +2,17 @@
 
 from aiohttp import web
 
-from . import authnz, clients, clusters, portals, tenants, workshops
+from . import authnz, clients, clusters, compression, portals, tenants, workshops
 
 
 def register_routes(app: web.Application) -> None:
     """Register the HTTP API routes with the application."""
 
+    # Register response compression middleware. This needs to be first so
+    # that it applies to responses generated by any of the other middleware.
+
+    app.middlewares.extend(compression.middlewares)
+
     # Register authentication and authorization middleware/routes.
 
     app.middlewares.extend(authnz.middlewares)
@@ -9,6 +9,7 @@ from aiohttp import web
 
 from ..config import jwt_token_secret
 from ..caches.clients import ClientConfig
+from ..helpers.responses import json_response
 
 TOKEN_EXPIRATION = 72  # Expiration in hours.
 
@@ -187,7 +188,7 @@ async def api_auth_login(request: web.Request) -> web.Response:
 
     token = generate_login_response(client)
 
-    return web.json_response(token)
+    return json_response(token)
 
 
 async def api_auth_logout(request: web.Request) -> web.Response:
@@ -220,7 +221,7 @@ async def api_auth_logout(request: web.Request) -> web.Response:
 
     client.revoke_tokens()
 
-    return web.json_response({})
+    return json_response({})
 
 # Set up the middleware and routes for the authentication and authorization.
 
@@ -230,5 +231,5 @@ routes = [
     web.post("/login", api_auth_login),
     web.post("/auth/login", api_auth_login),
     web.post("/auth/logout", api_auth_logout),
-    web.get("/auth/verify", login_required(lambda r: web.json_response({}))),
+    web.get("/auth/verify", login_required(lambda r: json_response({}))),
 ]
@@ -2,6 +2,7 @@
 
 from aiohttp import web
 
+from ..helpers.responses import json_response
 from .authnz import login_required, roles_accepted
 
 
@@ -20,7 +21,7 @@ async def api_get_v1_clients(request: web.Request) -> web.Response:
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -51,7 +52,7 @@ async def api_get_v1_clients_details(request: web.Request) -> web.Response:
         "tenants": client.tenants,
     }
 
-    return web.json_response(details)
+    return json_response(details)
 
 
 # Set up the routes for the client management API.
@@ -3,6 +3,7 @@
 import yaml
 from aiohttp import web
 
+from ..helpers.responses import json_response
 from .authnz import login_required, roles_accepted
 
 
@@ -21,7 +22,7 @@ async def api_get_v1_clusters(request: web.Request) -> web.Response:
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -44,7 +45,7 @@ async def api_get_v1_clusters_details(request: web.Request) -> web.Response:
         "labels": cluster.labels,
     }
 
-    return web.json_response(details)
+    return json_response(details)
 
 
 @login_required
@@ -99,7 +100,7 @@ async def api_get_v1_clusters_portals(request: web.Request) -> web.Response:
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -135,7 +136,7 @@ async def api_get_v1_clusters_portals_details(request: web.Request) -> web.Respo
         "phase": portal.phase,
     }
 
-    return web.json_response(details)
+    return json_response(details)
 
 
 @login_required
@@ -185,7 +186,7 @@ async def api_get_v1_clusters_portals_environments(
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -234,7 +235,7 @@ async def api_get_v1_clusters_portals_environments_details(
         "phase": environment.phase,
     }
 
-    return web.json_response(details)
+    return json_response(details)
 
 
 @login_required
@@ -284,7 +285,7 @@ async def api_get_v1_clusters_portals_environments_sessions(
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -326,7 +327,7 @@ async def api_get_v1_clusters_portals_environments_users(
 
     data = {"users": list(users)}
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -378,7 +379,7 @@ async def api_get_v1_clusters_portals_environments_users_sessions(
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 # Set up the routes for the cluster management API.
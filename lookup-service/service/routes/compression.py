@@ -0,0 +1,150 @@
+"""HTTP API middleware for compressing responses. The content encoding used is
+negotiated with the client using the Accept-Encoding request header, with
+brotli being preferred when the brotli package is available, and gzip used
+otherwise. Small responses are sent uncompressed as the overhead of compressing
+them outweighs any saving in bandwidth.
+"""
+
+import asyncio
+import gzip
+from typing import Callable, Dict
+
+from aiohttp import hdrs, web
+
+from ..config import (
+    RESPONSE_COMPRESSION_BROTLI_QUALITY,
+    RESPONSE_COMPRESSION_GZIP_LEVEL,
+    RESPONSE_COMPRESSION_THRESHOLD,
+)
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Size in bytes of a response body above which compression is done in a
+# separate thread so as not to block the event loop.
+
+EXECUTOR_COMPRESSION_THRESHOLD = 64 * 1024
+
+# Content types which are worth compressing.
+
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "text/plain")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse the Accept-Encoding request header and return a dictionary mapping
+    each content coding to the quality value given for it by the client."""
+
+    codings = {}
+
+    for item in header.split(","):
+        coding, *params = item.strip().split(";")
+        coding = coding.strip().lower()
+
+        if not coding:
+            continue
+
+        quality = 1.0
+
+        for param in params:
+            name, _, value = param.strip().partition("=")
+
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        codings[coding] = quality
+
+    return codings
+
+
+def select_content_coding(request: web.Request) -> str | None:
+    """Select the content coding to use for the response based on what the
+    client has said it will accept and what encoders are available."""
+
+    codings = parse_accept_encoding(request.headers.get(hdrs.ACCEPT_ENCODING, ""))
+
+    wildcard = codings.get("*", 0.0)
+
+    candidates = []
+
+    if brotli is not None:
+        candidates.append("br")
+
+    candidates.append("gzip")
+
+    for coding in candidates:
+        if codings.get(coding, wildcard) > 0.0:
+            return coding
+
+    return None
+
+
+def compress_body(body: bytes, coding: str) -> bytes:
+    """Compress the response body using the specified content coding."""
+
+    if coding == "br":
+        return brotli.compress(body, quality=RESPONSE_COMPRESSION_BROTLI_QUALITY)
+
+    return gzip.compress(body, compresslevel=RESPONSE_COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+@web.middleware
+async def compression_middleware(
+    request: web.Request, handler: Callable[..., web.Response]
+) -> web.Response:
+    """Compress the body of the response returned by the request handler if the
+    client accepts a supported content coding and the response is large enough
+    to warrant it."""
+
+    response = await handler(request)
+
+    # Only responses with a fully formed body can be compressed. Streamed
+    # responses and responses which have already been encoded are left alone.
+
+    if not isinstance(response, web.Response) or response.prepared:
+        return response
+
+    if hdrs.CONTENT_ENCODING in response.headers:
+        return response
+
+    if response.content_type not in COMPRESSIBLE_CONTENT_TYPES:
+        return response
+
+    body = response.body
+
+    if not isinstance(body, (bytes, bytearray)):
+        return response
+
+    # The response could have been compressed if it were larger, or if the
+    # client accepted a different encoding, so caches need to be told that the
+    # response varies based on what content coding the client accepts.
+
+    response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+
+    if len(body) < RESPONSE_COMPRESSION_THRESHOLD:
+        return response
+
+    coding = select_content_coding(request)
+
+    if coding is None:
+        return response
+
+    if len(body) >= EXECUTOR_COMPRESSION_THRESHOLD:
+        loop = asyncio.get_running_loop()
+        response.body = await loop.run_in_executor(None, compress_body, body, coding)
+
+    else:
+        response.body = compress_body(body, coding)
+
+    response.headers[hdrs.CONTENT_ENCODING] = coding
+
+    return response
+
+
+# Set up the middleware for compressing responses.
+
+middlewares = [compression_middleware]
@@ -2,6 +2,7 @@
 
 from aiohttp import web
 
+from ..helpers.responses import json_response
 from .authnz import login_required, roles_accepted
 
 
@@ -36,7 +37,7 @@ async def api_get_v1_portals(request: web.Request) -> web.Response:
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 # Set up the routes for the portal management API.
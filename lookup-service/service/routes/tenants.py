@@ -2,6 +2,7 @@
 
 from aiohttp import web
 
+from ..helpers.responses import json_response
 from .authnz import login_required, roles_accepted
 
 
@@ -34,7 +35,7 @@ async def api_get_v1_tenants(request: web.Request) -> web.Response:
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -58,7 +59,7 @@ async def api_get_v1_tenants_details(request: web.Request) -> web.Response:
         "clients": get_clients_mapped_to_tenant(client_database, tenant.name),
     }
 
-    return web.json_response(details)
+    return json_response(details)
 
 
 @login_required
@@ -117,7 +118,7 @@ async def api_get_v1_tenants_portals(request: web.Request) -> web.Response:
         ]
     }
 
-    return web.json_response(data)
+    return json_response(data)
 
 
 @login_required
@@ -169,7 +170,7 @@ async def api_get_v1_tenants_workshops(request: web.Request) -> web.Response:
                 "labels": environment.labels,
             }
 
-    return web.json_response({"workshops": list(workshops.values())})
+    return json_response({"workshops": list(workshops.values())})
 
 
 # Set up the routes for the tenant management API.
@@ -6,6 +6,7 @@ from typing import List
 from aiohttp import web
 
 from ..caches.environments import WorkshopEnvironment
+from ..helpers.responses import json_response
 from .authnz import login_required, roles_accepted
 
 logger = logging.getLogger("educates")
@@ -76,7 +77,7 @@ async def api_get_v1_workshops(request: web.Request) -> web.Response:
                 "labels": environment.labels,
             }
 
-    return web.json_response({"workshops": list(workshops.values())})
+    return json_response({"workshops": list(workshops.values())})
 
 
 @login_required
@@ -158,7 +159,7 @@ async def api_post_v1_workshops(request: web.Request) -> web.Response:
 
                     if data:
                         data["tenantName"] = tenant_name
-                        return web.json_response(data)
+                        return json_response(data)
 
     # Get the list of portals hosting the workshop and calculate the subset that
     # are accessible to the tenant.
@@ -233,7 +234,7 @@ async def api_post_v1_workshops(request: web.Request) -> web.Response:
 
         if data:
             data["tenantName"] = tenant_name
-            return web.json_response(data)
+            return json_response(data)
 
     # If we get here, then we don't believe there is any available capacity for
     # creating a workshop session.
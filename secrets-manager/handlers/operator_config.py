@@ -17,3 +17,9 @@ OPERATOR_NAMESPACE = lookup(config_values, "operator.namespace", "educates")
 if os.path.exists("/var/run/secrets/kubernetes.io/serviceaccount/namespace"):
     with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as fp:
         OPERATOR_NAMESPACE = fp.read().strip()
+
+KUBERNETES_API_QPS = lookup(config_values, "secretsManager.kubernetesAPI.qps", 50)
+KUBERNETES_API_BURST = lookup(config_values, "secretsManager.kubernetesAPI.burst", 100)
+KUBERNETES_API_POOL_SIZE = lookup(
+    config_values, "secretsManager.kubernetesAPI.poolSize", 32
+)
@@ -5,6 +5,7 @@ import logging
 import pykube
 
 from .helpers import lookup
+from .kubeclient import api
 
 
 logger = logging.getLogger("educates")
@@ -220,8 +221,6 @@ def reconcile_namespace(namespace_name, namespace_obj, configs):
 def reconcile_config(config_name, config_obj):
     """Perform reconciliation for the specified config."""
 
-    api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
     namespace_query = pykube.Namespace.objects(api)
 
     for namespace_item in namespace_query:
@@ -252,8 +251,6 @@ def reconcile_secret(secret_name, secret_namespace, secret_obj, configs):
 def update_secret(namespace_name, rule):
     """Updates a single secret in the specified namespace."""
 
-    api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
     owner_source = lookup(rule, "ownerSource")
     rule_number = lookup(rule, "ruleNumber")
 
@@ -4,6 +4,7 @@ import itertools
 import kopf
 import pykube
 
+from .kubeclient import api
 from .secretcopier_funcs import reconcile_namespace
 
 
@@ -28,8 +29,6 @@ def secretimporters_event(
 
     # Make sure the namespace still exists before proceeding.
 
-    api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
     try:
         namespace_item = pykube.Namespace.objects(api).get(name=namespace)
     except pykube.exceptions.ObjectDoesNotExist:
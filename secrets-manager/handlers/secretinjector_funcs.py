@@ -4,6 +4,7 @@ import logging
 import pykube
 
 from .helpers import lookup
+from .kubeclient import api
 
 logger = logging.getLogger("educates")
 
@@ -263,8 +264,6 @@ def matches_service_account(service_account_name, service_account_obj, rule):
 def reconcile_config(config_name, config_obj):
     """Perform reconciliation for the specified config."""
 
-    api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
     namespace_query = pykube.Namespace.objects(api)
 
     for namespace_item in namespace_query:
@@ -284,8 +283,6 @@ def reconcile_config(config_name, config_obj):
 def reconcile_secret(secret_name, namespace_name, secret_obj, configs):
     """Perform reconciliation for the specified secret."""
 
-    api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
     try:
         namespace_item = pykube.Namespace.objects(api).get(name=namespace_name)
     except pykube.exceptions.ObjectDoesNotExist as e:
@@ -319,8 +316,6 @@ def reconcile_service_account(
 ):
     """Perform reconciliation for the specified service account."""
 
-    api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
     try:
         namespace_item = pykube.Namespace.objects(api).get(name=namespace_name)
     except pykube.exceptions.ObjectDoesNotExist as e:
@@ -356,8 +351,6 @@ def reconcile_service_account(
 def reconcile_namespace(namespace_name, rule):
     """Applies the injection rule to the specified namespace."""
 
-    api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
     # Need to list the secrets in the namespace and see if any match the rule.
     # If they do, then we see if there is a service account that matches the
     # rule which the secret should be injected into.
@@ -69,6 +69,8 @@ from handlers import secretimporter
 from handlers import secretinjector
 from handlers import serviceaccount
 
+from handlers import kubeclient
+
 _event_loop = None  # pylint: disable=invalid-name
 
 _stop_flag = Event()
@@ -95,8 +97,7 @@ def login_fn(**kwargs):
 @kopf.on.probe(id="api")
 def check_api_access(**kwargs):
     try:
-        api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-        pykube.Namespace.objects(api).get(name="default")
+        pykube.Namespace.objects(kubeclient.api).get(name="default")
 
     except pykube.exceptions.KubernetesError:
         logger.error("Failed request to Kubernetes API.")
@@ -0,0 +1,144 @@
+"""Measures the cost of substituting session variables into workshop resources.
+
+For each Workshop resource found in the supplied YAML files, the variables
+for a workshop session are substituted into the workshop definition using
+the session manager's implementation, and using the previous implementation
+which called str.replace() for every variable. The time for the first
+session of a workshop environment, where the template cache is empty, is
+reported separately from the time for later sessions. The result of each
+implementation is checked to be the same.
+
+    python benchmark.py ../workshop-samples/*/resources/workshop.yaml
+"""
+
+import argparse
+import base64
+import copy
+import timeit
+
+from handlers.helpers import _compile_template, substitute_variables
+from render import load_workshops
+
+
+def replace_variables(obj, variables, encode=True, recurse=6):
+    # Previous implementation of substitute_variables(), kept as a reference.
+
+    if isinstance(obj, str):
+        original_obj = obj
+        for _ in range(recurse):
+            if "$(" not in obj:
+                break
+            for k, v in variables.items():
+                obj = obj.replace(f"$({k})", v)
+            if obj == original_obj:
+                break
+        if encode and obj.startswith("$(base64(") and obj.endswith("))"):
+            obj = base64.b64encode(obj[9:-2].encode("utf-8")).decode("ascii").strip()
+        return obj
+    elif isinstance(obj, dict):
+        return {k: replace_variables(v, variables, encode, recurse) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [replace_variables(v, variables, encode, recurse) for v in obj]
+    else:
+        return obj
+
+
+def session_variables(workshop, count):
+    # The names match those of the variables available to a workshop session,
+    # padded out with extra data variables to the requested count.
+
+    workshop_name = workshop["metadata"]["name"]
+    environment_name = f"{workshop_name}-w01"
+    session_namespace = f"{environment_name}-s001"
+
+    variables = dict(
+        platform_arch="amd64",
+        image_repository="registry.default.svc.cluster.local",
+        workshop_name=workshop_name,
+        environment_name=environment_name,
+        workshop_namespace=environment_name,
+        session_id="s001",
+        session_name=session_namespace,
+        session_namespace=session_namespace,
+        session_hostname=f"{session_namespace}.educates.example.com",
+        session_url=f"https://{session_namespace}.educates.example.com",
+        service_account=f"{environment_name}-session",
+        cluster_domain="cluster.local",
+        ingress_domain="educates.example.com",
+        ingress_protocol="https",
+        ingress_port="443",
+        ingress_port_suffix="",
+        ingress_secret="educates.example.com-tls",
+        ingress_class="",
+        storage_class="",
+        registry_host=f"registry-{session_namespace}.educates.example.com",
+        registry_username=session_namespace,
+        registry_password="password",
+        registry_secret=f"{session_namespace}-registry-credentials",
+        ssh_private_key="private-key",
+        ssh_public_key="public-key",
+        ssh_keys_secret=f"{session_namespace}-ssh-keys",
+        config_password="password",
+        services_password="password",
+        workshop_image="workshop-image",
+        workshop_image_pull_policy="IfNotPresent",
+        vcluster_namespace=f"{session_namespace}-vc",
+    )
+
+    for index in range(len(variables), count):
+        variables[f"data_variable_{index}"] = f"value-{index}"
+
+    return variables
+
+
+def best_of(func, repeat):
+    # Returns the best time in milliseconds for a single call of the function.
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark substitution of session variables."
+    )
+
+    parser.add_argument("files", nargs="+", help="YAML files with workshops")
+    parser.add_argument(
+        "--variables", type=int, default=50, help="number of session variables"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats")
+
+    args = parser.parse_args()
+
+    for workshop in load_workshops(args.files):
+        name = workshop["metadata"]["name"]
+        spec = copy.deepcopy(workshop["spec"])
+        variables = session_variables(workshop, args.variables)
+
+        assert substitute_variables(spec, variables) == replace_variables(
+            spec, variables
+        ), name
+
+        def first_session():
+            _compile_template.cache_clear()
+            substitute_variables(spec, variables)
+
+        reference = best_of(lambda: replace_variables(spec, variables), args.repeat)
+        cold = best_of(first_session, args.repeat)
+
+        substitute_variables(spec, variables)
+
+        warm = best_of(lambda: substitute_variables(spec, variables), args.repeat)
+
+        print(
+            f"workshop={name} variables={len(variables)} "
+            f"replace={reference:.3f}ms first={cold:.3f}ms later={warm:.3f}ms "
+            f"speedup={reference / warm:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
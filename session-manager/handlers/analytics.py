@@ -1,10 +1,21 @@
+import os
+import json
+import time
+import queue
+import atexit
 import logging
+import threading
 
 import requests
 
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
-from .operator_config import ANALYTICS_WEBHOOK_URL
+from .operator_config import (
+    ANALYTICS_WEBHOOK_URL,
+    ANALYTICS_WEBHOOK_QUEUE_SIZE,
+    ANALYTICS_WEBHOOK_SPOOL_DIRECTORY,
+)
 
 
 logger = logging.getLogger("educates")
@@ -16,11 +27,225 @@ def current_time():
     return tz_dt.isoformat()
 
 
-def send_event_to_webhook(url, message):
-    try:
-        requests.post(url, json=message, timeout=2.5)
-    except Exception:
-        logging.exception("Unable to report event to %s: %s", url, message)
+class AnalyticsEmitter:
+    """Delivers analytics events to a webhook from a background thread so that
+    reporting an event never blocks the handler which reports it. Events are
+    held in a bounded queue and taken from it in batches, but as the webhook
+    accepts a single event per request, each event in a batch is posted in
+    turn over a keep-alive connection and retried with backoff if delivery
+    fails or is throttled. If a spool directory is configured, events which
+    could not be queued or delivered are saved to disk and delivered later,
+    otherwise they are logged and discarded. Events which the webhook rejects
+    as invalid are logged and discarded without being retried."""
+
+    batch_size = 50
+
+    retry_delays = (1, 2, 4)
+
+    max_retry_after = 60
+
+    def __init__(self, url, queue_size, spool_directory):
+        self.url = url
+        self.spool_directory = spool_directory
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._spool_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._session = None
+        self._thread = None
+
+    @property
+    def spool_file(self):
+        return os.path.join(self.spool_directory, "analytics-events.jsonl")
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def emit(self, message):
+        """Queues the message for delivery to the webhook."""
+
+        self._start()
+
+        try:
+            self._queue.put_nowait(message)
+
+        except queue.Full:
+            logger.warning("Analytics event queue is full, spooling event.")
+
+            self._spool([message])
+
+    def _spool(self, messages):
+        if not self.spool_directory:
+            for message in messages:
+                logger.error("Discarding analytics event %s.", message)
+
+            return
+
+        with self._spool_lock:
+            try:
+                os.makedirs(self.spool_directory, exist_ok=True)
+
+                with open(self.spool_file, "a", encoding="utf-8") as fp:
+                    for message in messages:
+                        fp.write(json.dumps(message) + "\n")
+
+            except (OSError, TypeError, ValueError):
+                logger.exception("Unable to spool analytics events to disk.")
+
+    def _unspool(self):
+        if not self.spool_directory:
+            return []
+
+        with self._spool_lock:
+            try:
+                with open(self.spool_file, encoding="utf-8") as fp:
+                    lines = fp.readlines()
+
+                os.unlink(self.spool_file)
+
+            except FileNotFoundError:
+                return []
+
+            except OSError:
+                logger.exception("Unable to read spooled analytics events.")
+
+                return []
+
+        messages = []
+
+        for line in lines:
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                logger.warning("Discarding corrupt spooled analytics event.")
+
+        return messages
+
+    def _retry_after(self, response, delay):
+        # A webhook which is throttling requests can say how long to wait
+        # before retrying, either in seconds or as a date. The wait is capped
+        # so a bad value can't stall delivery of other events indefinitely.
+
+        value = response.headers.get("Retry-After", "").strip()
+
+        if not value:
+            return delay
+
+        try:
+            wait = float(value)
+
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return delay
+
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+
+            wait = (when - datetime.now(timezone.utc)).total_seconds()
+
+        return min(max(wait, 0), self.max_retry_after)
+
+    def _deliver(self, message):
+        for delay in self.retry_delays + (None,):
+            try:
+                response = self._session.post(self.url, json=message, timeout=2.5)
+
+                if 200 <= response.status_code < 300:
+                    return True
+
+                if response.status_code in (408, 429):
+                    if delay is not None:
+                        delay = self._retry_after(response, delay)
+
+                elif response.status_code < 500:
+                    # The webhook rejected the event, so sending it again
+                    # isn't going to help.
+
+                    logger.error(
+                        "Analytics event rejected by %s with status %s: %s",
+                        self.url,
+                        response.status_code,
+                        message,
+                    )
+
+                    return True
+
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+            if delay is not None:
+                time.sleep(delay)
+
+        logger.error("Unable to report event to %s: %s", self.url, message)
+
+        return False
+
+    def _deliver_batch(self, messages):
+        # Each event is tried independently so that one event the webhook
+        # fails on doesn't prevent delivery of the rest of the batch. Only
+        # the events which could not be delivered are spooled.
+
+        failed = [message for message in messages if not self._deliver(message)]
+
+        if failed:
+            self._spool(failed)
+
+        return not failed
+
+    def _run(self):
+        self._session = requests.Session()
+
+        # Start out by delivering any events which were spooled by a prior
+        # instance of the operator.
+
+        self._deliver_batch(self._unspool())
+
+        while True:
+            messages = [self._queue.get()]
+
+            while len(messages) < self.batch_size:
+                try:
+                    messages.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # When events are delivered successfully, we also try and deliver
+            # any events which were previously spooled.
+
+            if self._deliver_batch(messages):
+                self._deliver_batch(self._unspool())
+
+    def flush(self):
+        """Spools any events which have not yet been delivered. This is called
+        when the process exits so that queued events aren't lost."""
+
+        messages = []
+
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if messages:
+            self._spool(messages)
+
+
+analytics_emitter = None
+
+if ANALYTICS_WEBHOOK_URL:
+    analytics_emitter = AnalyticsEmitter(
+        ANALYTICS_WEBHOOK_URL,
+        ANALYTICS_WEBHOOK_QUEUE_SIZE,
+        ANALYTICS_WEBHOOK_SPOOL_DIRECTORY,
+    )
+
+    atexit.register(analytics_emitter.flush)
 
 
 def report_analytics_event(event, data={}):
@@ -34,7 +259,7 @@ def report_analytics_event(event, data={}):
 
     logger.debug("Reporting analytics event %s as message %s.", event, message)
 
-    if not ANALYTICS_WEBHOOK_URL:
+    if not analytics_emitter:
         return
 
-    send_event_to_webhook(ANALYTICS_WEBHOOK_URL, message)
+    analytics_emitter.emit(message)
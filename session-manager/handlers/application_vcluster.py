@@ -1,7 +1,14 @@
 import os
+import copy
+import functools
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
 from .helpers import xget
 
 from .operator_config import (
@@ -15,6 +22,8 @@ from .operator_config import (
 
 K8S_DEFAULT_VERSION = "1.33"
 
+VCLUSTER_INSTANCE_LABEL = "training.educates.dev/vcluster.instance"
+
 K8S_VERSIONS = {
     "1.31": LOFTSH_KUBERNETES_V1_31_IMAGE,
     "1.32": LOFTSH_KUBERNETES_V1_32_IMAGE,
@@ -57,10 +66,118 @@ def vcluster_environment_objects_list(workshop_spec, application_properties):
     return []
 
 
-def vcluster_session_objects_list(workshop_spec, application_properties):
-    def relpath(*paths):
-        return os.path.join(os.path.dirname(__file__), *paths)
+def _relpath(*paths):
+    return os.path.join(os.path.dirname(__file__), *paths)
+
+
+def _load_yaml_documents(path):
+    with open(_relpath(path), encoding="utf-8") as f:
+        return list(yaml.load_all(f, Loader=SafeLoader))
+
+
+@functools.lru_cache(maxsize=None)
+def _contour_objects():
+    """Returns the Contour resource objects used when an ingress controller is
+    enabled for a vcluster. These are parsed from the bundled manifests the
+    first time they are required and the same list is returned thereafter, so
+    the objects must not be modified by the caller."""
+
+    # We need to read the Contour resources objects from files stored in the
+    # "../packages/contour/upstream" directory relative to this source file.
+    # We ignore "02-service-envoy.yaml" as we need to replace it with a
+    # version which exposes the service as a ClusterIP instead of a
+    # LoadBalancer.
+
+    contour_objects = []
+
+    for name in (
+        "00-common.yaml",
+        "01-contour-config.yaml",
+        "01-crds.yaml",
+        "02-job-certgen.yaml",
+        "02-role-contour.yaml",
+        "02-rbac.yaml",
+        "02-service-contour.yaml",
+    ):
+        contour_objects.extend(
+            _load_yaml_documents(f"../packages/contour/upstream/{name}")
+        )
+
+    for obj in _load_yaml_documents("../packages/contour/upstream/03-contour.yaml"):
+        if obj.get("kind") == "Deployment":
+            obj["spec"]["replicas"] = 1
+
+        contour_objects.append(obj)
+
+    # For the case of the envoy DaemonSet, we need to remove the hostPort
+    # properties from the container port definitions, as we do not allow
+    # hostPort and do not need it since we will proxy to the envoy service as
+    # a ClusterIP.
+
+    for obj in _load_yaml_documents("../packages/contour/upstream/03-envoy.yaml"):
+        if obj.get("kind") == "DaemonSet":
+            for container in obj["spec"]["template"]["spec"]["containers"]:
+                for port in container.get("ports", []):
+                    port.pop("hostPort", None)
+
+        contour_objects.append(obj)
+
+    return tuple(contour_objects)
+
+
+@functools.lru_cache(maxsize=None)
+def _contour_manifests():
+    """Returns the Contour resource objects serialized as YAML for deployment
+    within a vcluster. This includes a Contour service which uses a ClusterIP
+    instead of a LoadBalancer. This is generated the first time it is required
+    and the same string is returned thereafter."""
+
+    contour_service = {
+        "apiVersion": "v1",
+        "kind": "Service",
+        "metadata": {
+            "name": "envoy",
+            "namespace": "projectcontour",
+        },
+        "spec": {
+            "type": "ClusterIP",
+            "ports": [
+                {
+                    "name": "http",
+                    "port": 80,
+                    "protocol": "TCP",
+                    "targetPort": 8080,
+                },
+                {
+                    "name": "https",
+                    "port": 443,
+                    "protocol": "TCP",
+                    "targetPort": 8443,
+                },
+            ],
+            "selector": {
+                "app": "envoy",
+            },
+        },
+    }
+
+    return yaml.dump_all(
+        list(_contour_objects()) + [contour_service], Dumper=SafeDumper
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _vcluster_config():
+    """Returns the reference vcluster configuration. This is parsed the first
+    time it is required and must be copied before being customized."""
 
+    with open(
+        _relpath("../packages/vcluster/vcluster-all-config.yaml"), encoding="utf-8"
+    ) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def vcluster_session_objects_list(workshop_spec, application_properties):
     syncer_memory = xget(application_properties, "resources.syncer.memory", "1Gi")
     syncer_storage = xget(application_properties, "resources.syncer.storage", "5Gi")
 
@@ -76,136 +193,28 @@ def vcluster_session_objects_list(workshop_spec, application_properties):
     ingress_subdomains = xget(application_properties, "ingress.subdomains", [])
     ingress_subdomains = sorted(ingress_subdomains + ["default"])
 
-    map_services_from_virtual = xget(application_properties, "services.fromVirtual", [])
-    map_services_from_host = xget(application_properties, "services.fromHost", [])
+    map_services_from_virtual = list(
+        xget(application_properties, "services.fromVirtual", [])
+    )
+    map_services_from_host = list(xget(application_properties, "services.fromHost", []))
 
     if ingress_enabled:
         sync_ingress_resources = False
     else:
         sync_ingress_resources = True
 
-    vcluster_objects = xget(application_properties, "objects", [])
+    vcluster_objects = list(xget(application_properties, "objects", []))
+
+    contour_manifests = ""
 
     # If ingress controller is enabled for vcluster, add Contour objects
 
     if ingress_enabled:
-        # We need to read the Contour resources objects from files stored in
-        # the "../packages/contour/upstream" directory relative to this source
-        # file, and add them to the vcluster objects list. The files are:
-        #
-        #   00-common.yaml
-        #   01-contour-config.yaml
-        #   01-crds.yaml
-        #   02-job-certgen.yaml
-        #   02-role-contour.yaml
-        #   02-rbac.yaml
-        #   02-service-contour.yaml
-        #   03-contour.yaml
-        #   03-envoy.yaml
-        #
-        # We ignore "02-service-envoy.yaml" as we need to replace it with a
-        # version which exposes the service as a ClusterIP instead of a
-        # LoadBalancer.
-
-        contour_objects = []
-
-        with open(
-            relpath("../packages/contour/upstream/00-common.yaml"), encoding="utf-8"
-        ) as f:
-            contour_objects.extend(yaml.safe_load_all(f))
-
-        with open(
-            relpath("../packages/contour/upstream/01-contour-config.yaml"),
-            encoding="utf-8",
-        ) as f:
-            contour_objects.extend(yaml.safe_load_all(f))
-
-        with open(
-            relpath("../packages/contour/upstream/01-crds.yaml"), encoding="utf-8"
-        ) as f:
-            contour_objects.extend(yaml.safe_load_all(f))
-
-        with open(
-            relpath("../packages/contour/upstream/02-job-certgen.yaml"),
-            encoding="utf-8",
-        ) as f:
-            contour_objects.extend(yaml.safe_load_all(f))
-
-        with open(
-            relpath("../packages/contour/upstream/02-role-contour.yaml"), encoding="utf-8"
-        ) as f:
-            contour_objects.extend(yaml.safe_load_all(f))
-
-        with open(
-            relpath("../packages/contour/upstream/02-rbac.yaml"), encoding="utf-8"
-        ) as f:
-            contour_objects.extend(yaml.safe_load_all(f))
-
-        with open(
-            relpath("../packages/contour/upstream/02-service-contour.yaml"),
-            encoding="utf-8",
-        ) as f:
-            contour_objects.extend(yaml.safe_load_all(f))
-
-        with open(
-            relpath("../packages/contour/upstream/03-contour.yaml"), encoding="utf-8"
-        ) as f:
-            for obj in yaml.safe_load_all(f):
-                if obj.get("kind") == "Deployment":
-                    obj["spec"]["replicas"] = 1
-
-                contour_objects.append(obj)
-
-        with open(
-            relpath("../packages/contour/upstream/03-envoy.yaml"), encoding="utf-8"
-        ) as f:
-            # For the case of the envoy DaemonSet, we need to remove the
-            # hostPort properties from the container port definitions, as
-            # we do not allow hostPort and do not need it since we will proxy
-            # to the envoy service as a ClusterIP.
-
-            for obj in yaml.safe_load_all(f):
-                if obj.get("kind") == "DaemonSet":
-                    for container in obj["spec"]["template"]["spec"]["containers"]:
-                        for port in container.get("ports", []):
-                            port.pop("hostPort", None)
-
-                contour_objects.append(obj)
-
-        vcluster_objects.extend(contour_objects)
-
-        # Add the Contour service with a ClusterIP instead of a LoadBalancer
-
-        contour_service = {
-            "apiVersion": "v1",
-            "kind": "Service",
-            "metadata": {
-                "name": "envoy",
-                "namespace": "projectcontour",
-            },
-            "spec": {
-                "type": "ClusterIP",
-                "ports": [
-                    {
-                        "name": "http",
-                        "port": 80,
-                        "protocol": "TCP",
-                        "targetPort": 8080,
-                    },
-                    {
-                        "name": "https",
-                        "port": 443,
-                        "protocol": "TCP",
-                        "targetPort": 8443,
-                    },
-                ],
-                "selector": {
-                    "app": "envoy",
-                },
-            },
-        }
+        # The Contour resource objects are the same for every workshop
+        # session, so are serialized only once and appended as is to the
+        # manifests for any other objects.
 
-        vcluster_objects.append(contour_service)
+        contour_manifests = _contour_manifests()
 
         # Now need to tell vcluster to map the envoy service from the internal
         # projectcontour namespace to the external namespace for the sessions
@@ -219,10 +228,7 @@ def vcluster_session_objects_list(workshop_spec, application_properties):
         )
 
     # Load vcluster.yaml configuration - Load reference config verbatim and customize for Educates
-    with open(
-        relpath("../packages/vcluster/vcluster-all-config.yaml"), encoding="utf-8"
-    ) as f:
-        vcluster_config = yaml.safe_load(f)
+    vcluster_config = copy.deepcopy(_vcluster_config())
 
     #
     # CONFIGURATION CUSTOMIZATION
@@ -284,7 +290,16 @@ def vcluster_session_objects_list(workshop_spec, application_properties):
 
     # TODO: Work integration with cert-manager
 
-    vcluster_config["experimental"]["deploy"]["vcluster"]["manifests"] = yaml.dump_all(vcluster_objects, Dumper=yaml.Dumper)
+    vcluster_manifests = "---\n".join(
+        manifests
+        for manifests in (
+            yaml.dump_all(vcluster_objects, Dumper=SafeDumper),
+            contour_manifests,
+        )
+        if manifests
+    )
+
+    vcluster_config["experimental"]["deploy"]["vcluster"]["manifests"] = vcluster_manifests
 
     # Definition of vcluster objects:
     # - Namespace for vcluster
@@ -355,7 +370,7 @@ def vcluster_session_objects_list(workshop_spec, application_properties):
                 "namespace": "$(session_namespace)-vc",
             },
             "stringData": {
-                "config.yaml": yaml.dump(vcluster_config),
+                "config.yaml": yaml.dump(vcluster_config, Dumper=SafeDumper),
             },
         },
         {
@@ -764,6 +779,21 @@ def vcluster_session_objects_list(workshop_spec, application_properties):
         },
     ]
 
+    # Mark the objects which make up the virtual cluster itself, as distinct
+    # from those which bind it to the workshop session, so that the virtual
+    # cluster can be created in advance when the primary namespace for the
+    # workshop session is provisioned.
+
+    for object_body in objects:
+        if object_body["kind"] in (
+            "Namespace",
+            "ClusterRole",
+            "ClusterRoleBinding",
+        ) or object_body["metadata"].get("namespace") == "$(session_namespace)-vc":
+            object_body["metadata"].setdefault("labels", {})[
+                VCLUSTER_INSTANCE_LABEL
+            ] = "true"
+
     if ingress_enabled:
         ingress_body = {
             "apiVersion": "networking.k8s.io/v1",
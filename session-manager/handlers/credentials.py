@@ -0,0 +1,175 @@
+import queue
+import random
+import string
+import time
+import logging
+import threading
+
+import datetime
+
+import bcrypt
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+from .operator_config import CREDENTIALS_POOL_DEPTH, SSH_KEY_TYPE
+
+logger = logging.getLogger("educates")
+
+
+def generate_ssh_keypair():
+    """Generates a SSH key pair, returning the private key in PEM format and
+    the public key in OpenSSH format. The type of key generated is determined
+    by the operator configuration, with RSA being the default. Ed25519 keys are
+    much faster to generate but may not be supported by all SSH servers."""
+
+    if SSH_KEY_TYPE == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+
+        private_key_format = serialization.PrivateFormat.OpenSSH
+
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+        private_key_format = serialization.PrivateFormat.TraditionalOpenSSL
+
+    private_key_bytes = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=private_key_format,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+    public_key_bytes = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.OpenSSH,
+        format=serialization.PublicFormat.OpenSSH,
+    )
+
+    return private_key_bytes.decode("utf-8"), public_key_bytes.decode("utf-8")
+
+
+def generate_registry_credentials():
+    """Generates a random password for an image registry along with the bcrypt
+    hash of the password as required for the registry htpasswd file."""
+
+    characters = string.ascii_letters + string.digits
+
+    password = "".join(random.sample(characters, 32))
+
+    password_hash = bcrypt.hashpw(
+        bytes(password, "ascii"), bcrypt.gensalt(prefix=b"2a")
+    ).decode("ascii")
+
+    return password, password_hash
+
+
+def generate_token_certificate(common_name):
+    """Generates a RSA key along with a self signed certificate for it, for
+    signing and verifying tokens issued for an image registry. The private key
+    and certificate are returned in PEM format."""
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=3650))
+        .sign(private_key, hashes.SHA256())
+    )
+
+    private_key_bytes = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+    certificate_bytes = certificate.public_bytes(serialization.Encoding.PEM)
+
+    return private_key_bytes.decode("utf-8"), certificate_bytes.decode("utf-8")
+
+
+class CredentialsPool:
+    """Pool of pre-generated credentials. The pool is filled by a background
+    thread the first time credentials are requested, so that the expense of
+    generating them is not incurred by the handler which needs them. If the
+    pool is empty, credentials are generated on demand instead."""
+
+    def __init__(self, name, factory, depth):
+        self.name = name
+        self.factory = factory
+        self.depth = depth
+
+        self._queue = queue.Queue(maxsize=max(1, depth))
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _fill(self):
+        # Failures to generate credentials are retried with an increasing
+        # delay, as the thread must keep running for the pool to be refilled.
+        # Handlers fall back to generating credentials on demand meanwhile.
+
+        delay = 1
+
+        while True:
+            try:
+                item = self.factory()
+
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(
+                    "Unable to generate %s for pool, retrying in %d seconds.",
+                    self.name,
+                    delay,
+                )
+
+                time.sleep(delay)
+
+                delay = min(delay * 2, 60)
+
+                continue
+
+            delay = 1
+
+            self._queue.put(item)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                logger.info(
+                    "Starting pool of %s with depth %d.", self.name, self.depth
+                )
+
+                self._thread = threading.Thread(target=self._fill, daemon=True)
+                self._thread.start()
+
+    def take(self):
+        """Returns a set of credentials from the pool, or generates them on
+        demand if the pool has been disabled or is currently empty."""
+
+        if self.depth <= 0:
+            return self.factory()
+
+        self._start()
+
+        try:
+            return self._queue.get_nowait()
+
+        except queue.Empty:
+            return self.factory()
+
+
+ssh_keypair_pool = CredentialsPool(
+    "SSH key pairs", generate_ssh_keypair, CREDENTIALS_POOL_DEPTH
+)
+
+registry_credentials_pool = CredentialsPool(
+    "registry credentials", generate_registry_credentials, CREDENTIALS_POOL_DEPTH
+)
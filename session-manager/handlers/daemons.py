@@ -1,19 +1,41 @@
+import re
+import time
 import logging
 import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 import pykube
 
 from datetime import datetime, timedelta, timezone
-from functools import lru_cache
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
+from .kubeclient import api
+from .hibernation import hibernate_idle_sessions
+from .shared_registry import reconcile_shared_registry_users
+from .sharding import labels_are_local, portal_labels_are_local
+from .operator_config import SESSION_HIBERNATION_IDLE_TIMEOUT
 
 _polling_interval = 60
 _resource_timeout = 90
+_discovery_interval = 300
+_purge_concurrency = 8
 
 logger = logging.getLogger("educates")
 
 
+def _namespace_is_local(labels):
+    # When running multiple replicas of the operator, each replica purges the
+    # namespaces belonging to the shard it handles. Namespaces for a workshop
+    # environment or workshop session follow the shard of the environment,
+    # with any other namespaces following the shard of the training portal.
+
+    if "training.educates.dev/environment.name" in labels:
+        return labels_are_local(labels)
+
+    return portal_labels_are_local(labels)
+
+
 def get_overdue_terminating_namespaces(timeout=_resource_timeout):
     label_set = [
         "training.educates.dev/component",
@@ -25,13 +47,16 @@ def get_overdue_terminating_namespaces(timeout=_resource_timeout):
     now = datetime.now(timezone.utc)
 
     for namespace_item in pykube.Namespace.objects(api).filter(selector=selector):
+        if not _namespace_is_local(namespace_item.labels):
+            continue
+
         if namespace_item.obj["status"]["phase"] == "Terminating":
             if namespace_item.metadata.get("deletionTimestamp"):
                 timestamp = namespace_item.metadata["deletionTimestamp"]
                 when = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z")
 
                 if now - when > timedelta(seconds=timeout):
-                    yield namespace_item.name
+                    yield namespace_item
 
 
 def api_groups():
@@ -51,8 +76,7 @@ def get_all_api_versions():
             yield version["groupVersion"]
 
 
-@lru_cache(1)
-def get_all_namespaced_resources():
+def discover_namespaced_resources():
     resource_objects = {}
 
     for api_version in get_all_api_versions():
@@ -71,6 +95,8 @@ def get_all_namespaced_resources():
 
         api_version = resources["groupVersion"]
 
+        group = api_version.rpartition("/")[0]
+
         for resource in resources["resources"]:
             if (
                 resource["namespaced"]
@@ -79,36 +105,171 @@ def get_all_namespaced_resources():
             ):
                 kind = resource["kind"]
                 resource_type = pykube.object_factory(api, api_version, kind)
-                resource_objects[(api_version, kind)] = resource_type
+
+                # Resources are keyed using the same "resource.group" form the
+                # namespace controller uses when reporting remaining content.
+                # Where a group serves multiple versions, the preferred
+                # version, which is listed first, is used.
+
+                name = f"{resource['name']}.{group}" if group else resource["name"]
+
+                resource_objects.setdefault(name, resource_type)
 
     return resource_objects
 
 
-def purge_terminated_resources(namespace):
-    logger.info(f"Attempting to purge namespace {namespace}.")
-    for resource_type in get_all_namespaced_resources().values():
-        for resource in resource_type.objects(api, namespace=namespace).all():
-            if resource.metadata.get("deletionTimestamp"):
-                if resource.metadata.get("finalizers"):
-                    try:
-                        logger.info(f"Forcibly deleting finalizers on {resource.obj}.")
-                        resource.metadata["finalizers"] = None
-                        resource.update()
-                    except pykube.exceptions.KubernetesError as exc:
-                        if exc.code != 404:
-                            logger.error(
-                                f"Could not delete finalizers on {resource.obj}."
-                            )
+_discovery_lock = threading.Lock()
+_discovery_cache = None
+_discovery_time = 0.0
+
+
+def get_all_namespaced_resources():
+    """Returns the namespaced resource types known to the cluster. The results
+    of API discovery are cached, but are refreshed periodically so that
+    resource types for custom resource definitions added later are seen."""
+
+    global _discovery_cache, _discovery_time  # pylint: disable=global-statement
+
+    with _discovery_lock:
+        if (
+            _discovery_cache is None
+            or time.monotonic() - _discovery_time > _discovery_interval
+        ):
+            _discovery_cache = discover_namespaced_resources()
+            _discovery_time = time.monotonic()
+
+        return _discovery_cache
+
+
+_remaining_content_pattern = re.compile(r"([^\s,]+) has \d+ resource instances")
+
+
+def get_remaining_resource_types(namespace_item):
+    """Returns the resource types which still have instances in a terminating
+    namespace, as reported in the namespace conditions by the namespace
+    controller. If the namespace controller hasn't reported what content is
+    remaining then all namespaced resource types are returned."""
+
+    resources = get_all_namespaced_resources()
+
+    for condition in namespace_item.obj["status"].get("conditions", []):
+        if (
+            condition.get("type") == "NamespaceContentRemaining"
+            and condition.get("status") == "True"
+        ):
+            message = condition.get("message", "")
+
+            names = [
+                name.rstrip(".")
+                for name in _remaining_content_pattern.findall(message)
+            ]
+
+            resource_types = [resources[name] for name in names if name in resources]
+
+            if resource_types:
+                return resource_types
+
+    return list(resources.values())
+
+
+def purge_terminated_resources(namespace, resource_type):
+    for resource in resource_type.objects(api, namespace=namespace).all():
+        if resource.metadata.get("deletionTimestamp"):
+            if resource.metadata.get("finalizers"):
+                try:
+                    logger.info(f"Forcibly deleting finalizers on {resource.obj}.")
+                    resource.metadata["finalizers"] = None
+                    resource.update()
+                except pykube.exceptions.KubernetesError as exc:
+                    if exc.code != 404:
+                        logger.error(f"Could not delete finalizers on {resource.obj}.")
+
+
+def purge_overdue_namespaces():
+    """Purges any resources with finalizers which are blocking deletion of
+    namespaces which have been terminating for too long. The resource types
+    for each namespace are queried in parallel."""
+
+    tasks = []
+
+    for namespace_item in get_overdue_terminating_namespaces():
+        logger.info(f"Attempting to purge namespace {namespace_item.name}.")
+
+        for resource_type in get_remaining_resource_types(namespace_item):
+            tasks.append((namespace_item.name, resource_type))
+
+    if not tasks:
+        return
+
+    with ThreadPoolExecutor(max_workers=_purge_concurrency) as executor:
+        futures = [
+            executor.submit(purge_terminated_resources, namespace, resource_type)
+            for namespace, resource_type in tasks
+        ]
+
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Unexpected error occurred when purging namespace.")
 
 
 async def purge_namespaces():
+    loop = asyncio.get_running_loop()
+
     while True:
         try:
             logger.debug("Checking whether namespaces need purging.")
-            for namespace in get_overdue_terminating_namespaces():
-                purge_terminated_resources(namespace)
+
+            # Purging runs in a separate thread as it makes blocking calls
+            # against the Kubernetes REST API, which would otherwise stall
+            # the kopf event loop.
+
+            await loop.run_in_executor(None, purge_overdue_namespaces)
 
         except Exception:
             logger.exception("Unexpected error occurred when purging namespaces.")
 
         await asyncio.sleep(_polling_interval)
+
+
+async def hibernate_sessions():
+    # Workshop sessions are only hibernated when an idle timeout is set. Each
+    # replica of the operator checks the workshop sessions in its own shard.
+
+    if not SESSION_HIBERNATION_IDLE_TIMEOUT:
+        return
+
+    loop = asyncio.get_running_loop()
+
+    while True:
+        try:
+            logger.debug("Checking whether workshop sessions need hibernating.")
+
+            await loop.run_in_executor(None, hibernate_idle_sessions)
+
+        except Exception:
+            logger.exception("Unexpected error occurred when hibernating sessions.")
+
+        await asyncio.sleep(_polling_interval)
+
+
+async def reconcile_registry_users():
+    # Credentials for workshop sessions are removed from shared image
+    # registries when the workshop session is deleted, but the event can be
+    # missed if the operator isn't running at the time.
+
+    loop = asyncio.get_running_loop()
+
+    while True:
+        try:
+            logger.debug("Checking for stale shared image registry users.")
+
+            await loop.run_in_executor(None, reconcile_shared_registry_users)
+
+        except Exception:
+            logger.exception(
+                "Unexpected error occurred when reconciling registry users."
+            )
+
+        await asyncio.sleep(_polling_interval)
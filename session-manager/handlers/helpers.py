@@ -1,4 +1,6 @@
+import re
 import base64
+import functools
 
 def xget(obj, key, default=None):
     """Looks up a property within an object using a dotted path as key.
@@ -50,16 +52,43 @@ def resource_owned_by(child, parent):
     return False
 
 
+# Pattern matching a variable reference of the form "$(name)". The name can't
+# itself contain brackets so that "$(base64(...))" isn't matched, but any
+# variable references nested inside of it are.
+
+_variable_pattern = re.compile(r"\$\(([^$()]+)\)")
+
+
+@functools.lru_cache(maxsize=4096)
+def _compile_template(template):
+    """Splits a string into a tuple of alternating literal text and variable
+    names. The result is cached as the same templates from a workshop
+    definition are used for every workshop session."""
+
+    return tuple(_variable_pattern.split(template))
+
+
+def _render_template(tokens, variables):
+    parts = list(tokens)
+
+    for i in range(1, len(parts), 2):
+        value = variables.get(parts[i])
+        parts[i] = f"$({parts[i]})" if value is None else value
+
+    return "".join(parts)
+
+
 def substitute_variables(obj, variables, encode=True, recurse=6):
     if isinstance(obj, str):
-        original_obj = obj
+        tokens = _compile_template(obj) if "$(" in obj else None
         for _ in range(recurse):
-            if "$(" not in obj:
+            if not tokens or len(tokens) == 1:
                 break
-            for k, v in variables.items():
-                obj = obj.replace(f"$({k})", v)
-            if obj == original_obj:
+            result = _render_template(tokens, variables)
+            if result == obj:
                 break
+            obj = result
+            tokens = _variable_pattern.split(obj) if "$(" in obj else None
         if encode and obj.startswith("$(base64(") and obj.endswith("))"):
             obj = base64.b64encode(obj[9:-2].encode("utf-8")).decode("ascii").strip()
         return obj
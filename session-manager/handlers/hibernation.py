@@ -0,0 +1,178 @@
+"""Hibernation of idle workshop sessions. A workshop session is hibernated by
+scaling the deployments and stateful sets created for it down to zero, with
+storage for the workshop session being kept. It is resumed by scaling them
+back up again to the number of replicas they had before."""
+
+import json
+import logging
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pykube
+
+from .helpers import xget
+from .kubeclient import api
+from .objects import WorkshopSession
+from .operator_config import CLUSTER_DOMAIN, SESSION_HIBERNATION_IDLE_TIMEOUT
+from .sharding import session_is_local
+
+__all__ = [
+    "hibernate_session",
+    "resume_session",
+    "hibernate_idle_sessions",
+]
+
+logger = logging.getLogger("educates")
+
+_replicas_annotation = "training.educates.dev/session.replicas"
+
+_activity_timeout = 5
+_activity_concurrency = 16
+
+
+def _session_workloads(session_name):
+    selector = {
+        "training.educates.dev/component": "session",
+        "training.educates.dev/session.name": session_name,
+    }
+
+    for resource_type in (pykube.Deployment, pykube.StatefulSet):
+        yield from resource_type.objects(api, namespace=pykube.all).filter(
+            selector=selector
+        )
+
+
+def hibernate_session(session_name):
+    """Scales down all workloads of the workshop session, recording the
+    number of replicas each had so they can be restored on resume."""
+
+    for workload in _session_workloads(session_name):
+        replicas = workload.obj["spec"].get("replicas", 1)
+
+        if not replicas:
+            continue
+
+        logger.info(
+            "Scaling down %s %s in namespace %s for hibernation of workshop session %s.",
+            workload.kind,
+            workload.name,
+            workload.namespace,
+            session_name,
+        )
+
+        workload.patch(
+            {
+                "metadata": {"annotations": {_replicas_annotation: str(replicas)}},
+                "spec": {"replicas": 0},
+            }
+        )
+
+
+def resume_session(session_name):
+    """Scales all workloads of the workshop session back up to the number of
+    replicas they had before the workshop session was hibernated."""
+
+    for workload in _session_workloads(session_name):
+        replicas = workload.annotations.get(_replicas_annotation)
+
+        if replicas is None:
+            continue
+
+        logger.info(
+            "Scaling up %s %s in namespace %s for resume of workshop session %s.",
+            workload.kind,
+            workload.name,
+            workload.namespace,
+            session_name,
+        )
+
+        workload.patch(
+            {
+                "metadata": {"annotations": {_replicas_annotation: None}},
+                "spec": {"replicas": int(replicas)},
+            }
+        )
+
+
+def _session_idle_time(session_name, environment_name):
+    # Queries how long the user of the workshop session has been idle from
+    # the workshop instance, using the internal Kubernetes service for the
+    # workshop session. This is the same as the training portal uses when
+    # checking whether a workshop session has been orphaned.
+
+    url = f"http://{session_name}.{environment_name}.svc.{CLUSTER_DOMAIN}/session/activity"
+
+    with urllib.request.urlopen(url, timeout=_activity_timeout) as response:
+        return json.loads(response.read())["idle-time"]
+
+
+def _hibernate_if_idle(session):
+    environment_name = session.obj["spec"]["environment"]["name"]
+
+    try:
+        idle_time = _session_idle_time(session.name, environment_name)
+
+    except Exception:  # pylint: disable=broad-except
+        logger.debug("Unable to query idle time for workshop session %s.", session.name)
+
+        return
+
+    if idle_time < SESSION_HIBERNATION_IDLE_TIMEOUT:
+        return
+
+    logger.info(
+        "Hibernating workshop session %s after being idle for %s seconds.",
+        session.name,
+        idle_time,
+    )
+
+    try:
+        session.patch({"spec": {"session": {"hibernated": True}}})
+
+    except pykube.exceptions.KubernetesError:
+        logger.exception(
+            "Unable to mark workshop session %s as hibernated.", session.name
+        )
+
+
+def hibernate_idle_sessions():
+    """Marks as hibernated any workshop sessions allocated to a user which
+    have been idle for longer than the hibernation idle timeout."""
+
+    sessions = []
+
+    for session in WorkshopSession.objects(api).all():
+        spec = session.obj["spec"]
+
+        if not session_is_local(spec):
+            continue
+
+        if xget(spec, "session.hibernated", False):
+            continue
+
+        # Only workshop sessions which are running and which have been
+        # allocated to a user are hibernated. Reserved workshop sessions are
+        # left running so they are ready to be allocated.
+
+        if not xget(session.obj, "status.educates.url"):
+            continue
+
+        if not xget(session.obj, "status.educates.user"):
+            continue
+
+        sessions.append(session)
+
+    # The idle time of the workshop sessions is queried in parallel so that
+    # workshop sessions which are slow to respond don't hold up the check of
+    # the others.
+
+    with ThreadPoolExecutor(max_workers=_activity_concurrency) as executor:
+        for future in [
+            executor.submit(_hibernate_if_idle, session) for session in sessions
+        ]:
+            try:
+                future.result()
+
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Unexpected error checking for idle sessions.")
@@ -0,0 +1,181 @@
+"""Resolution of image references to the digest of the image they currently
+refer to, so that all workshop sessions of a workshop environment run the
+same image even where the reference uses a mutable tag."""
+
+import json
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .operator_config import (
+    IMAGE_DIGESTS_CACHE_TTL,
+    IMAGE_DIGESTS_INSECURE_REGISTRIES,
+)
+
+__all__ = ["resolve_image_digests"]
+
+logger = logging.getLogger("educates")
+
+_request_timeout = 10
+
+_manifest_media_types = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+
+_challenge_pattern = re.compile(r'(\w+)="([^"]*)"')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _parse_reference(image):
+    # Splits an image reference into the host for the registry API, the
+    # repository path and the tag. Returns None if the image reference already
+    # includes a digest.
+
+    if "@" in image:
+        return None
+
+    name, tag = image, "latest"
+
+    if image.rfind(":") > image.rfind("/"):
+        name, _, tag = image.rpartition(":")
+
+    host, _, path = name.partition("/")
+
+    if not path or not ("." in host or ":" in host or host == "localhost"):
+        host, path = "docker.io", name
+
+    if host == "docker.io":
+        host = "registry-1.docker.io"
+
+        if "/" not in path:
+            path = f"library/{path}"
+
+    return host, path, tag
+
+
+def _scheme(host):
+    hostname = host.split(":")[0]
+
+    if (
+        host in IMAGE_DIGESTS_INSECURE_REGISTRIES
+        or hostname == "localhost"
+        or hostname.endswith(".svc")
+        or hostname.endswith(".svc.cluster.local")
+    ):
+        return "http"
+
+    return "https"
+
+
+def _anonymous_token(challenge):
+    # Registries such as Docker Hub require a token even for anonymous
+    # access, obtained from the realm given in the authentication challenge.
+
+    params = dict(_challenge_pattern.findall(challenge))
+
+    realm = params.pop("realm", None)
+
+    if not realm:
+        return None
+
+    url = f"{realm}?{urllib.parse.urlencode(params)}"
+
+    with urllib.request.urlopen(url, timeout=_request_timeout) as response:
+        data = json.loads(response.read())
+
+    return data.get("token") or data.get("access_token")
+
+
+def _manifest_digest(image):
+    reference = _parse_reference(image)
+
+    if reference is None:
+        return None
+
+    host, path, tag = reference
+
+    url = f"{_scheme(host)}://{host}/v2/{path}/manifests/{tag}"
+
+    headers = {"Accept": _manifest_media_types}
+
+    for _ in range(2):
+        request = urllib.request.Request(url, headers=headers, method="HEAD")
+
+        try:
+            with urllib.request.urlopen(request, timeout=_request_timeout) as response:
+                return response.headers.get("Docker-Content-Digest")
+
+        except urllib.error.HTTPError as exc:
+            challenge = exc.headers.get("WWW-Authenticate", "")
+
+            if exc.code != 401 or "Authorization" in headers:
+                raise
+
+            if not challenge.lower().startswith("bearer "):
+                raise
+
+            token = _anonymous_token(challenge[len("bearer ") :])
+
+            if not token:
+                raise
+
+            headers["Authorization"] = f"Bearer {token}"
+
+    return None
+
+
+def _resolve(image):
+    now = time.monotonic()
+
+    with _cache_lock:
+        cached = _cache.get(image)
+
+        if cached and cached[1] > now:
+            return cached[0]
+
+    try:
+        digest = _manifest_digest(image)
+
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("Unable to resolve digest for image %s: %s", image, exc)
+
+        digest = None
+
+    # Failures are cached as well, so that a registry which cannot be reached
+    # doesn't delay the creation of every workshop environment.
+
+    with _cache_lock:
+        _cache[image] = (digest, now + IMAGE_DIGESTS_CACHE_TTL)
+
+    return digest
+
+
+def resolve_image_digests(images):
+    """Returns a mapping from each of the images to a reference which also
+    includes the digest of the image. Images which already include a digest,
+    or for which the digest could not be found, such as images in private
+    registries, are left out of the mapping."""
+
+    pinned = {}
+
+    for image in dict.fromkeys(images):
+        if not image:
+            continue
+
+        digest = _resolve(image)
+
+        if digest:
+            pinned[image] = f"{image}@{digest}"
+
+    return pinned
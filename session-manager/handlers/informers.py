@@ -0,0 +1,201 @@
+import copy
+import logging
+import threading
+
+import kopf
+import pykube
+
+from .kubeclient import api
+from .objects import Workshop, WorkshopEnvironment
+from .sharding import environment_is_local
+
+__all__ = ["workshops", "workshop_environments"]
+
+logger = logging.getLogger("educates")
+
+
+def _resource_version(obj):
+    # Resource versions are meant to be treated as opaque strings, but in
+    # practice are integers derived from the etcd revision. If they cannot be
+    # parsed as integers then we cannot order them, so return None.
+
+    try:
+        return int(obj["metadata"]["resourceVersion"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _project_metadata(obj):
+    metadata = obj.get("metadata", {})
+
+    keys = ("name", "namespace", "uid", "generation", "resourceVersion", "labels")
+
+    return {key: metadata[key] for key in keys if key in metadata}
+
+
+def _project_workshop(obj):
+    # Handlers only read the identity and specification of a workshop.
+
+    return {
+        "apiVersion": obj.get("apiVersion"),
+        "kind": obj.get("kind"),
+        "metadata": _project_metadata(obj),
+        "spec": obj.get("spec", {}),
+    }
+
+
+def _project_workshop_environment(obj):
+    # Handlers read the identity and specification of a workshop environment,
+    # plus the copy of the workshop definition and the pinned images held in
+    # its status. The rest of the status, such as that recorded by kopf, is
+    # not needed.
+
+    projected = {
+        "apiVersion": obj.get("apiVersion"),
+        "kind": obj.get("kind"),
+        "metadata": _project_metadata(obj),
+        "spec": obj.get("spec", {}),
+    }
+
+    educates = (obj.get("status") or {}).get("educates")
+
+    if educates:
+        projected["status"] = {
+            "educates": {
+                key: educates[key]
+                for key in ("phase", "workshop", "images")
+                if key in educates
+            }
+        }
+
+    return projected
+
+
+class InformerCache:
+    """Read-through cache of resources of a specific type. The cache is kept
+    up to date from the watch kopf already maintains for the resource type,
+    with a live query made against the Kubernetes REST API if the resource is
+    not in the cache. Updates to a cached resource are only applied if they
+    are newer than what is already cached, so that a read never goes back in
+    time relative to a prior read. Callers which require the latest version of
+    a resource, such as when retrying after having seen a stale version, can
+    request that the cache be bypassed. Only the fields of a resource returned
+    by the projection function are cached, so a cached resource should not be
+    used for anything other than reading those fields."""
+
+    def __init__(self, resource_type, projection):
+        self.resource_type = resource_type
+        self.projection = projection
+
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def _key(self, obj):
+        return (obj["metadata"].get("namespace"), obj["metadata"]["name"])
+
+    def update(self, obj):
+        """Updates the cache with the resource if it is newer than any version
+        of the resource which is already cached."""
+
+        key = self._key(obj)
+
+        obj = self.projection(obj)
+
+        with self._lock:
+            cached = self._objects.get(key)
+
+            if (
+                cached is not None
+                and cached["metadata"]["uid"] == obj["metadata"]["uid"]
+            ):
+                cached_version = _resource_version(cached)
+                version = _resource_version(obj)
+
+                if cached_version is not None and version is not None:
+                    if version < cached_version:
+                        return
+
+            self._objects[key] = obj
+
+    def discard(self, obj):
+        """Removes the resource from the cache."""
+
+        with self._lock:
+            key = self._key(obj)
+
+            cached = self._objects.get(key)
+
+            if (
+                cached is not None
+                and cached["metadata"]["uid"] == obj["metadata"]["uid"]
+            ):
+                del self._objects[key]
+
+    def process_event(self, event):
+        """Updates the cache from a kopf watch event."""
+
+        obj = event.get("object")
+
+        if not obj:
+            return
+
+        if event.get("type") == "DELETED":
+            self.discard(obj)
+        else:
+            self.update(obj)
+
+    def get(self, name, namespace=None, refresh=False):
+        """Returns the named resource, raising ObjectDoesNotExist if it does
+        not exist. The resource is returned from the cache if present unless
+        a refresh is requested. The returned resource object is a copy which
+        can be safely modified by the caller."""
+
+        if not refresh:
+            with self._lock:
+                obj = self._objects.get((namespace, name))
+
+            if obj is not None:
+                return self.resource_type(api, copy.deepcopy(obj))
+
+        if namespace is None:
+            query = self.resource_type.objects(api)
+        else:
+            query = self.resource_type.objects(api, namespace=namespace)
+
+        try:
+            instance = query.get(name=name)
+
+        except pykube.exceptions.ObjectDoesNotExist:
+            with self._lock:
+                self._objects.pop((namespace, name), None)
+
+            raise
+
+        self.update(copy.deepcopy(instance.obj))
+
+        return instance
+
+
+# Caches for resources which are read by handlers when workshop environments,
+# workshop sessions and workshop requests are created.
+
+workshops = InformerCache(Workshop, _project_workshop)
+
+workshop_environments = InformerCache(
+    WorkshopEnvironment, _project_workshop_environment
+)
+
+
+@kopf.on.event("training.educates.dev", "v1beta1", "workshops")
+def workshops_informer(event, **_):
+    workshops.process_event(event)
+
+
+@kopf.on.event(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopenvironments",
+    when=environment_is_local,
+)
+def workshop_environments_informer(event, **_):
+    workshop_environments.process_event(event)
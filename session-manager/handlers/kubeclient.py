@@ -0,0 +1,154 @@
+import time
+import logging
+import threading
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import pykube
+
+from .operator_config import (
+    KUBERNETES_API_QPS,
+    KUBERNETES_API_BURST,
+    KUBERNETES_API_POOL_SIZE,
+)
+
+__all__ = ["api"]
+
+logger = logging.getLogger("educates")
+
+
+class TokenBucket:
+    """Token bucket used to limit the rate of requests made against the
+    Kubernetes REST API. Requests can be made in bursts up to the size of the
+    bucket, after which they are limited to the refill rate. All requests can
+    also be paused for a period, such as when the API server says to back off.
+    A rate of zero or less disables rate limiting other than for pauses."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request can be made."""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+
+                elif self.rate <= 0:
+                    return
+
+                else:
+                    elapsed = now - self._updated
+
+                    self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+                    self._updated = now
+
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+
+                    delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Stops any requests from being made for the specified period."""
+
+        with self._lock:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + seconds
+            )
+
+
+def _retry_after(response, default=1.0, maximum=60.0):
+    # The Retry-After header can be a number of seconds or a HTTP date. The
+    # Kubernetes API server uses a number of seconds.
+
+    value = response.headers.get("Retry-After")
+
+    if not value:
+        return default
+
+    try:
+        delay = float(value)
+
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+            delay = (when - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return default
+
+    return min(max(delay, 0.0), maximum)
+
+
+class RateLimitedHTTPAdapter(pykube.http.KubernetesHTTPAdapter):
+    """HTTP adapter for the Kubernetes REST API which applies client side
+    rate limiting to requests, and where the API server responds that too
+    many requests are being made, waits as directed before trying again."""
+
+    throttled_retries = 5
+
+    def __init__(self, kube_config, limiter, **kwargs):
+        self.limiter = limiter
+
+        super().__init__(kube_config, **kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        attempt = 0
+
+        while True:
+            self.limiter.acquire()
+
+            # The parent class consumes some of the keyword arguments, so a
+            # copy is passed in case the request needs to be sent again.
+
+            response = super().send(request, **dict(kwargs))
+
+            if response.status_code != 429 or attempt >= self.throttled_retries:
+                return response
+
+            delay = _retry_after(response)
+
+            logger.warning(
+                "Request to Kubernetes REST API was throttled, retrying in %.1fs.",
+                delay,
+            )
+
+            response.close()
+
+            self.limiter.pause(delay)
+
+            attempt += 1
+
+
+def _create_client():
+    config = pykube.KubeConfig.from_env()
+
+    limiter = TokenBucket(KUBERNETES_API_QPS, KUBERNETES_API_BURST)
+
+    adapter = RateLimitedHTTPAdapter(
+        config,
+        limiter,
+        pool_connections=1,
+        pool_maxsize=KUBERNETES_API_POOL_SIZE,
+    )
+
+    return pykube.HTTPClient(config, http_adapter=adapter)
+
+
+# Client for the Kubernetes REST API shared by all handlers, so that requests
+# are made over a common pool of keep-alive connections and are subject to the
+# same rate limits.
+
+api = _create_client()
@@ -1,8 +1,7 @@
 import os
 import yaml
 import copy
-
-from wrapt import synchronized
+import functools
 
 from .helpers import xget
 
@@ -13,14 +12,30 @@ if os.path.exists("/opt/app-root/config/kyverno-policies.yaml"):
         kyverno_policies = list(yaml.load_all(fp.read(), Loader=yaml.Loader))
 
 
-@synchronized
-def kyverno_environment_rules(workshop_spec, environment_name):
-    action = xget(workshop_spec, "session.namespaces.security.rules.action", "Enforce")
-    exclude = xget(workshop_spec, "session.namespaces.security.rules.exclude", [])
+def _rule_resources(rule):
+    # Returns the resource descriptions which are a target of the rule. These
+    # are the objects within the rule which need to have a namespace selector
+    # added to them.
+
+    resources = [condition.get("resources", {}) for condition in xget(rule, "match.all", [])]
+
+    if not resources:
+        resources = [condition.get("resources", {}) for condition in xget(rule, "match.any", [])]
+
+    if not resources:
+        resources = [xget(rule, "match.resources", {})]
+
+    return resources
 
-    rules = []
 
-    for clusterpolicy in kyverno_policies:
+def _compile_rules(policies):
+    # Flattens the rules from the cluster policies into a list of templates,
+    # with each rule given its final name. This is done once when the module
+    # is loaded rather than each time rules are generated for an environment.
+
+    templates = []
+
+    for clusterpolicy in policies:
         policy_name = xget(clusterpolicy, "metadata.name")
         policy_rules = xget(clusterpolicy, "spec.rules", [])
 
@@ -32,42 +47,48 @@ def kyverno_environment_rules(workshop_spec, environment_name):
             else:
                 rule["name"] = policy_name
 
-            # Add a namespace selector to each resource which is a target of the
-            # rule. This is to ensure that the rule is only applied to the
-            # namespaces which are created for a workshop session.
+            templates.append((policy_name, rule))
 
-            resources = [condition.get("resources", {}) for condition in xget(rule, "match.all", [])]
+    return tuple(templates)
 
-            if not resources:
-                resources = [condition.get("resources", {}) for condition in xget(rule, "match.any", [])]
 
-            if not resources:
-                resources = [xget(rule, "match.resources", {})]
+_rule_templates = _compile_rules(kyverno_policies)
 
-            if not resources:
-                continue
 
-            for resource in resources:
-                resource["namespaceSelector"] = {
-                    "matchExpressions": [
-                        {
-                            "key": "training.educates.dev/environment.name",
-                            "operator": "In",
-                            "values": [environment_name],
-                        },
-                        {
-                            "key": "training.educates.dev/component",
-                            "operator": "In",
-                            "values": ["session"],
-                        },
-                    ]
-                }
+@functools.lru_cache(maxsize=256)
+def _render_environment_rules(environment_name, action, exclude):
+    rules = []
 
-            if policy_name not in exclude:
-                rules.append(rule)
+    for policy_name, template in _rule_templates:
+        if policy_name in exclude:
+            continue
+
+        rule = copy.deepcopy(template)
+
+        # Add a namespace selector to each resource which is a target of the
+        # rule. This is to ensure that the rule is only applied to the
+        # namespaces which are created for a workshop session.
+
+        for resource in _rule_resources(rule):
+            resource["namespaceSelector"] = {
+                "matchExpressions": [
+                    {
+                        "key": "training.educates.dev/environment.name",
+                        "operator": "In",
+                        "values": [environment_name],
+                    },
+                    {
+                        "key": "training.educates.dev/component",
+                        "operator": "In",
+                        "values": ["session"],
+                    },
+                ]
+            }
+
+        rules.append(rule)
 
     if not rules:
-        return []
+        return ()
 
     cluster_policy_body = {
         "apiVersion": "kyverno.io/v1",
@@ -82,4 +103,21 @@ def kyverno_environment_rules(workshop_spec, environment_name):
         },
     }
 
-    return [cluster_policy_body]
+    return (cluster_policy_body,)
+
+
+def kyverno_environment_rules(workshop_spec, environment_name):
+    action = xget(workshop_spec, "session.namespaces.security.rules.action", "Enforce")
+    exclude = xget(workshop_spec, "session.namespaces.security.rules.exclude", [])
+
+    # The rendered rules are cached, keyed by the workshop security rules. The
+    # caller will add owner references and labels to the resource definitions
+    # so the metadata is copied, but the rules are shared with the cache and
+    # must not be modified.
+
+    return [
+        dict(body, metadata=copy.deepcopy(body["metadata"]))
+        for body in _render_environment_rules(
+            environment_name, action, frozenset(exclude)
+        )
+    ]
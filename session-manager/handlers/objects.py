@@ -1,8 +1,7 @@
-from pykube import object_factory, HTTPClient, KubeConfig
+from pykube import object_factory
 from pykube.objects import APIObject, NamespacedAPIObject
 
-
-api = HTTPClient(KubeConfig.from_env())
+from .kubeclient import api
 
 
 def Resource(api, body):
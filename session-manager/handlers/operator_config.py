@@ -36,7 +36,16 @@ else:
 
 RUNTIME_CLASS = xget(config_values, "clusterRuntime.class", "")
 
-CLUSTER_DOMAIN = socket.getaddrinfo("kubernetes.default.svc", 0, flags=socket.AI_CANONNAME)[0][3]
+# The cluster domain is worked out from the canonical name of the Kubernetes
+# API service. Fallback to the default when the lookup fails, such as when
+# workshops are being rendered offline without a cluster.
+
+try:
+    CLUSTER_DOMAIN = socket.getaddrinfo(
+        "kubernetes.default.svc", 0, flags=socket.AI_CANONNAME
+    )[0][3]
+except socket.gaierror:
+    CLUSTER_DOMAIN = ""
 
 if CLUSTER_DOMAIN.startswith("kubernetes.default.svc."):
     CLUSTER_DOMAIN = CLUSTER_DOMAIN.replace("kubernetes.default.svc.", "")
@@ -97,6 +106,90 @@ CLARITY_TRACKING_ID = xget(config_values, "workshopAnalytics.clarity.trackingId"
 AMPLITUDE_TRACKING_ID = xget(config_values, "workshopAnalytics.amplitude.trackingId", "")
 
 ANALYTICS_WEBHOOK_URL = xget(config_values, "workshopAnalytics.webhook.url", "")
+ANALYTICS_WEBHOOK_QUEUE_SIZE = xget(
+    config_values, "workshopAnalytics.webhook.queueSize", 1000
+)
+ANALYTICS_WEBHOOK_SPOOL_DIRECTORY = xget(
+    config_values, "workshopAnalytics.webhook.spoolDirectory", ""
+)
+
+KUBERNETES_API_QPS = xget(config_values, "sessionManager.kubernetesAPI.qps", 50)
+KUBERNETES_API_BURST = xget(config_values, "sessionManager.kubernetesAPI.burst", 100)
+KUBERNETES_API_POOL_SIZE = xget(
+    config_values, "sessionManager.kubernetesAPI.poolSize", 32
+)
+
+SESSION_CREATION_CONCURRENCY = xget(
+    config_values, "sessionManager.creationConcurrency", 8
+)
+
+BACKGROUND_HANDLER_WORKERS = xget(
+    config_values, "sessionManager.backgroundWorkers", 8
+)
+
+SESSION_NAMESPACE_POOL_SIZE = xget(
+    config_values, "sessionManager.namespacePoolSize", 0
+)
+
+SESSION_HIBERNATION_IDLE_TIMEOUT = xget(
+    config_values, "sessionManager.hibernation.idleTimeout", 0
+)
+
+IMAGE_DIGESTS_ENABLED = xget(config_values, "sessionManager.imageDigests.enabled", False)
+IMAGE_DIGESTS_CACHE_TTL = xget(config_values, "sessionManager.imageDigests.cacheTTL", 300)
+IMAGE_DIGESTS_INSECURE_REGISTRIES = xget(
+    config_values, "sessionManager.imageDigests.insecureRegistries", []
+)
+
+IMAGE_PREPULL_ENABLED = xget(config_values, "sessionManager.imagePrePull.enabled", False)
+
+# Image pull secrets are copied into workshop namespaces by the secret copier
+# defined by the installer, so only the names are needed.
+
+IMAGE_PULL_SECRETS = [
+    item["name"]
+    for item in xget(config_values, "clusterSecrets.pullSecretRefs", []) or []
+    if item.get("name")
+]
+
+METRICS_PORT = xget(config_values, "sessionManager.metrics.port", 0)
+
+CREDENTIALS_POOL_DEPTH = xget(config_values, "sessionManager.credentialsPoolDepth", 10)
+
+SSH_KEY_TYPE = xget(config_values, "sessionManager.sshKeyType", "rsa")
+
+# When the session manager is run as multiple replicas, work is split between
+# them into shards based on the name of the workshop environment. Each replica
+# must be given a distinct ordinal from which the shard it handles is
+# calculated. If not set explicitly, the ordinal is taken from the host name,
+# which for a pod of a stateful set ends in the pod index. Where standby
+# replicas are requested for each shard, the extra replicas act as standbys.
+
+SESSION_MANAGER_SHARDS = max(1, int(xget(config_values, "sessionManager.shards", 1)))
+
+SESSION_MANAGER_STANDBYS = max(
+    0, int(xget(config_values, "sessionManager.standbys", 0) or 0)
+)
+
+SESSION_MANAGER_REPLICAS = SESSION_MANAGER_SHARDS * (1 + SESSION_MANAGER_STANDBYS)
+
+
+def _session_manager_ordinal():
+    ordinal = os.environ.get("SESSION_MANAGER_ORDINAL")
+
+    if ordinal is None and SESSION_MANAGER_REPLICAS > 1:
+        ordinal = socket.gethostname().rpartition("-")[2]
+
+    try:
+        return int(ordinal or "0")
+    except ValueError:
+        logger.error("Unable to determine ordinal for session manager replica.")
+        raise
+
+
+SESSION_MANAGER_ORDINAL = _session_manager_ordinal()
+
+SESSION_MANAGER_SHARD = SESSION_MANAGER_ORDINAL % SESSION_MANAGER_SHARDS
 
 
 def generate_password(length):
@@ -135,12 +228,14 @@ def image_reference(name):
     return image
 
 
+SESSION_MANAGER_IMAGE = image_reference("session-manager")
 TRAINING_PORTAL_IMAGE = image_reference("training-portal")
 DOCKER_IN_DOCKER_IMAGE = image_reference("docker-in-docker")
 DOCKER_REGISTRY_IMAGE = image_reference("docker-registry")
 TUNNEL_MANAGER_IMAGE = image_reference("tunnel-manager")
 IMAGE_CACHE_IMAGE = image_reference("image-cache")
 ASSETS_SERVER_IMAGE = image_reference("assets-server")
+PAUSE_CONTAINER_IMAGE = image_reference("pause-container")
 
 BASE_ENVIRONMENT_IMAGE = image_reference("base-environment")
 JDK8_ENVIRONMENT_IMAGE = image_reference("jdk8-environment")
@@ -0,0 +1,86 @@
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .operator_config import SESSION_CREATION_CONCURRENCY
+
+logger = logging.getLogger("educates")
+
+# Shared pool of worker threads used to create resources in parallel. This is
+# shared across all handlers so that the total number of concurrent requests
+# made against the Kubernetes REST API is bounded no matter how many workshop
+# sessions are being created at the same time.
+
+_executor = ThreadPoolExecutor(
+    max_workers=max(1, int(SESSION_CREATION_CONCURRENCY)),
+    thread_name_prefix="educates-pipeline",
+)
+
+
+class CreationPipeline:
+    """Runs a set of tasks, usually the creation of Kubernetes resources, in
+    parallel, with a task only being started once all the tasks it depends on
+    have completed successfully. Tasks are run using a shared thread pool, with
+    the thread calling run() being used to schedule tasks as they become ready.
+    A task should not itself run a pipeline as doing so could exhaust the
+    shared thread pool."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    def add(self, name, function, *args, depends=()):
+        """Adds a task to the pipeline. The name must be unique within the
+        pipeline and is what other tasks use to declare a dependency on it.
+        Dependencies must have been added to the pipeline before the task."""
+
+        if name in self._tasks:
+            raise ValueError(f"Duplicate pipeline task {name}.")
+
+        for dependency in depends:
+            if dependency not in self._tasks:
+                raise ValueError(f"Unknown dependency {dependency} for task {name}.")
+
+        self._tasks[name] = (function, args, tuple(depends))
+
+    def run(self):
+        """Runs all the tasks in the pipeline and waits for them to complete.
+        If any task fails, tasks depending on it are not run, and once all
+        other running tasks have completed, the exception from the failed task
+        which was added to the pipeline first is raised."""
+
+        pending = dict(self._tasks)
+        running = {}
+        completed = set()
+        failures = {}
+
+        while pending or running:
+            # Skip any tasks which depend on a task which has failed, or which
+            # itself was skipped, then submit all tasks which are ready to run.
+
+            for name, (function, args, depends) in list(pending.items()):
+                if any(dependency in failures for dependency in depends):
+                    failures[name] = None
+                    del pending[name]
+
+                elif all(dependency in completed for dependency in depends):
+                    running[_executor.submit(function, *args)] = name
+                    del pending[name]
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+
+                exc = future.exception()
+
+                if exc is not None:
+                    failures[name] = exc
+                else:
+                    completed.add(name)
+
+        for name in self._tasks:
+            if failures.get(name) is not None:
+                raise failures[name]
@@ -0,0 +1,127 @@
+"""Pre-pulling of the images required by workshop sessions onto all nodes."""
+
+from .helpers import image_pull_policy
+from .operator_config import (
+    DOCKER_IN_DOCKER_IMAGE,
+    DOCKER_REGISTRY_IMAGE,
+    IMAGE_PULL_SECRETS,
+    LOFTSH_VCLUSTER_IMAGE,
+    PAUSE_CONTAINER_IMAGE,
+)
+
+__all__ = ["prepull_images", "prepull_daemonset_body", "prepull_progress"]
+
+
+def prepull_images(workshop_image, applications):
+    """Returns the list of images to be pre-pulled for workshop sessions of a
+    workshop environment, with the workshop image first as it is usually the
+    largest. Only images which include /bin/true can be pre-pulled."""
+
+    images = [workshop_image]
+
+    if applications.is_enabled("docker"):
+        images.append(DOCKER_IN_DOCKER_IMAGE)
+
+    if applications.is_enabled("registry"):
+        images.append(DOCKER_REGISTRY_IMAGE)
+
+    if applications.is_enabled("vcluster"):
+        images.append(LOFTSH_VCLUSTER_IMAGE)
+
+    return list(dict.fromkeys(image for image in images if image))
+
+
+def prepull_daemonset_body(workshop_namespace, images, labels):
+    """Returns the daemon set which pre-pulls the images onto each node. The
+    images are run in turn as init containers which exit straight away, with
+    the pod only becoming ready once all the images have been pulled. The
+    daemon set is deleted once the images have been pulled to all nodes, so
+    nodes later added to the cluster will not have the images pulled."""
+
+    selector = {"deployment": f"{workshop_namespace}-prepull"}
+
+    security_context = {
+        "allowPrivilegeEscalation": False,
+        "capabilities": {"drop": ["ALL"]},
+        "runAsNonRoot": True,
+        # "seccompProfile": {"type": "RuntimeDefault"},
+    }
+
+    resources = {
+        "limits": {"memory": "32Mi"},
+        "requests": {"cpu": "1m", "memory": "32Mi"},
+    }
+
+    init_containers = [
+        {
+            "name": f"image-{index}",
+            "image": image,
+            "imagePullPolicy": image_pull_policy(image),
+            "command": ["/bin/true"],
+            "securityContext": security_context,
+            "resources": resources,
+        }
+        for index, image in enumerate(images, start=1)
+    ]
+
+    daemonset_body = {
+        "apiVersion": "apps/v1",
+        "kind": "DaemonSet",
+        "metadata": {
+            "namespace": workshop_namespace,
+            "name": f"{workshop_namespace}-prepull",
+            "labels": labels,
+        },
+        "spec": {
+            "selector": {"matchLabels": selector},
+            "template": {
+                "metadata": {"labels": dict(labels, **selector)},
+                "spec": {
+                    "serviceAccountName": "educates-services",
+                    "automountServiceAccountToken": False,
+                    "securityContext": {"runAsUser": 1001},
+                    "initContainers": init_containers,
+                    "containers": [
+                        {
+                            "name": "pause",
+                            "image": PAUSE_CONTAINER_IMAGE,
+                            "imagePullPolicy": image_pull_policy(
+                                PAUSE_CONTAINER_IMAGE
+                            ),
+                            "securityContext": security_context,
+                            "resources": resources,
+                        }
+                    ],
+                },
+            },
+        },
+    }
+
+    if IMAGE_PULL_SECRETS:
+        daemonset_body["spec"]["template"]["spec"]["imagePullSecrets"] = [
+            {"name": name} for name in IMAGE_PULL_SECRETS
+        ]
+
+    return daemonset_body
+
+
+def prepull_progress(daemonset):
+    """Returns the progress of pre-pulling images as recorded in the status
+    of the workshop environment, based on the status of the daemon set."""
+
+    status = daemonset.get("status", {})
+
+    desired = status.get("desiredNumberScheduled", 0)
+    ready = status.get("numberReady", 0)
+
+    images = [
+        container["image"]
+        for container in daemonset["spec"]["template"]["spec"]["initContainers"]
+    ]
+
+    return {
+        "phase": "Completed" if desired and ready >= desired else "Pulling",
+        "images": images,
+        "nodes": desired,
+        "ready": ready,
+    }
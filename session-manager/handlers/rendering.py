@@ -0,0 +1,1928 @@
+"""Rendering of the resource definitions described by a workshop definition.
+
+Functions here only transform a workshop definition and a set of variables
+into resource definitions and never make requests against the Kubernetes REST
+API. They are used by the handlers, but can also be used to render a workshop
+without a cluster, as is done by the render.py script.
+"""
+
+import base64
+import copy
+import json
+
+import yaml
+
+from .applications import (
+    environment_objects_list,
+    pod_template_spec_patches,
+    session_objects_list,
+    workshop_spec_patches,
+)
+from .helpers import (
+    Applications,
+    image_pull_policy,
+    smart_overlay_merge,
+    substitute_variables,
+    xget,
+)
+from .namespace_budgets import namespace_budgets
+from .operator_config import (
+    CLUSTER_SECURITY_POLICY_ENGINE,
+    CLUSTER_STORAGE_CLASS,
+    CLUSTER_STORAGE_GROUP,
+    CLUSTER_STORAGE_USER,
+    DOCKERD_MIRROR_REMOTE,
+    DOCKERD_MTU,
+    INGRESS_CA_SECRET,
+    INGRESS_CLASS,
+    INGRESS_DOMAIN,
+    INGRESS_SECRET,
+    NETWORK_BLOCKCIDRS,
+    RUNTIME_CLASS,
+)
+
+__all__ = [
+    "resolve_workshop_spec",
+    "build_session_template",
+    "render_environment_objects",
+    "render_session_objects",
+    "session_labels",
+    "resolve_security_policy",
+    "session_namespace_settings",
+    "resolve_namespace_budget",
+    "render_session_namespace",
+    "render_namespace_setup_objects",
+    "render_session_service_account",
+    "render_variables_secret",
+    "session_storage_settings",
+    "session_volume_subpath",
+    "session_workshop_memory",
+    "render_session_deployment",
+    "apply_environment_patch",
+    "apply_session_patches",
+    "render_ssh_keys_secret",
+    "add_session_volumes",
+    "render_session_service",
+    "render_session_ingress",
+    "shared_registry_host",
+    "apply_registry_credentials",
+    "add_application_labels",
+    "render_console_objects",
+    "add_docker_daemon",
+    "add_image_registry",
+]
+
+
+def resolve_workshop_spec(workshop_spec):
+    """Applies any patches enabled applications make to the workshop
+    definition, updating it in place, and returns the wrapper for determining
+    which applications are enabled. As an application could enable another
+    application because it requires it, the list of applications is
+    calculated again after patching."""
+
+    applications = Applications(workshop_spec["session"].get("applications", {}))
+
+    for application in applications:
+        if applications.is_enabled(application):
+            workshop_config_patch = workshop_spec_patches(
+                application, workshop_spec, applications.properties(application)
+            )
+            smart_overlay_merge(workshop_spec, workshop_config_patch.get("spec", {}))
+
+    return Applications(workshop_spec["session"].get("applications", {}))
+
+
+def build_session_template(workshop_spec, applications):
+    """Returns the session objects and pod template patches for the workshop
+    session, including those for any enabled applications. These still
+    contain references to session variables and must be passed through
+    substitute_variables() before use."""
+
+    objects = []
+    patches = []
+
+    for application in applications:
+        if applications.is_enabled(application):
+            objects.extend(
+                session_objects_list(
+                    application, workshop_spec, applications.properties(application)
+                )
+            )
+            patches.append(
+                pod_template_spec_patches(
+                    application, workshop_spec, applications.properties(application)
+                )
+            )
+
+    if workshop_spec.get("session"):
+        objects.extend(workshop_spec["session"].get("objects", []))
+
+    return dict(objects=objects, pod_template_spec_patches=patches)
+
+
+def render_environment_objects(
+    workshop_spec, applications, extra_objects, variables, namespace, labels
+):
+    """Returns the additional resources for a workshop environment, as
+    defined by the workshop definition and any enabled applications, plus
+    any extra objects from the workshop environment itself. Where a namespace
+    isn't set on a resource it is placed in the workshop namespace."""
+
+    objects = []
+
+    if workshop_spec.get("environment", {}).get("objects"):
+        for application in applications:
+            if applications.is_enabled(application):
+                objects.extend(
+                    environment_objects_list(
+                        application, workshop_spec, applications.properties(application)
+                    )
+                )
+
+        objects.extend(workshop_spec["environment"]["objects"])
+
+    objects.extend(extra_objects)
+
+    rendered = []
+
+    for object_body in objects:
+        object_body = substitute_variables(object_body, variables)
+
+        if not object_body["metadata"].get("namespace"):
+            object_body["metadata"]["namespace"] = namespace
+
+        object_body["metadata"].setdefault("labels", {}).update(labels)
+
+        if (
+            object_body["apiVersion"] == "v1"
+            and object_body["kind"].lower() == "namespace"
+        ):
+            annotations = object_body["metadata"].setdefault("annotations", {})
+            annotations["secretgen.carvel.dev/excluded-from-wildcard-matching"] = ""
+
+        rendered.append(object_body)
+
+    return rendered
+
+
+def render_session_objects(template, variables, namespace, labels):
+    """Returns the additional resources for a workshop session from the
+    session template. Where a namespace isn't set on a resource it is placed
+    in the session namespace."""
+
+    rendered = []
+
+    for object_body in template["objects"]:
+        object_body = substitute_variables(object_body, variables)
+
+        if not object_body["metadata"].get("namespace"):
+            object_body["metadata"]["namespace"] = namespace
+
+        object_body["metadata"].setdefault("labels", {}).update(labels)
+
+        rendered.append(object_body)
+
+    return rendered
+
+
+def session_labels(
+    workshop_name,
+    portal_name,
+    portal_uid,
+    environment_name,
+    environment_uid,
+    session_name,
+):
+    """Returns the labels applied to all resources created for a workshop
+    session."""
+
+    return {
+        "training.educates.dev/component": "session",
+        "training.educates.dev/workshop.name": workshop_name,
+        "training.educates.dev/portal.name": portal_name,
+        "training.educates.dev/portal.uid": portal_uid,
+        "training.educates.dev/environment.name": environment_name,
+        "training.educates.dev/environment.uid": environment_uid,
+        "training.educates.dev/session.name": session_name,
+    }
+
+
+_security_policy_mapping = {
+    "restricted": "restricted",
+    "baseline": "baseline",
+    "privileged": "privileged",
+    # Following are obsolete and should not be used.
+    "nonroot": "restricted",
+    "anyuid": "baseline",
+    "custom": "privileged",
+}
+
+
+def resolve_security_policy(name):
+    """Maps the name of a security policy, including obsolete names, to the
+    security policy applied to a namespace."""
+
+    return _security_policy_mapping.get(name, "restricted")
+
+
+def session_namespace_settings(workshop_spec):
+    """Returns the role, budget, limits and security policy to be applied to
+    the primary session namespace for a workshop."""
+
+    role = "admin"
+    budget = "default"
+    limits = {}
+
+    namespace_security_policy = "restricted"
+
+    if workshop_spec.get("session"):
+        role = workshop_spec["session"].get("namespaces", {}).get("role", role)
+        budget = workshop_spec["session"].get("namespaces", {}).get("budget", budget)
+        limits = workshop_spec["session"].get("namespaces", {}).get("limits", limits)
+
+        namespace_security_policy = resolve_security_policy(
+            workshop_spec["session"]
+            .get("namespaces", {})
+            .get("security", {})
+            .get("policy", namespace_security_policy)
+        )
+
+    return role, budget, limits, namespace_security_policy
+
+
+def resolve_namespace_budget(budget):
+    """Returns the budget to be applied to a namespace, with any unknown or
+    empty budget being mapped to the default, in which case no limit range or
+    resource quotas are created."""
+
+    if budget != "custom":
+        if budget not in namespace_budgets:
+            budget = "default"
+        elif not namespace_budgets[budget]:
+            budget = "default"
+
+    return budget
+
+
+def render_session_namespace(session_namespace, labels, namespace_security_policy):
+    """Returns the namespace for a workshop session, labelled with the
+    security policy to be enforced for it."""
+
+    namespace_body = {
+        "apiVersion": "v1",
+        "kind": "Namespace",
+        "metadata": {
+            "name": session_namespace,
+            "labels": dict(
+                labels,
+                **{
+                    "training.educates.dev/policy.engine": CLUSTER_SECURITY_POLICY_ENGINE,
+                    "training.educates.dev/policy.name": namespace_security_policy,
+                },
+            ),
+            "annotations": {"secretgen.carvel.dev/excluded-from-wildcard-matching": ""},
+        },
+    }
+
+    if CLUSTER_SECURITY_POLICY_ENGINE == "pod-security-standards":
+        namespace_body["metadata"]["labels"][
+            "pod-security.kubernetes.io/enforce"
+        ] = namespace_security_policy
+
+    return namespace_body
+
+
+def render_namespace_setup_objects(
+    target_namespace,
+    workshop_namespace,
+    service_account,
+    role,
+    budget,
+    limits,
+    security_policy,
+    labels,
+):
+    """Returns the network policy, role bindings, limit range and resource
+    quotas to be created in a namespace for a workshop session. The budget
+    must already have been passed through resolve_namespace_budget()."""
+
+    objects = []
+
+    # If there is a CIDR list of networks to block create a network policy in
+    # the target session environment to restrict access from all pods. The
+    # customised roles for "admin", "edit" and "view" used below ensure that the
+    # network policy objects cannot be deleted from the session namespaces by a
+    # user.
+
+    if NETWORK_BLOCKCIDRS:
+        egresses = []
+
+        ipv4_blockcidrs = []
+        ipv6_blockcidrs = []
+
+        for block in list(NETWORK_BLOCKCIDRS):
+            if ":" in block:
+                ipv6_blockcidrs.append(block)
+            else:
+                ipv4_blockcidrs.append(block)
+
+        if ipv4_blockcidrs:
+            egresses.append(
+                {"to": [{"ipBlock": {"cidr": "0.0.0.0/0", "except": ipv4_blockcidrs}}]}
+            )
+
+        if ipv6_blockcidrs:
+            egresses.append(
+                {"to": [{"ipBlock": {"cidr": "::/0", "except": ipv6_blockcidrs}}]}
+            )
+
+        objects.append(
+            {
+                "apiVersion": "networking.k8s.io/v1",
+                "kind": "NetworkPolicy",
+                "metadata": {
+                    "name": "educates-network-policy",
+                    "namespace": target_namespace,
+                    "labels": dict(labels),
+                },
+                "spec": {
+                    "policyTypes": ["Egress"],
+                    "egress": egresses,
+                },
+            }
+        )
+
+    # Create role binding in the namespace so the service account under which
+    # the workshop environment runs can create resources in it. We only allow a
+    # select set of roles which are "admin", "edit", "view" and "cluster-admin".
+    # Except for "cluster-admin" these will be mapped to our own version of the
+    # respective cluster roles which have any edit access to network policies
+    # dropped. If a role is provided we don't know about, we will map it to
+    # "view" which because it is the most restrictive will flag more easily that
+    # something is wrong in what a workshop defines. If want no role at all to
+    # be set up so you can define your own, then can set "custom".
+
+    role_mappings = {
+        "admin": "educates-admin-session-role",
+        "edit": "educates-edit-session-role",
+        "view": "educates-view-session-role",
+        "cluster-admin": "cluster-admin",
+        "custom": None,
+    }
+
+    role_resource_name = role_mappings.get(role)
+
+    if role_resource_name is None and role != "custom":
+        role_resource_name = "educates-view-session-role"
+
+    if role_resource_name is not None:
+        objects.append(
+            {
+                "apiVersion": "rbac.authorization.k8s.io/v1",
+                "kind": "RoleBinding",
+                "metadata": {
+                    "name": "educates-session-role",
+                    "namespace": target_namespace,
+                    "labels": dict(labels),
+                },
+                "roleRef": {
+                    "apiGroup": "rbac.authorization.k8s.io",
+                    "kind": "ClusterRole",
+                    "name": role_resource_name,
+                },
+                "subjects": [
+                    {
+                        "kind": "ServiceAccount",
+                        "name": service_account,
+                        "namespace": workshop_namespace,
+                    }
+                ],
+            }
+        )
+
+    # Create rolebinding so that all service accounts in the namespace are bound
+    # by the specified security policy.
+
+    security_policy_roles = {
+        "pod-security-policies": f"educates-{security_policy}-psp",
+        "security-context-constraints": f"educates-{security_policy}-scc",
+    }
+
+    if CLUSTER_SECURITY_POLICY_ENGINE in security_policy_roles:
+        objects.append(
+            {
+                "apiVersion": "rbac.authorization.k8s.io/v1",
+                "kind": "RoleBinding",
+                "metadata": {
+                    "name": "educates-security-policy",
+                    "namespace": target_namespace,
+                    "labels": dict(labels),
+                },
+                "roleRef": {
+                    "apiGroup": "rbac.authorization.k8s.io",
+                    "kind": "ClusterRole",
+                    "name": security_policy_roles[CLUSTER_SECURITY_POLICY_ENGINE],
+                },
+                "subjects": [
+                    {
+                        "apiGroup": "rbac.authorization.k8s.io",
+                        "kind": "Group",
+                        "name": f"system:serviceaccounts:{target_namespace}",
+                    }
+                ],
+            }
+        )
+
+    # Create limit ranges for the namespace so any deployments will have default
+    # memory/cpu min and max values, and resource quotas so there is a maximum
+    # for what resources can be used.
+
+    if budget not in ("default", "custom"):
+        budget_item = namespace_budgets[budget]
+
+        resource_limits_body = copy.deepcopy(budget_item["resource-limits"])
+
+        if limits:
+            container_limits_patch = {"type": "Container"}
+            container_limits_patch.update(limits)
+
+            smart_overlay_merge(
+                resource_limits_body["spec"]["limits"],
+                [container_limits_patch],
+                "type",
+            )
+
+        budget_objects = [
+            resource_limits_body,
+            copy.deepcopy(budget_item["compute-resources"]),
+            copy.deepcopy(budget_item["compute-resources-timebound"]),
+            copy.deepcopy(budget_item["object-counts"]),
+        ]
+
+        for object_body in budget_objects:
+            object_body["metadata"].setdefault("labels", {}).update(labels)
+            object_body["metadata"]["namespace"] = target_namespace
+
+        objects.extend(budget_objects)
+
+    return objects
+
+
+def render_session_service_account(
+    service_account, workshop_namespace, session_namespace, labels, portal_labels
+):
+    """Returns the service account the workshop session runs as, the secret
+    holding its access token and the cluster role binding granting it access
+    to the roles the Kubernetes web console requires."""
+
+    service_account_body = {
+        "apiVersion": "v1",
+        "kind": "ServiceAccount",
+        "metadata": {
+            "name": service_account,
+            "namespace": workshop_namespace,
+            "labels": dict(labels),
+        },
+    }
+
+    service_account_token_body = {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {
+            "name": f"{service_account}-token",
+            "namespace": workshop_namespace,
+            "annotations": {"kubernetes.io/service-account.name": service_account},
+            "labels": dict(portal_labels),
+        },
+        "type": "kubernetes.io/service-account-token",
+    }
+
+    cluster_role_binding_body = {
+        "apiVersion": "rbac.authorization.k8s.io/v1",
+        "kind": "ClusterRoleBinding",
+        "metadata": {
+            "name": f"educates-web-console-{session_namespace}",
+            "labels": dict(labels),
+        },
+        "roleRef": {
+            "apiGroup": "rbac.authorization.k8s.io",
+            "kind": "ClusterRole",
+            "name": f"educates-web-console-{workshop_namespace}",
+        },
+        "subjects": [
+            {
+                "kind": "ServiceAccount",
+                "namespace": workshop_namespace,
+                "name": service_account,
+            }
+        ],
+    }
+
+    return service_account_body, service_account_token_body, cluster_role_binding_body
+
+
+def render_variables_secret(session_namespace, workshop_namespace, variables, labels):
+    """Returns the secret holding the session variables, which is used when
+    allocating a user to the workshop session."""
+
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {
+            "name": f"{session_namespace}-session",
+            "namespace": workshop_namespace,
+            "labels": dict(
+                labels, **{"training.educates.dev/component.group": "variables"}
+            ),
+        },
+        "data": {
+            key: base64.b64encode(value.encode("UTF-8")).decode("UTF-8")
+            for key, value in variables.items()
+        },
+    }
+
+
+def session_storage_settings(workshop_spec, variables):
+    """Returns the size of the persistent volume to claim for the workshop
+    session, and the name of and sub path within any existing volume to use
+    instead."""
+
+    resources = workshop_spec.get("session", {}).get("resources", {})
+
+    storage = resources.get("storage")
+
+    storage_volume_name = substitute_variables(
+        resources.get("volume", {}).get("name", ""), variables
+    )
+
+    storage_volume_subpath = ""
+
+    if storage_volume_name:
+        storage = None
+
+        storage_volume_subpath = substitute_variables(
+            resources.get("volume", {}).get("subPath", ""), variables
+        )
+
+    return storage, storage_volume_name, storage_volume_subpath
+
+
+def session_volume_subpath(storage_volume_subpath, path):
+    """Returns the sub path within the workshop data volume for a directory."""
+
+    if storage_volume_subpath:
+        return f"{storage_volume_subpath}/{path}"
+
+    return path
+
+
+def session_workshop_memory(workshop_spec, applications):
+    """Returns the memory to be allocated to the workshop container."""
+
+    default_memory = "512Mi"
+
+    if applications.is_enabled("editor"):
+        default_memory = "1Gi"
+
+    return (
+        workshop_spec.get("session", {})
+        .get("resources", {})
+        .get("memory", default_memory)
+    )
+
+
+def render_session_deployment(
+    workshop_spec,
+    variables,
+    labels,
+    environment,
+    workshop_memory,
+    workshop_config_secret_name,
+    base_workshop_image,
+    storage,
+    storage_volume_name,
+    storage_volume_subpath,
+):
+    """Returns the deployment for the workshop instance, before anything
+    added for enabled applications and before patches from the workshop
+    definition are applied. The environment holds the values of those
+    environment variables of the workshop container not derived from the
+    session variables."""
+
+    session_namespace = variables["session_namespace"]
+
+    workshop_image = variables["workshop_image"]
+    workshop_image_pull_policy = variables["workshop_image_pull_policy"]
+
+    base_workshop_image_pull_policy = image_pull_policy(base_workshop_image)
+
+    workshop_env_from = substitute_variables(
+        workshop_spec.get("session", {}).get("envFrom", []), variables
+    )
+
+    workshop_env = {
+        "GOOGLE_TRACKING_ID": environment["GOOGLE_TRACKING_ID"],
+        "CLARITY_TRACKING_ID": environment["CLARITY_TRACKING_ID"],
+        "AMPLITUDE_TRACKING_ID": environment["AMPLITUDE_TRACKING_ID"],
+        "ENVIRONMENT_NAME": variables["environment_name"],
+        "WORKSHOP_NAME": variables["workshop_name"],
+        "WORKSHOP_VERSION": variables["workshop_version"],
+        "WORKSHOP_NAMESPACE": variables["workshop_namespace"],
+        "SESSION_NAMESPACE": session_namespace,
+        "SESSION_NAME": variables["session_name"],
+        "SESSION_ID": variables["session_id"],
+        "SESSION_URL": variables["session_url"],
+        "SESSION_HOSTNAME": variables["session_hostname"],
+        "AUTH_USERNAME": environment["AUTH_USERNAME"],
+        "AUTH_PASSWORD": environment["AUTH_PASSWORD"],
+        "GATEWAY_PORT": "10080",
+        "CLUSTER_DOMAIN": variables["cluster_domain"],
+        "INGRESS_DOMAIN": variables["ingress_domain"],
+        "INGRESS_PORT_SUFFIX": "",
+        "INGRESS_PROTOCOL": variables["ingress_protocol"],
+        "SESSION_COOKIE_DOMAIN": environment["SESSION_COOKIE_DOMAIN"],
+        "IMAGE_REPOSITORY": variables["image_repository"],
+        "OCI_IMAGE_CACHE": variables["oci_image_cache"],
+        "ASSETS_REPOSITORY": variables["assets_repository"],
+        "INGRESS_CLASS": variables["ingress_class"],
+        "STORAGE_CLASS": variables["storage_class"],
+        "POLICY_ENGINE": CLUSTER_SECURITY_POLICY_ENGINE,
+        "POLICY_NAME": environment["POLICY_NAME"],
+        "SERVICES_PASSWORD": variables["services_password"],
+        "CONFIG_PASSWORD": variables["config_password"],
+    }
+
+    workshop_labels = dict(
+        labels,
+        **{
+            "training.educates.dev/application": "workshop",
+            "training.educates.dev/session.services.workshop": "true",
+        },
+    )
+
+    deployment_body = {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {
+            "name": session_namespace,
+            "namespace": variables["workshop_namespace"],
+            "labels": workshop_labels,
+        },
+        "spec": {
+            "replicas": 1,
+            "selector": {"matchLabels": {"deployment": session_namespace}},
+            "strategy": {"type": "Recreate"},
+            "template": {
+                "metadata": {
+                    "labels": dict(workshop_labels, deployment=session_namespace),
+                },
+                "spec": {
+                    "serviceAccountName": variables["service_account"],
+                    "securityContext": {
+                        "fsGroup": CLUSTER_STORAGE_GROUP,
+                        "supplementalGroups": [CLUSTER_STORAGE_GROUP],
+                    },
+                    "enableServiceLinks": False,
+                    "initContainers": [],
+                    "containers": [
+                        {
+                            "name": "workshop",
+                            "image": workshop_image,
+                            "imagePullPolicy": workshop_image_pull_policy,
+                            "securityContext": {
+                                "allowPrivilegeEscalation": False,
+                                "capabilities": {"drop": ["ALL"]},
+                                "runAsNonRoot": True,
+                                # "seccompProfile": {"type": "RuntimeDefault"},
+                                "privileged": False,
+                            },
+                            "resources": {
+                                "requests": {"memory": workshop_memory},
+                                "limits": {"memory": workshop_memory},
+                            },
+                            "ports": [
+                                {
+                                    "name": "10080-tcp",
+                                    "containerPort": 10080,
+                                    "protocol": "TCP",
+                                }
+                            ],
+                            "envFrom": workshop_env_from,
+                            "env": [
+                                {"name": name, "value": value}
+                                for name, value in workshop_env.items()
+                            ],
+                            "volumeMounts": [
+                                {
+                                    "name": "workshop-config",
+                                    "mountPath": "/opt/eduk8s/config",
+                                },
+                                {
+                                    "name": "workshop-theme",
+                                    "mountPath": "/opt/eduk8s/theme",
+                                },
+                            ],
+                        },
+                    ],
+                    "volumes": [
+                        {
+                            "name": "workshop-config",
+                            "secret": {"secretName": workshop_config_secret_name},
+                        },
+                        {
+                            "name": "workshop-theme",
+                            "secret": {"secretName": "workshop-theme"},
+                        },
+                    ],
+                    "hostAliases": [],
+                },
+            },
+        },
+    }
+
+    deployment_pod_template_spec = deployment_body["spec"]["template"]["spec"]
+
+    if RUNTIME_CLASS:
+        deployment_pod_template_spec["runtimeClassName"] = RUNTIME_CLASS
+
+    token_enabled = (
+        workshop_spec["session"]
+        .get("namespaces", {})
+        .get("security", {})
+        .get("token", {})
+        .get("enabled", True)
+    )
+
+    deployment_pod_template_spec["automountServiceAccountToken"] = False
+
+    deployment_pod_template_spec["volumes"].append(
+        {
+            "name": "cluster-token",
+            "secret": {"secretName": f"{session_namespace}-token"},
+        },
+    )
+
+    if token_enabled:
+        deployment_pod_template_spec["containers"][0]["volumeMounts"].append(
+            {
+                "name": "cluster-token",
+                "mountPath": "/var/run/secrets/kubernetes.io/serviceaccount",
+                "readOnly": True,
+            },
+        )
+
+    if INGRESS_CA_SECRET:
+        deployment_pod_template_spec["volumes"].extend(
+            [
+                {
+                    "name": "workshop-ca",
+                    "secret": {
+                        "secretName": INGRESS_CA_SECRET,
+                    },
+                },
+                {
+                    "name": "workshop-ca-trust",
+                    "emptyDir": {},
+                },
+            ]
+        )
+
+        certificates_init_container = {
+            "name": "ca-trust-store-initialization",
+            "image": base_workshop_image,
+            "imagePullPolicy": base_workshop_image_pull_policy,
+            "securityContext": {
+                "allowPrivilegeEscalation": False,
+                # Not sure why can't drop all capabilities here.
+                # "capabilities": {"drop": ["ALL"]},
+                "runAsNonRoot": False,
+                "runAsUser": 0,
+                # "seccompProfile": {"type": "RuntimeDefault"},
+            },
+            "command": ["/opt/eduk8s/sbin/setup-certificates"],
+            "resources": {
+                "requests": {"memory": workshop_memory},
+                "limits": {"memory": workshop_memory},
+            },
+            "volumeMounts": [
+                {
+                    "name": "workshop-ca",
+                    "mountPath": "/etc/pki/ca-trust/source/anchors/Cluster_Ingress_CA.pem",
+                    # "readOnly": True,
+                    "subPath": "ca.crt",
+                },
+                {"name": "workshop-ca-trust", "mountPath": "/mnt"},
+            ],
+        }
+
+        deployment_pod_template_spec["initContainers"].append(
+            certificates_init_container
+        )
+
+        deployment_pod_template_spec["containers"][0]["volumeMounts"].append(
+            {
+                "name": "workshop-ca-trust",
+                "mountPath": "/etc/pki/ca-trust",
+                "readOnly": True,
+            },
+        )
+
+    workshop_volume_subpath = session_volume_subpath(
+        storage_volume_subpath, "home/eduk8s"
+    )
+
+    if storage_volume_name:
+        deployment_pod_template_spec["volumes"].append(
+            {
+                "name": "workshop-data",
+                "persistentVolumeClaim": {"claimName": storage_volume_name},
+            }
+        )
+
+    elif storage:
+        deployment_pod_template_spec["volumes"].append(
+            {
+                "name": "workshop-data",
+                "persistentVolumeClaim": {"claimName": session_namespace},
+            }
+        )
+
+    else:
+        deployment_pod_template_spec["volumes"].append(
+            {"name": "workshop-data", "emptyDir": {}}
+        )
+
+    deployment_pod_template_spec["containers"][0]["volumeMounts"].extend(
+        [
+            {
+                "name": "workshop-data",
+                "mountPath": f"/{path}",
+                "subPath": session_volume_subpath(storage_volume_subpath, path),
+            }
+            for path in (
+                "home/eduk8s",
+                "opt/assets",
+                "opt/packages",
+                "opt/git/repositories",
+            )
+        ]
+    )
+
+    # Since using at least an emptyDir for workshop user home directory we
+    # must always use an init container to copy the home directory from the
+    # workshop image to the volume.
+
+    if CLUSTER_STORAGE_USER:
+        # This hack is to cope with Kubernetes clusters which don't properly
+        # set up persistent volume ownership. IBM Kubernetes is one example.
+        # The init container runs as root and sets permissions on the
+        # storage and ensures it is group writable. Note that this will only
+        # work where pod security policies are not enforced. Don't attempt
+        # to use it if they are. If they are, this hack should not be
+        # required.
+
+        volume_init_container = {
+            "name": "storage-permissions-initialization",
+            "image": base_workshop_image,
+            "imagePullPolicy": base_workshop_image_pull_policy,
+            "securityContext": {
+                "allowPrivilegeEscalation": False,
+                "capabilities": {"drop": ["ALL"]},
+                "runAsNonRoot": False,
+                "runAsUser": 0,
+                # "seccompProfile": {"type": "RuntimeDefault"},
+            },
+            "command": ["/bin/sh", "-c"],
+            "args": [
+                f"chown {CLUSTER_STORAGE_USER}:{CLUSTER_STORAGE_GROUP} /mnt && chmod og+rwx /mnt"
+            ],
+            "resources": {
+                "requests": {"memory": workshop_memory},
+                "limits": {"memory": workshop_memory},
+            },
+            "volumeMounts": [{"name": "workshop-data", "mountPath": "/mnt"}],
+        }
+
+        deployment_pod_template_spec["initContainers"].append(volume_init_container)
+
+    workshop_init_container = {
+        "name": "workshop-volume-initialization",
+        "image": workshop_image,
+        "imagePullPolicy": workshop_image_pull_policy,
+        "securityContext": {
+            "allowPrivilegeEscalation": False,
+            "capabilities": {"drop": ["ALL"]},
+            "runAsNonRoot": True,
+            # "seccompProfile": {"type": "RuntimeDefault"},
+        },
+        "command": [
+            "/opt/eduk8s/sbin/setup-volume",
+            "/home/eduk8s",
+            f"/mnt/{workshop_volume_subpath}",
+        ],
+        "resources": {
+            "requests": {"memory": workshop_memory},
+            "limits": {"memory": workshop_memory},
+        },
+        "volumeMounts": [{"name": "workshop-data", "mountPath": "/mnt"}],
+    }
+
+    deployment_pod_template_spec["initContainers"].append(workshop_init_container)
+
+    return deployment_body
+
+
+def apply_environment_patch(deployment_body, patch, variables):
+    """Merges environment variable overrides into those of the workshop
+    container of the deployment for the workshop instance."""
+
+    if not patch:
+        return
+
+    patch = substitute_variables(patch, variables)
+
+    container = deployment_body["spec"]["template"]["spec"]["containers"][0]
+
+    if container.get("env") is None:
+        container["env"] = patch
+    else:
+        smart_overlay_merge(container["env"], patch)
+
+
+def apply_session_patches(deployment_body, template, workshop_spec, spec, variables):
+    """Adds any init containers specified in the workshop definition to the
+    deployment for the workshop instance, then applies the pod template
+    patches from enabled applications and the workshop definition, and any
+    environment variable overrides for the workshop and workshop session."""
+
+    deployment_pod_template_spec = deployment_body["spec"]["template"]["spec"]
+
+    session_init_containers = workshop_spec["session"].get("initContainers", [])
+
+    session_init_containers = substitute_variables(session_init_containers, variables)
+
+    deployment_pod_template_spec["initContainers"].extend(session_init_containers)
+
+    # If the target item is a list, look for items within that which have a
+    # name field that matches a named item in the patch and attempt to merge
+    # that with one in the target, but don't do this if the item in the target
+    # was added by the patch as that is likely an attempt to deliberately add
+    # two named items, such as in the case of volume mounts.
+
+    for deployment_patch in template["pod_template_spec_patches"]:
+        deployment_patch = substitute_variables(deployment_patch, variables)
+        smart_overlay_merge(deployment_pod_template_spec, deployment_patch)
+
+    if workshop_spec.get("session"):
+        deployment_patch = workshop_spec["session"].get("patches", {})
+        deployment_patch = substitute_variables(deployment_patch, variables)
+        smart_overlay_merge(deployment_pod_template_spec, deployment_patch)
+
+    if workshop_spec.get("session"):
+        apply_environment_patch(
+            deployment_body, workshop_spec["session"].get("env", []), variables
+        )
+
+    apply_environment_patch(
+        deployment_body, spec.get("session", {}).get("env", []), variables
+    )
+
+
+def render_ssh_keys_secret(session_namespace, workshop_namespace, variables, labels):
+    """Returns the secret holding the SSH key pair for the workshop session."""
+
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {
+            "name": f"{session_namespace}-ssh-keys",
+            "namespace": workshop_namespace,
+            "labels": dict(labels),
+        },
+        "data": {
+            "id_rsa": base64.b64encode(
+                variables["ssh_private_key"].encode("utf-8")
+            ).decode("utf-8"),
+            "id_rsa.pub": base64.b64encode(
+                variables["ssh_public_key"].encode("utf-8")
+            ).decode("utf-8"),
+        },
+    }
+
+
+def add_session_volumes(deployment_body, workshop_spec, variables):
+    """Adds the volume for the SSH key pair and any volumes from the workshop
+    definition to the deployment for the workshop instance, along with host
+    aliases for the ingresses of the workshop session. The volume mounts from
+    the workshop definition are only applied to the workshop container."""
+
+    session_namespace = variables["session_namespace"]
+
+    deployment_pod_template_spec = deployment_body["spec"]["template"]["spec"]
+
+    deployment_pod_template_spec["volumes"].append(
+        {
+            "name": "ssh-keys",
+            "secret": {
+                "secretName": f"{session_namespace}-ssh-keys",
+                "defaultMode": 0o600,
+            },
+        },
+    )
+
+    deployment_pod_template_spec["containers"][0]["volumeMounts"].append(
+        {
+            "name": "ssh-keys",
+            "mountPath": "/opt/ssh-keys",
+            "readOnly": True,
+        },
+    )
+
+    extra_volumes_list = workshop_spec["session"].get("volumes", [])
+    extra_volume_mounts_list = workshop_spec["session"].get("volumeMounts", [])
+
+    if extra_volumes_list:
+        deployment_pod_template_spec["volumes"].extend(
+            substitute_variables(extra_volumes_list, variables)
+        )
+
+    if extra_volume_mounts_list:
+        deployment_pod_template_spec["containers"][0]["volumeMounts"].extend(
+            substitute_variables(extra_volume_mounts_list, variables)
+        )
+
+    # Add host aliases for the ports which ingresses are targeting. This is
+    # so thay can be accessed by hostname rather than by localhost. If follow
+    # convention of accessing by hostname then can be compatible if workshop
+    # deployed with docker-compose. Note that originally was using suffixes
+    # for the ingress name but switched to a prefix as DNS resolvers like
+    # nip.io support a prefix on a hostname consisting of an IP address which
+    # could also be useful when using docker-compose.
+    #
+    # Note this probably isn't needed now as when host is defined for ingress
+    # implicitly proxy to localhost anyway and so don't need these special host
+    # names for embedded components.
+
+    hostnames = [
+        f"console-{session_namespace}",
+        f"editor-{session_namespace}",
+        # Suffix use is deprecated. See prior note.
+        f"{session_namespace}-console",
+        f"{session_namespace}-editor",
+    ]
+
+    for ingress in workshop_spec["session"].get("ingresses", []):
+        hostnames.append(f"{ingress['name']}-{session_namespace}")
+
+        # Suffix use is deprecated. See prior note.
+
+        hostnames.append(f"{session_namespace}-{ingress['name']}")
+
+    deployment_pod_template_spec["hostAliases"].append(
+        {
+            "ip": "127.0.0.1",
+            "hostnames": hostnames,
+        }
+    )
+
+
+def render_session_service(
+    session_namespace, workshop_namespace, applications, labels
+):
+    """Returns the service for accessing the workshop instance from within
+    the cluster."""
+
+    service_body = {
+        "apiVersion": "v1",
+        "kind": "Service",
+        "metadata": {
+            "name": session_namespace,
+            "namespace": workshop_namespace,
+            "labels": dict(labels, **{"training.educates.dev/application": "workshop"}),
+        },
+        "spec": {
+            "type": "ClusterIP",
+            "ports": [
+                {
+                    "name": "80-tcp",
+                    "port": 80,
+                    "protocol": "TCP",
+                    "targetPort": 10080,
+                }
+            ],
+            "selector": {"deployment": session_namespace},
+        },
+    }
+
+    if applications.is_enabled("sshd"):
+        service_body["spec"]["ports"].append(
+            {
+                "name": "22-tcp",
+                "port": 22,
+                "protocol": "TCP",
+                "targetPort": 2022,
+            }
+        )
+
+    return service_body
+
+
+def render_session_ingress(
+    session_namespace,
+    workshop_namespace,
+    session_hostname,
+    workshop_spec,
+    applications,
+    labels,
+):
+    """Returns the ingress for the workshop instance, including the host
+    names for embedded applications and any extra named ingresses."""
+
+    def _ingress_rule(host, path, service, port):
+        return {
+            "host": host,
+            "http": {
+                "paths": [
+                    {
+                        "path": path,
+                        "pathType": "Prefix",
+                        "backend": {
+                            "service": {
+                                "name": service,
+                                "port": {"number": port},
+                            }
+                        },
+                    }
+                ]
+            },
+        }
+
+    ingress_rules = [_ingress_rule(session_hostname, "/", session_namespace, 80)]
+
+    websocket_routes = ["/"]
+
+    if applications.is_enabled("sshd") and applications.property(
+        "sshd", "tunnel.enabled", False
+    ):
+        ingress_rules.insert(
+            0, _ingress_rule(session_hostname, "/tunnel/", "tunnel-manager", 8080)
+        )
+
+        websocket_routes.append("/tunnel/")
+
+    ingresses = []
+    ingress_hostnames = []
+
+    if workshop_spec.get("session"):
+        ingresses = workshop_spec["session"].get("ingresses", [])
+
+    if applications.is_enabled("console"):
+        ingress_hostnames.append(f"console-{session_namespace}.{INGRESS_DOMAIN}")
+        # Suffix use is deprecated.
+        ingress_hostnames.append(f"{session_namespace}-console.{INGRESS_DOMAIN}")
+    if applications.is_enabled("editor"):
+        ingress_hostnames.append(f"editor-{session_namespace}.{INGRESS_DOMAIN}")
+        # Suffix use is deprecated.
+        ingress_hostnames.append(f"{session_namespace}-editor.{INGRESS_DOMAIN}")
+
+    for ingress in ingresses:
+        ingress_hostnames.append(
+            f"{ingress['name']}-{session_namespace}.{INGRESS_DOMAIN}"
+        )
+        # Suffix use is deprecated.
+        ingress_hostnames.append(
+            f"{session_namespace}-{ingress['name']}.{INGRESS_DOMAIN}"
+        )
+
+    for ingress_hostname in ingress_hostnames:
+        ingress_rules.append(
+            _ingress_rule(ingress_hostname, "/", session_namespace, 80)
+        )
+
+    ingress_body = {
+        "apiVersion": "networking.k8s.io/v1",
+        "kind": "Ingress",
+        "metadata": {
+            "name": session_namespace,
+            "namespace": workshop_namespace,
+            "annotations": {
+                "nginx.ingress.kubernetes.io/enable-cors": "true",
+                "nginx.ingress.kubernetes.io/proxy-send-timeout": "3600",
+                "nginx.ingress.kubernetes.io/proxy-read-timeout": "3600",
+                "projectcontour.io/websocket-routes": ",".join(websocket_routes),
+                "projectcontour.io/response-timeout": "3600s",
+            },
+            "labels": dict(labels, **{"training.educates.dev/application": "workshop"}),
+        },
+        "spec": {
+            "rules": ingress_rules,
+        },
+    }
+
+    if INGRESS_SECRET:
+        ingress_body["metadata"]["annotations"].update(
+            {
+                "ingress.kubernetes.io/force-ssl-redirect": "true",
+                "nginx.ingress.kubernetes.io/ssl-redirect": "true",
+                "nginx.ingress.kubernetes.io/force-ssl-redirect": "true",
+            }
+        )
+
+        ingress_body["spec"]["tls"] = [
+            {
+                "hosts": [session_hostname] + ingress_hostnames,
+                "secretName": INGRESS_SECRET,
+            }
+        ]
+
+    if INGRESS_CLASS:
+        ingress_body["spec"]["ingressClassName"] = INGRESS_CLASS
+
+    return ingress_body
+
+
+def shared_registry_host(workshop_namespace):
+    """Returns the host name of the image registry shared by all workshop
+    sessions of a workshop environment."""
+
+    return f"registry-{workshop_namespace}.{INGRESS_DOMAIN}"
+
+
+def apply_registry_credentials(
+    applications, workshop_namespace, session_namespace, registry_password
+):
+    """Records the host name of the image registry for the workshop session,
+    and the credentials for accessing it, in the properties for the image
+    registry application, where they are used when rendering resources."""
+
+    if applications.property("registry", "shared", False):
+        registry_host = shared_registry_host(workshop_namespace)
+    else:
+        registry_host = f"registry-{session_namespace}.{INGRESS_DOMAIN}"
+
+    registry_username = session_namespace
+
+    registry_auth_token = (
+        base64.b64encode(f"{registry_username}:{registry_password}".encode("utf-8"))
+        .decode("ascii")
+        .strip()
+    )
+
+    properties = applications.properties("registry")
+
+    properties["host"] = registry_host
+    properties["username"] = registry_username
+    properties["password"] = registry_password
+    properties["basic_auth_token"] = registry_auth_token
+    properties["secret"] = "educates-registry-credentials"
+
+
+def add_application_labels(deployment_body, applications):
+    """Adds a label to the deployment for the workshop instance for each
+    application which is enabled."""
+
+    application_labels = {
+        f"training.educates.dev/session.applications.{application.lower()}": "true"
+        for application in applications
+        if applications.is_enabled(application)
+    }
+
+    deployment_body["metadata"]["labels"].update(application_labels)
+    deployment_body["spec"]["template"]["metadata"]["labels"].update(
+        application_labels
+    )
+
+
+def render_console_objects(session_namespace, applications, labels):
+    """Returns the resources required in the session namespace by the web
+    console."""
+
+    if not applications.is_enabled("console"):
+        return []
+
+    if applications.property("console", "vendor", "kubernetes") != "kubernetes":
+        return []
+
+    return [
+        {
+            "apiVersion": "v1",
+            "kind": "Secret",
+            "metadata": {
+                "name": "kubernetes-dashboard-csrf",
+                "namespace": session_namespace,
+                "labels": dict(labels),
+            },
+        }
+    ]
+
+
+def add_docker_daemon(
+    deployment_body,
+    applications,
+    variables,
+    labels,
+    storage_volume_name,
+    storage_volume_subpath,
+    dockerd_image,
+):
+    """Adds the docker daemon to the deployment for the workshop instance as a
+    sidecar container, along with a container running docker compose if any
+    services are defined for it. Returns the persistent volume claim for the
+    storage used by the docker daemon and the config map holding the docker
+    compose configuration, where these are required."""
+
+    if not applications.is_enabled("docker"):
+        return []
+
+    session_namespace = variables["session_namespace"]
+    workshop_namespace = variables["workshop_namespace"]
+
+    deployment_pod_template_spec = deployment_body["spec"]["template"]["spec"]
+
+    workshop_volume_subpath = session_volume_subpath(
+        storage_volume_subpath, "home/eduk8s"
+    )
+
+    resource_objects = []
+
+    docker_volumes = [{"name": "docker-socket", "emptyDir": {}}]
+
+    docker_volume_subpath = session_volume_subpath(
+        storage_volume_subpath, "var/lib/docker"
+    )
+
+    if not storage_volume_name:
+        docker_volumes.append(
+            {
+                "name": "docker-data",
+                "persistentVolumeClaim": {"claimName": f"{session_namespace}-docker"},
+            }
+        )
+
+    deployment_pod_template_spec["volumes"].extend(docker_volumes)
+
+    docker_compose = applications.property("docker", "compose", {})
+    docker_socket = applications.property("docker", "socket.enabled", None)
+
+    if docker_socket or (docker_socket is None and not docker_compose):
+        deployment_pod_template_spec["containers"][0]["volumeMounts"].append(
+            {
+                "name": "docker-socket",
+                "mountPath": "/var/run/docker",
+                "readOnly": True,
+            }
+        )
+
+    docker_memory = applications.property("docker", "memory", "768Mi")
+    docker_storage = applications.property("docker", "storage", "5Gi")
+
+    dockerd_image_pull_policy = image_pull_policy(dockerd_image)
+
+    # Build args for dockerd daemon ahead of inection into the pod's args list
+
+    dockerd_daemon_args = [
+        "--host=unix:///var/run/workshop/docker.sock",
+        f"--mtu={DOCKERD_MTU}",
+    ]
+
+    if applications.is_enabled("registry"):
+        if not INGRESS_SECRET:
+            dockerd_daemon_args.append(
+                f"--insecure-registry={applications.property('registry', 'host')}"
+            )
+
+    if DOCKERD_MIRROR_REMOTE:
+        dockerd_daemon_args.extend(
+            [
+                f"--insecure-registry={workshop_namespace}-mirror",
+                f"--registry-mirror=http://{workshop_namespace}-mirror:5000",
+            ]
+        )
+
+    dockerd_args = [
+        "/bin/sh",
+        "-c",
+        f"mkdir -p /var/run/workshop && ln -s /var/run/workshop/docker.sock /var/run/docker.sock && (test -f /usr/local/share/ca-certificates/Cluster_Ingress_CA.crt && /usr/sbin/update-ca-certificates || true) && dockerd {' '.join(dockerd_daemon_args)}",
+    ]
+
+    docker_container = {
+        "name": "docker",
+        "image": dockerd_image,
+        "imagePullPolicy": dockerd_image_pull_policy,
+        "args": dockerd_args,
+        "securityContext": {
+            "allowPrivilegeEscalation": True,
+            "privileged": True,
+            "runAsUser": 0,
+            "capabilities": {"drop": ["KILL", "MKNOD", "SETUID", "SETGID"]},
+            # "seccompProfile": {"type": "RuntimeDefault"},
+        },
+        "resources": {
+            "limits": {"memory": docker_memory},
+            "requests": {"memory": docker_memory},
+        },
+        "volumeMounts": [
+            {
+                "name": "docker-socket",
+                "mountPath": "/var/run/workshop",
+            },
+            {
+                "name": "workshop-data",
+                "mountPath": "/home/eduk8s",
+                "subPath": workshop_volume_subpath,
+            },
+            {
+                "name": "workshop-data" if storage_volume_name else "docker-data",
+                "mountPath": "/var/lib/docker",
+                "subPath": docker_volume_subpath,
+            },
+        ],
+    }
+
+    if INGRESS_CA_SECRET:
+        docker_container["volumeMounts"].append(
+            {
+                "name": "workshop-ca",
+                "mountPath": "/usr/local/share/ca-certificates/Cluster_Ingress_CA.crt",
+                # "readOnly": True,
+                "subPath": "ca.crt",
+            },
+        )
+
+    deployment_pod_template_spec["containers"].append(docker_container)
+
+    deployment_body["metadata"]["labels"].update(
+        {"training.educates.dev/session.services.docker": "true"}
+    )
+    deployment_body["spec"]["template"]["metadata"]["labels"].update(
+        {"training.educates.dev/session.services.docker": "true"}
+    )
+
+    if not storage_volume_name:
+        docker_persistent_volume_claim = {
+            "apiVersion": "v1",
+            "kind": "PersistentVolumeClaim",
+            "metadata": {
+                "name": f"{session_namespace}-docker",
+                "namespace": workshop_namespace,
+                "labels": dict(labels),
+            },
+            "spec": {
+                "accessModes": [
+                    "ReadWriteOnce",
+                ],
+                "resources": {
+                    "requests": {
+                        "storage": docker_storage,
+                    }
+                },
+            },
+        }
+
+        if CLUSTER_STORAGE_CLASS:
+            docker_persistent_volume_claim["spec"][
+                "storageClassName"
+            ] = CLUSTER_STORAGE_CLASS
+
+        resource_objects.append(docker_persistent_volume_claim)
+
+    if docker_compose:
+        # Where a volume mount references the named volume "workshop"
+        # convert that to a bind mount of workshop home directory. We
+        # should probably block certain types of mounts but allow
+        # everything for now.
+
+        docker_compose_services = xget(docker_compose, "services", {})
+
+        for docker_compose_service in docker_compose_services.values():
+            docker_compose_service_volumes = []
+
+            for volume_details in xget(docker_compose_service, "volumes", []):
+                if xget(volume_details, "type") == "volume" and (
+                    xget(volume_details, "source") == "workshop"
+                ):
+                    docker_compose_service_volumes.append(
+                        {
+                            "type": "bind",
+                            "source": "/home/eduk8s",
+                            "target": xget(volume_details, "target"),
+                        }
+                    )
+                else:
+                    docker_compose_service_volumes.append(volume_details)
+
+            docker_compose_service["volumes"] = docker_compose_service_volumes
+
+        docker_compose_config_map_body = {
+            "apiVersion": "v1",
+            "kind": "ConfigMap",
+            "metadata": {
+                "name": f"{session_namespace}-docker-compose",
+                "namespace": workshop_namespace,
+                "labels": dict(labels),
+            },
+            "data": {
+                "compose-dev.yaml": yaml.dump(
+                    substitute_variables(docker_compose, variables),
+                    Dumper=yaml.Dumper,
+                )
+            },
+        }
+
+        resource_objects.append(docker_compose_config_map_body)
+
+        docker_compose_container = {
+            "name": "docker-compose",
+            "image": dockerd_image,
+            "imagePullPolicy": dockerd_image_pull_policy,
+            "command": [
+                "docker",
+                "--host=unix:///var/run/docker/docker.sock",
+                "compose",
+                "--file=/opt/eduk8s/config/compose-dev.yaml",
+                "--project-directory=/home/eduk8s",
+                f"--project-name={session_namespace}",
+                "up",
+            ],
+            "securityContext": {
+                "allowPrivilegeEscalation": False,
+                "capabilities": {"drop": ["ALL"]},
+                "runAsNonRoot": True,
+                "runAsUser": 1001,
+                "runAsGroup": 2375,
+                # "seccompProfile": {"type": "RuntimeDefault"},
+            },
+            "resources": {
+                "limits": {"memory": "256Mi"},
+                "requests": {"memory": "32Mi"},
+            },
+            "env": [{"name": "HOME", "value": "/home/eduk8s"}],
+            "volumeMounts": [
+                {
+                    "name": "docker-socket",
+                    "mountPath": "/var/run/docker",
+                    "readOnly": True,
+                },
+                {
+                    "name": "compose-config",
+                    "mountPath": "/opt/eduk8s/config",
+                },
+                {
+                    "name": "workshop-data",
+                    "mountPath": "/home/eduk8s",
+                    "subPath": workshop_volume_subpath,
+                },
+            ],
+        }
+
+        deployment_pod_template_spec["volumes"].append(
+            {
+                "name": "compose-config",
+                "configMap": {
+                    "name": f"{session_namespace}-docker-compose",
+                },
+            }
+        )
+
+        deployment_pod_template_spec["containers"].append(docker_compose_container)
+
+    return [
+        substitute_variables(object_body, variables) for object_body in resource_objects
+    ]
+
+
+def add_image_registry(
+    deployment_body,
+    applications,
+    variables,
+    labels,
+    registry_htpasswd_hash,
+    registry_image,
+):
+    """Adds the configuration for accessing the image registry to the
+    workshop container of the deployment for the workshop instance. Returns
+    the config map holding the credentials for the image registry, and unless
+    the image registry is shared by all workshop sessions, the persistent
+    volume claim, deployment, service and ingress for the image registry. The
+    host name and credentials for the image registry must already have been
+    recorded using apply_registry_credentials()."""
+
+    if not applications.is_enabled("registry"):
+        return []
+
+    session_namespace = variables["session_namespace"]
+    workshop_namespace = variables["workshop_namespace"]
+
+    registry_host = applications.property("registry", "host")
+    registry_username = applications.property("registry", "username")
+    registry_auth_token = applications.property("registry", "basic_auth_token")
+
+    apply_environment_patch(
+        deployment_body,
+        [
+            {"name": "REGISTRY_HOST", "value": registry_host},
+            {"name": "REGISTRY_USERNAME", "value": registry_username},
+            {
+                "name": "REGISTRY_PASSWORD",
+                "value": applications.property("registry", "password"),
+            },
+            {"name": "REGISTRY_AUTH_TOKEN", "value": registry_auth_token},
+            {
+                "name": "REGISTRY_SECRET",
+                "value": applications.property("registry", "secret"),
+            },
+        ],
+        variables,
+    )
+
+    deployment_body["spec"]["template"]["spec"]["volumes"].append(
+        {
+            "name": "registry",
+            "configMap": {
+                "name": f"{session_namespace}-registry",
+                "items": [{"key": "config.json", "path": "config.json"}],
+            },
+        }
+    )
+
+    deployment_body["spec"]["template"]["spec"]["containers"][0][
+        "volumeMounts"
+    ].append(
+        {
+            "name": "registry",
+            "mountPath": "/var/run/registry",
+        }
+    )
+
+    registry_config = {"auths": {registry_host: {"auth": f"{registry_auth_token}"}}}
+
+    registry_config_map_body = {
+        "apiVersion": "v1",
+        "kind": "ConfigMap",
+        "metadata": {
+            "name": f"{session_namespace}-registry",
+            "namespace": workshop_namespace,
+            "labels": dict(labels),
+        },
+        "data": {
+            "htpasswd": f"{registry_username}:{registry_htpasswd_hash}\n",
+            "config.json": json.dumps(registry_config, indent=4),
+        },
+    }
+
+    # When the image registry is shared by all workshop sessions of the
+    # workshop environment, the image registry itself is deployed with the
+    # workshop environment.
+
+    if applications.property("registry", "shared", False):
+        return [substitute_variables(registry_config_map_body, variables)]
+
+    registry_memory = applications.property("registry", "memory", "768Mi")
+    registry_storage = applications.property("registry", "storage", "5Gi")
+
+    registry_volume_name = substitute_variables(
+        applications.property("registry", "volume.name", ""), variables
+    )
+
+    registry_volume_subpath = "var/lib/registry"
+
+    if registry_volume_name:
+        registry_storage = None
+
+        registry_volume_subpath = session_volume_subpath(
+            substitute_variables(
+                applications.property("registry", "volume.subPath", ""), variables
+            ),
+            "var/lib/registry",
+        )
+
+    else:
+        registry_volume_name = f"{session_namespace}-registry"
+
+    registry_labels = dict(labels, **{"training.educates.dev/application": "registry"})
+
+    registry_service_labels = dict(
+        registry_labels, **{"training.educates.dev/session.services.registry": "true"}
+    )
+
+    registry_image_pull_policy = image_pull_policy(registry_image)
+
+    registry_deployment_body = {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {
+            "name": f"{session_namespace}-registry",
+            "namespace": workshop_namespace,
+            "labels": registry_service_labels,
+        },
+        "spec": {
+            "replicas": 1,
+            "selector": {
+                "matchLabels": {"deployment": f"{session_namespace}-registry"}
+            },
+            "strategy": {"type": "Recreate"},
+            "template": {
+                "metadata": {
+                    "labels": dict(
+                        registry_service_labels,
+                        deployment=f"{session_namespace}-registry",
+                    ),
+                },
+                "spec": {
+                    "serviceAccountName": "educates-services",
+                    "initContainers": [],
+                    "containers": [
+                        {
+                            "name": "registry",
+                            "image": registry_image,
+                            "imagePullPolicy": registry_image_pull_policy,
+                            "securityContext": {
+                                "allowPrivilegeEscalation": False,
+                                "capabilities": {"drop": ["ALL"]},
+                                "runAsNonRoot": True,
+                                # "seccompProfile": {"type": "RuntimeDefault"},
+                            },
+                            "resources": {
+                                "limits": {"memory": registry_memory},
+                                "requests": {"memory": registry_memory},
+                            },
+                            "ports": [{"containerPort": 5000, "protocol": "TCP"}],
+                            "env": [
+                                {
+                                    "name": "REGISTRY_STORAGE_DELETE_ENABLED",
+                                    "value": "true",
+                                },
+                                {"name": "REGISTRY_AUTH", "value": "htpasswd"},
+                                {
+                                    "name": "REGISTRY_AUTH_HTPASSWD_REALM",
+                                    "value": "Image Registry",
+                                },
+                                {
+                                    "name": "REGISTRY_AUTH_HTPASSWD_PATH",
+                                    "value": "/auth/htpasswd",
+                                },
+                            ],
+                            "volumeMounts": [
+                                {
+                                    "name": "data",
+                                    "mountPath": "/var/lib/registry",
+                                    "subPath": registry_volume_subpath,
+                                },
+                                {"name": "auth", "mountPath": "/auth"},
+                            ],
+                        }
+                    ],
+                    "securityContext": {
+                        "runAsUser": 1000,
+                        "fsGroup": CLUSTER_STORAGE_GROUP,
+                        "supplementalGroups": [CLUSTER_STORAGE_GROUP],
+                    },
+                    "volumes": [
+                        {
+                            "name": "data",
+                            "persistentVolumeClaim": {
+                                "claimName": registry_volume_name
+                            },
+                        },
+                        {
+                            "name": "auth",
+                            "configMap": {
+                                "name": f"{session_namespace}-registry",
+                                "items": [{"key": "htpasswd", "path": "htpasswd"}],
+                            },
+                        },
+                    ],
+                },
+            },
+        },
+    }
+
+    if CLUSTER_STORAGE_USER:
+        # This hack is to cope with Kubernetes clusters which don't
+        # properly set up persistent volume ownership. IBM
+        # Kubernetes is one example. The init container runs as root
+        # and sets permissions on the storage and ensures it is
+        # group writable. Note that this will only work where pod
+        # security policies are not enforced. Don't attempt to use
+        # it if they are. If they are, this hack should not be
+        # required.
+
+        registry_deployment_body["spec"]["template"]["spec"]["initContainers"].append(
+            {
+                "name": "storage-permissions-initialization",
+                "image": registry_image,
+                "imagePullPolicy": registry_image_pull_policy,
+                "securityContext": {
+                    "allowPrivilegeEscalation": False,
+                    "capabilities": {"drop": ["ALL"]},
+                    "runAsNonRoot": False,
+                    "runAsUser": 0,
+                    # "seccompProfile": {"type": "RuntimeDefault"},
+                },
+                "command": ["/bin/sh", "-c"],
+                "args": [
+                    f"chown {CLUSTER_STORAGE_USER}:{CLUSTER_STORAGE_GROUP} /mnt && chmod og+rwx /mnt"
+                ],
+                "resources": {
+                    "limits": {"memory": registry_memory},
+                    "requests": {"memory": registry_memory},
+                },
+                "volumeMounts": [{"name": "data", "mountPath": "/mnt"}],
+            }
+        )
+
+    registry_service_body = {
+        "apiVersion": "v1",
+        "kind": "Service",
+        "metadata": {
+            "name": f"{session_namespace}-registry",
+            "namespace": workshop_namespace,
+            "labels": dict(registry_labels),
+        },
+        "spec": {
+            "type": "ClusterIP",
+            "ports": [{"port": 5000, "targetPort": 5000}],
+            "selector": {"deployment": f"{session_namespace}-registry"},
+        },
+    }
+
+    registry_ingress_body = {
+        "apiVersion": "networking.k8s.io/v1",
+        "kind": "Ingress",
+        "metadata": {
+            "name": f"{session_namespace}-registry",
+            "namespace": workshop_namespace,
+            "annotations": {"nginx.ingress.kubernetes.io/proxy-body-size": "512m"},
+            "labels": dict(registry_labels),
+        },
+        "spec": {
+            "rules": [
+                {
+                    "host": registry_host,
+                    "http": {
+                        "paths": [
+                            {
+                                "path": "/",
+                                "pathType": "Prefix",
+                                "backend": {
+                                    "service": {
+                                        "name": f"{session_namespace}-registry",
+                                        "port": {"number": 5000},
+                                    }
+                                },
+                            }
+                        ]
+                    },
+                }
+            ]
+        },
+    }
+
+    if INGRESS_SECRET:
+        registry_ingress_body["metadata"]["annotations"].update(
+            {
+                "ingress.kubernetes.io/force-ssl-redirect": "true",
+                "nginx.ingress.kubernetes.io/ssl-redirect": "true",
+                "nginx.ingress.kubernetes.io/force-ssl-redirect": "true",
+            }
+        )
+
+        registry_ingress_body["spec"]["tls"] = [
+            {
+                "hosts": [registry_host],
+                "secretName": INGRESS_SECRET,
+            }
+        ]
+
+    registry_objects = [
+        registry_config_map_body,
+        registry_deployment_body,
+        registry_service_body,
+        registry_ingress_body,
+    ]
+
+    if registry_storage:
+        registry_persistent_volume_claim_body = {
+            "apiVersion": "v1",
+            "kind": "PersistentVolumeClaim",
+            "metadata": {
+                "name": f"{session_namespace}-registry",
+                "namespace": workshop_namespace,
+                "labels": dict(labels),
+            },
+            "spec": {
+                "accessModes": ["ReadWriteOnce"],
+                "resources": {"requests": {"storage": registry_storage}},
+            },
+        }
+
+        if CLUSTER_STORAGE_CLASS:
+            registry_persistent_volume_claim_body["spec"][
+                "storageClassName"
+            ] = CLUSTER_STORAGE_CLASS
+
+        registry_objects.insert(0, registry_persistent_volume_claim_body)
+
+    return [
+        substitute_variables(object_body, variables) for object_body in registry_objects
+    ]
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import functools
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .operator_config import BACKGROUND_HANDLER_WORKERS
+
+__all__ = ["background_handler", "configure_executors", "run_in_background"]
+
+logger = logging.getLogger("educates")
+
+# Handlers for work which isn't latency critical, such as creating workshop
+# environments and reserved workshop sessions, are run in a separate bounded
+# pool of worker threads. This ensures that a burst of such work cannot use up
+# all the worker threads kopf uses for synchronous handlers, which would
+# otherwise delay handlers for which a user is waiting, such as those for
+# workshop allocation requests.
+
+_background_executor = ThreadPoolExecutor(
+    max_workers=BACKGROUND_HANDLER_WORKERS, thread_name_prefix="background"
+)
+
+_foreground_executor = None
+
+
+def configure_executors(settings):
+    """Records the executor kopf uses to run synchronous handlers, so that a
+    background handler can be run there when it is deemed to be latency
+    critical. Must be called from the operator startup handler."""
+
+    global _foreground_executor  # pylint: disable=global-statement
+
+    _foreground_executor = settings.execution.executor
+
+
+def run_in_background(function, *args, **kwargs):
+    """Schedules a function to be run in the pool of worker threads for
+    background work, returning a future for the result."""
+
+    return _background_executor.submit(function, *args, **kwargs)
+
+
+def background_handler(function=None, *, foreground=None):
+    """Decorator for a synchronous kopf handler which should be run in the
+    pool of worker threads for background work. If a foreground predicate is
+    supplied, it is called with the handler arguments and when it returns
+    true, the handler is instead run using the same worker threads as kopf
+    uses for synchronous handlers. The decorator must be applied before the
+    kopf decorator registering the handler."""
+
+    if function is None:
+        return functools.partial(background_handler, foreground=foreground)
+
+    @functools.wraps(function)
+    async def wrapper(**kwargs):
+        executor = _background_executor
+
+        if foreground is not None and foreground(**kwargs):
+            executor = _foreground_executor
+
+        # As kopf does for synchronous handlers, the context is copied to the
+        # worker thread and the handler is shielded from cancellation so that
+        # the worker thread is not orphaned.
+
+        context = contextvars.copy_context()
+
+        loop = asyncio.get_running_loop()
+
+        future = loop.run_in_executor(
+            executor, functools.partial(context.run, function, **kwargs)
+        )
+
+        cancellation = None
+
+        while not future.done():
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError as exc:
+                cancellation = exc
+
+        if cancellation is not None:
+            raise cancellation
+
+        return future.result()
+
+    # Kopf follows the wrapped function when deciding whether a handler is a
+    # coroutine, so the reference is removed. The handler id is still derived
+    # from the name of the original function.
+
+    del wrapper.__wrapped__
+
+    return wrapper
@@ -0,0 +1,65 @@
+import hashlib
+import functools
+
+from .helpers import xget
+from .operator_config import SESSION_MANAGER_SHARD, SESSION_MANAGER_SHARDS
+
+__all__ = [
+    "shard_for",
+    "environment_is_local",
+    "session_is_local",
+    "labels_are_local",
+    "portal_is_local",
+    "portal_labels_are_local",
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def shard_for(name, shards=SESSION_MANAGER_SHARDS):
+    """Returns the shard responsible for the named resource. Rendezvous
+    hashing is used so that when the number of shards is changed, only the
+    resources belonging to shards which were added or removed move."""
+
+    if shards <= 1:
+        return 0
+
+    def weight(shard):
+        digest = hashlib.sha1(f"{shard}:{name}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    return max(range(shards), key=weight)
+
+
+def _is_local(name):
+    if SESSION_MANAGER_SHARDS <= 1:
+        return True
+
+    return shard_for(name) == SESSION_MANAGER_SHARD
+
+
+# The following are used as "when" filters on kopf handlers so that a replica
+# of the operator only handles resources belonging to its shard. Workshop
+# environments are sharded by their name, with workshop sessions, workshop
+# allocations and the resources created for them going to the same shard as
+# the workshop environment they belong to. This ensures that the indexes and
+# caches a replica keeps hold everything needed by the handlers it runs.
+
+
+def environment_is_local(name, **_):
+    return _is_local(name)
+
+
+def session_is_local(spec, **_):
+    return _is_local(xget(spec, "environment.name", ""))
+
+
+def labels_are_local(labels, **_):
+    return _is_local(labels.get("training.educates.dev/environment.name", ""))
+
+
+def portal_is_local(name, **_):
+    return _is_local(name)
+
+
+def portal_labels_are_local(labels, **_):
+    return _is_local(labels.get("training.educates.dev/portal.name", ""))
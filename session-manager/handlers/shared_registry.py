@@ -0,0 +1,449 @@
+"""Image registry shared by all workshop sessions of a workshop environment.
+
+Where enabled for a workshop, a single image registry is deployed in the
+workshop namespace instead of one for each workshop session. Each workshop
+session still has its own credentials for accessing the image registry. The
+htpasswd entry for a workshop session is added to a config map as a separate
+key when the workshop session is created, and removed when it is deleted. As
+removal relies on seeing the workshop session being deleted, the entries are
+also reconciled against the workshop sessions which exist at regular
+intervals.
+
+The image registry uses token authentication, with tokens issued by a sidecar
+container running the token issuer from the session manager image. The token
+issuer checks the credentials of a workshop session against the entries in the
+config map and only grants access to repositories under the path given by the
+name of the session namespace. A workshop session can therefore only pull,
+push and delete images under `$(session_namespace)/`, and can't access images
+pushed by other workshop sessions.
+"""
+
+import logging
+
+import pykube
+
+from .credentials import generate_token_certificate
+from .helpers import image_pull_policy, xget
+from .kubeclient import api
+from .objects import WorkshopEnvironment, WorkshopSession
+from .rendering import shared_registry_host
+from .sharding import environment_is_local
+from .operator_config import (
+    CLUSTER_STORAGE_CLASS,
+    CLUSTER_STORAGE_GROUP,
+    CLUSTER_STORAGE_USER,
+    DOCKER_REGISTRY_IMAGE,
+    INGRESS_PROTOCOL,
+    INGRESS_SECRET,
+    SESSION_MANAGER_IMAGE,
+)
+
+__all__ = [
+    "shared_registry_host",
+    "shared_registry_objects",
+    "add_shared_registry_user",
+    "remove_shared_registry_user",
+    "reconcile_shared_registry_users",
+]
+
+logger = logging.getLogger("educates")
+
+_token_issuer = "educates-registry-token-issuer"
+
+
+def _users_config_map_name(workshop_namespace):
+    return f"{workshop_namespace}-registry-users"
+
+
+def _token_secret_name(workshop_namespace):
+    return f"{workshop_namespace}-registry-token"
+
+
+def shared_registry_objects(workshop_namespace, memory, storage, labels):
+    """Returns the resources for the shared image registry, consisting of the
+    config map holding the htpasswd entries for workshop sessions and the
+    secret holding the key for signing tokens, plus the persistent volume
+    claim, deployment, service and ingress for the image registry itself."""
+
+    name = f"{workshop_namespace}-registry"
+    host = shared_registry_host(workshop_namespace)
+
+    selector = {"deployment": name}
+
+    registry_labels = dict(
+        labels, **{"training.educates.dev/environment.services.registry": "true"}
+    )
+
+    registry_image = DOCKER_REGISTRY_IMAGE
+    registry_image_pull_policy = image_pull_policy(registry_image)
+
+    security_context = {
+        "allowPrivilegeEscalation": False,
+        "capabilities": {"drop": ["ALL"]},
+        "runAsNonRoot": True,
+        # "seccompProfile": {"type": "RuntimeDefault"},
+    }
+
+    users_config_map_body = {
+        "apiVersion": "v1",
+        "kind": "ConfigMap",
+        "metadata": {
+            "namespace": workshop_namespace,
+            "name": _users_config_map_name(workshop_namespace),
+            "labels": labels,
+        },
+        "data": {},
+    }
+
+    # The key used by the token issuer to sign tokens, and the certificate
+    # used by the image registry to verify them, are generated once when the
+    # workshop environment is created.
+
+    token_key, token_certificate = generate_token_certificate(_token_issuer)
+
+    token_secret_body = {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {
+            "namespace": workshop_namespace,
+            "name": _token_secret_name(workshop_namespace),
+            "labels": labels,
+        },
+        "type": "kubernetes.io/tls",
+        "stringData": {"tls.key": token_key, "tls.crt": token_certificate},
+    }
+
+    persistent_volume_claim_body = {
+        "apiVersion": "v1",
+        "kind": "PersistentVolumeClaim",
+        "metadata": {
+            "namespace": workshop_namespace,
+            "name": name,
+            "labels": labels,
+        },
+        "spec": {
+            "accessModes": ["ReadWriteOnce"],
+            "resources": {"requests": {"storage": storage}},
+        },
+    }
+
+    if CLUSTER_STORAGE_CLASS:
+        persistent_volume_claim_body["spec"]["storageClassName"] = CLUSTER_STORAGE_CLASS
+
+    init_containers = []
+
+    if CLUSTER_STORAGE_USER:
+        # This hack is to cope with Kubernetes clusters which don't properly
+        # set up persistent volume ownership. See the equivalent for the
+        # registry mirror.
+
+        init_containers.append(
+            {
+                "name": "storage-permissions-initialization",
+                "image": registry_image,
+                "imagePullPolicy": registry_image_pull_policy,
+                "securityContext": {
+                    "allowPrivilegeEscalation": False,
+                    "capabilities": {"drop": ["ALL"]},
+                    "runAsNonRoot": False,
+                    "runAsUser": 0,
+                    # "seccompProfile": {"type": "RuntimeDefault"},
+                },
+                "command": ["/bin/sh", "-c"],
+                "args": [
+                    f"chown {CLUSTER_STORAGE_USER}:{CLUSTER_STORAGE_GROUP} /mnt && chmod og+rwx /mnt"
+                ],
+                "volumeMounts": [{"name": "data", "mountPath": "/mnt"}],
+            }
+        )
+
+    deployment_body = {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {
+            "namespace": workshop_namespace,
+            "name": name,
+            "labels": registry_labels,
+        },
+        "spec": {
+            "replicas": 1,
+            "selector": {"matchLabels": selector},
+            "strategy": {"type": "Recreate"},
+            "template": {
+                "metadata": {"labels": dict(registry_labels, **selector)},
+                "spec": {
+                    "serviceAccountName": "educates-services",
+                    "initContainers": init_containers,
+                    "containers": [
+                        {
+                            "name": "registry",
+                            "image": registry_image,
+                            "imagePullPolicy": registry_image_pull_policy,
+                            "securityContext": security_context,
+                            "resources": {
+                                "limits": {"memory": memory},
+                                "requests": {"memory": memory},
+                            },
+                            "ports": [{"containerPort": 5000, "protocol": "TCP"}],
+                            "env": [
+                                {
+                                    "name": "REGISTRY_STORAGE_DELETE_ENABLED",
+                                    "value": "true",
+                                },
+                                {"name": "REGISTRY_AUTH", "value": "token"},
+                                {
+                                    "name": "REGISTRY_AUTH_TOKEN_REALM",
+                                    "value": f"{INGRESS_PROTOCOL}://{host}/token",
+                                },
+                                {
+                                    "name": "REGISTRY_AUTH_TOKEN_SERVICE",
+                                    "value": host,
+                                },
+                                {
+                                    "name": "REGISTRY_AUTH_TOKEN_ISSUER",
+                                    "value": _token_issuer,
+                                },
+                                {
+                                    "name": "REGISTRY_AUTH_TOKEN_ROOTCERTBUNDLE",
+                                    "value": "/auth/token/tls.crt",
+                                },
+                            ],
+                            "volumeMounts": [
+                                {"name": "data", "mountPath": "/var/lib/registry"},
+                                {"name": "token", "mountPath": "/auth/token"},
+                            ],
+                        },
+                        {
+                            "name": "token",
+                            "image": SESSION_MANAGER_IMAGE,
+                            "imagePullPolicy": image_pull_policy(
+                                SESSION_MANAGER_IMAGE
+                            ),
+                            "securityContext": security_context,
+                            "command": [
+                                "python3",
+                                "/opt/app-root/src/registry_token.py",
+                            ],
+                            "resources": {
+                                "limits": {"memory": "64Mi"},
+                                "requests": {"memory": "64Mi"},
+                            },
+                            "ports": [{"containerPort": 5001, "protocol": "TCP"}],
+                            "env": [
+                                {"name": "TOKEN_ISSUER", "value": _token_issuer},
+                                {"name": "TOKEN_SERVICE", "value": host},
+                            ],
+                            "volumeMounts": [
+                                {"name": "users", "mountPath": "/auth/users"},
+                                {"name": "token", "mountPath": "/auth/token"},
+                            ],
+                        },
+                    ],
+                    "securityContext": {
+                        "runAsUser": 1000,
+                        "fsGroup": CLUSTER_STORAGE_GROUP,
+                        "supplementalGroups": [CLUSTER_STORAGE_GROUP],
+                    },
+                    "volumes": [
+                        {
+                            "name": "data",
+                            "persistentVolumeClaim": {"claimName": name},
+                        },
+                        {
+                            "name": "token",
+                            "secret": {
+                                "secretName": _token_secret_name(workshop_namespace)
+                            },
+                        },
+                        {
+                            "name": "users",
+                            "configMap": {
+                                "name": _users_config_map_name(workshop_namespace)
+                            },
+                        },
+                    ],
+                },
+            },
+        },
+    }
+
+    service_body = {
+        "apiVersion": "v1",
+        "kind": "Service",
+        "metadata": {
+            "namespace": workshop_namespace,
+            "name": name,
+            "labels": labels,
+        },
+        "spec": {
+            "type": "ClusterIP",
+            "ports": [
+                {"name": "registry", "port": 5000, "targetPort": 5000},
+                {"name": "token", "port": 5001, "targetPort": 5001},
+            ],
+            "selector": selector,
+        },
+    }
+
+    ingress_body = {
+        "apiVersion": "networking.k8s.io/v1",
+        "kind": "Ingress",
+        "metadata": {
+            "namespace": workshop_namespace,
+            "name": name,
+            "annotations": {"nginx.ingress.kubernetes.io/proxy-body-size": "512m"},
+            "labels": labels,
+        },
+        "spec": {
+            "rules": [
+                {
+                    "host": host,
+                    "http": {
+                        "paths": [
+                            {
+                                "path": "/token",
+                                "pathType": "Exact",
+                                "backend": {
+                                    "service": {
+                                        "name": name,
+                                        "port": {"number": 5001},
+                                    }
+                                },
+                            },
+                            {
+                                "path": "/",
+                                "pathType": "Prefix",
+                                "backend": {
+                                    "service": {
+                                        "name": name,
+                                        "port": {"number": 5000},
+                                    }
+                                },
+                            }
+                        ]
+                    },
+                }
+            ]
+        },
+    }
+
+    if INGRESS_SECRET:
+        ingress_body["metadata"]["annotations"].update(
+            {
+                "ingress.kubernetes.io/force-ssl-redirect": "true",
+                "nginx.ingress.kubernetes.io/ssl-redirect": "true",
+                "nginx.ingress.kubernetes.io/force-ssl-redirect": "true",
+            }
+        )
+
+        ingress_body["spec"]["tls"] = [{"hosts": [host], "secretName": INGRESS_SECRET}]
+
+    return [
+        users_config_map_body,
+        token_secret_body,
+        persistent_volume_claim_body,
+        deployment_body,
+        service_body,
+        ingress_body,
+    ]
+
+
+def _patch_users(workshop_namespace, data):
+    # A merge patch only touches the keys for the workshop session, so that
+    # concurrent updates for different workshop sessions don't conflict.
+
+    config_map = pykube.ConfigMap(
+        api,
+        {
+            "apiVersion": "v1",
+            "kind": "ConfigMap",
+            "metadata": {
+                "namespace": workshop_namespace,
+                "name": _users_config_map_name(workshop_namespace),
+            },
+        },
+    )
+
+    config_map.patch({"data": data})
+
+
+def add_shared_registry_user(workshop_namespace, username, htpasswd_hash):
+    """Adds the credentials for a workshop session to the shared image
+    registry."""
+
+    _patch_users(workshop_namespace, {username: f"{username}:{htpasswd_hash}\n"})
+
+
+def remove_shared_registry_user(workshop_namespace, username):
+    """Removes the credentials for a workshop session from the shared image
+    registry. Errors are ignored as the workshop environment may already
+    have been deleted."""
+
+    try:
+        _patch_users(workshop_namespace, {username: None})
+
+    except pykube.exceptions.KubernetesError:
+        logger.debug(
+            "Unable to remove registry user %s from workshop environment %s.",
+            username,
+            workshop_namespace,
+        )
+
+
+def _shared_registry_namespaces():
+    # Workshop environments report the workshop definition they were created
+    # from in their status, which says whether the image registry is shared.
+
+    for environment in WorkshopEnvironment.objects(api).all():
+        if not environment_is_local(environment.name):
+            continue
+
+        if xget(
+            environment.obj,
+            "status.educates.workshop.spec.session.applications.registry.shared",
+            False,
+        ):
+            yield environment.name
+
+
+def reconcile_shared_registry_users():
+    """Removes the credentials from shared image registries for any workshop
+    sessions which no longer exist, in case the deletion of the workshop
+    session was missed."""
+
+    users = {}
+
+    for workshop_namespace in _shared_registry_namespaces():
+        try:
+            config_map = pykube.ConfigMap.objects(
+                api, namespace=workshop_namespace
+            ).get(name=_users_config_map_name(workshop_namespace))
+
+        except pykube.exceptions.ObjectDoesNotExist:
+            continue
+
+        users[workshop_namespace] = set(config_map.obj.get("data") or {})
+
+    if not users:
+        return
+
+    # The workshop sessions are listed after the config maps are read, so
+    # that credentials added for a workshop session created in between are
+    # not removed.
+
+    sessions = set()
+
+    for session in WorkshopSession.objects(api).all():
+        spec = session.obj["spec"]
+
+        sessions.add(f"{spec['environment']['name']}-{spec['session']['id']}")
+
+    for workshop_namespace, usernames in users.items():
+        for username in usernames - sessions:
+            logger.info(
+                "Removing stale registry user %s from workshop environment %s.",
+                username,
+                workshop_namespace,
+            )
+
+            remove_shared_registry_user(workshop_namespace, username)
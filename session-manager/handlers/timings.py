@@ -0,0 +1,79 @@
+import time
+
+from prometheus_client import Histogram
+
+__all__ = ["PhaseTimer", "observe_session_startup"]
+
+_buckets = (
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0
+)
+
+provisioning_phase_seconds = Histogram(
+    "educates_provisioning_phase_seconds",
+    "Time taken by each phase of provisioning a resource.",
+    ["kind", "phase"],
+    buckets=_buckets,
+)
+
+provisioning_seconds = Histogram(
+    "educates_provisioning_seconds",
+    "Total time taken by a handler to successfully provision a resource.",
+    ["kind"],
+    buckets=_buckets,
+)
+
+session_startup_seconds = Histogram(
+    "educates_session_startup_seconds",
+    "Time from creation of a workshop session until each stage of starting the workshop pod is reached.",
+    ["environment", "workshop", "stage"],
+    buckets=_buckets,
+)
+
+
+class PhaseTimer:
+    """Records the time taken by successive phases of a handler. Each call to
+    mark() ends the current phase, attributing the time since the previous
+    mark to the named phase. Timings are exported as Prometheus histograms
+    and a summary can be recorded in the status of the resource."""
+
+    def __init__(self, kind):
+        self.kind = kind
+
+        self.phases = {}
+
+        self._started = time.monotonic()
+        self._marked = self._started
+
+    def mark(self, phase):
+        now = time.monotonic()
+
+        duration = now - self._marked
+
+        self._marked = now
+
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+        provisioning_phase_seconds.labels(self.kind, phase).observe(duration)
+
+    def finish(self):
+        """Records the total time taken by the handler and returns a summary
+        of the timings in milliseconds suitable for adding to the status."""
+
+        total = time.monotonic() - self._started
+
+        provisioning_seconds.labels(self.kind).observe(total)
+
+        return {
+            "total": int(total * 1000),
+            "phases": {
+                phase: int(duration * 1000) for phase, duration in self.phases.items()
+            },
+        }
+
+
+def observe_session_startup(environment, workshop, stages):
+    """Records the time in seconds from creation of a workshop session until
+    each stage of starting the workshop pod was reached."""
+
+    for stage, duration in stages.items():
+        session_startup_seconds.labels(environment, workshop, stage).observe(duration)
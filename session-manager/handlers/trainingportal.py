@@ -5,6 +5,7 @@ import pykube
 
 from .analytics import report_analytics_event
 from .helpers import image_pull_policy, resource_owned_by, xget
+from .kubeclient import api
 from .objects import SecretCopier
 from .operator_config import (AMPLITUDE_TRACKING_ID, ANALYTICS_WEBHOOK_URL,
                               CLARITY_TRACKING_ID,
@@ -19,18 +20,19 @@ from .operator_config import (AMPLITUDE_TRACKING_ID, ANALYTICS_WEBHOOK_URL,
                               PORTAL_ROBOT_CLIENT_SECRET,
                               PORTAL_ROBOT_PASSWORD, PORTAL_ROBOT_USERNAME,
                               SESSION_COOKIE_DOMAIN, TRAINING_PORTAL_IMAGE)
+from .sharding import portal_is_local, portal_labels_are_local
+from .timings import PhaseTimer
 
 __all__ = ["training_portal_create", "training_portal_delete"]
 
 logger = logging.getLogger("educates.trainingportal")
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
 
 @kopf.on.resume(
     "training.educates.dev",
     "v1beta1",
     "trainingportals",
+    when=portal_is_local,
 )
 def training_portal_resume(name, **_):
     """Used to acknowledge that there was an existing training portal resource
@@ -47,12 +49,17 @@ def training_portal_resume(name, **_):
     "v1beta1",
     "trainingportals",
     timeout=900,
+    when=portal_is_local,
 )
 def training_portal_create(name, uid, body, spec, status, patch, runtime, retry, **_):
     """Handle creation of a training portal resource. This involves the
     deployment of the training portal instance which the manages access to
     workshop environments and create workshop sessions."""
 
+    # Track how long each phase of creating the training portal takes.
+
+    timer = PhaseTimer("TrainingPortal")
+
     report_analytics_event(
         "Resource/Create",
         {"kind": "TrainingPortal", "name": name, "uid": uid, "retry": retry},
@@ -360,6 +367,8 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
                     delay=30,
                 )
 
+    timer.mark("prepare")
+
     # Namespace doesn't already exist so we need to create it. We query back
     # the namespace immediately so we can access its unique uid. Note that we
     # set the owner of the namespace to be the training portal so deletion of
@@ -389,10 +398,10 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
 
     kopf.adopt(namespace_body)
 
-    try:
-        pykube.Namespace(api, namespace_body).create()
+    namespace_instance = pykube.Namespace(api, namespace_body)
 
-        namespace_instance = pykube.Namespace.objects(api).get(name=portal_namespace)
+    try:
+        namespace_instance.create()
 
     except pykube.exceptions.KubernetesError as exc:
         logger.exception("Unexpected error creating namespace %s.", portal_namespace)
@@ -419,6 +428,8 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
             f"Failed to create namespace {portal_namespace}.", delay=30
         ) from exc
 
+    timer.mark("namespace")
+
     # Apply security policies to whole namespace if enabled.
 
     if CLUSTER_SECURITY_POLICY_ENGINE == "pod-security-policies":
@@ -505,6 +516,8 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
         except pykube.exceptions.ObjectDoesNotExist:
             pass
 
+    timer.mark("namespace-setup")
+
     # Prepare all the resources required for the training portal web interface.
     # First up need to create a service account and bind required roles to it.
     # Note that we set the owner of the cluster role binding to be the namespace
@@ -1036,6 +1049,8 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
 
     kopf.adopt(theme_secret_copier_body, namespace_instance.obj)
 
+    timer.mark("render-resources")
+
     # Create all the resources and if we fail on any then flag a transient error
     # and we will retry again later. Because of above checks in this case the
     # namespace will be deleted on a retry since it is owned by the training
@@ -1083,6 +1098,8 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
             f"Unexpected error creating training portal {portal_name}.", delay=30
         ) from exc
 
+    timer.mark("deployment")
+
     # Report analytics event training portal should be ready.
 
     report_analytics_event(
@@ -1110,6 +1127,7 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
             "robot": {"username": robot_username, "password": robot_password},
         },
         "clients": {"robot": {"id": robot_client_id, "secret": robot_client_secret}},
+        "timings": timer.finish(),
     }
 
 
@@ -1118,6 +1136,7 @@ def training_portal_create(name, uid, body, spec, status, patch, runtime, retry,
     "v1beta1",
     "trainingportals",
     optional=True,
+    when=portal_is_local,
 )
 def training_portal_delete(**_):
     """Nothing to do here at this point because the owner references will
@@ -1129,7 +1148,12 @@ def training_portal_delete(**_):
     # is deleted.
 
 
-@kopf.on.event("training.educates.dev", "v1beta1", "trainingportals")
+@kopf.on.event(
+    "training.educates.dev",
+    "v1beta1",
+    "trainingportals",
+    when=portal_is_local,
+)
 def training_portal_event(type, event, **_):  # pylint: disable=redefined-builtin
     """Log when a training portal is deleted."""
 
@@ -1147,6 +1171,7 @@ def training_portal_event(type, event, **_):  # pylint: disable=redefined-builti
         "training.educates.dev/component": "portal",
         "training.educates.dev/portal.services.dashboard": "true",
     },
+    when=portal_labels_are_local,
 )
 def training_portal_pod_event(type, event, **_):  # pylint: disable=redefined-builtin
     """Log the status of deployment of any training portal pods."""
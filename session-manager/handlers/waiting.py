@@ -0,0 +1,68 @@
+import math
+import time
+import logging
+
+import pykube
+import requests
+
+logger = logging.getLogger("educates")
+
+
+def wait_for_condition(query, condition, timeout):
+    """Waits for the set of objects matched by the query to satisfy the
+    condition. The condition is passed the list of matching objects and should
+    return True when they are ready. The objects are listed once and then a
+    watch is used to track changes, so the wait completes as soon as the
+    condition is satisfied rather than at the next polling interval. Returns
+    whether the condition was satisfied before the timeout expired."""
+
+    deadline = time.monotonic() + timeout
+
+    objects = {obj.name: obj for obj in query}
+
+    if condition(list(objects.values())):
+        return True
+
+    # Watch for changes starting from the resource version of the list so
+    # that no changes are missed. The server side timeout ensures that the
+    # watch will be closed even if no further changes are ever made.
+
+    watch = query.watch(
+        since=query.response["metadata"]["resourceVersion"],
+        params={"timeoutSeconds": max(1, math.ceil(timeout))},
+    )
+
+    try:
+        for event in watch:
+            if event.type == "DELETED":
+                objects.pop(event.object.name, None)
+
+            elif event.type in ("ADDED", "MODIFIED"):
+                objects[event.object.name] = event.object
+
+            else:
+                continue
+
+            if condition(list(objects.values())):
+                return True
+
+            if time.monotonic() >= deadline:
+                break
+
+    except pykube.exceptions.HTTPError as exc:
+        # The watch can fail if the resource version has already expired, in
+        # which case we give up waiting rather than start over again.
+
+        logger.warning("Watch failed waiting for %s: %s", query, exc)
+
+    except requests.exceptions.RequestException as exc:
+        # The connection for the watch can also be dropped part way through,
+        # in which case we likewise give up waiting.
+
+        logger.warning("Watch interrupted waiting for %s: %s", query, exc)
+
+    finally:
+        if watch.response is not None:
+            watch.response.close()
+
+    return False
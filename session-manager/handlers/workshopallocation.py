@@ -4,17 +4,16 @@ import logging
 import base64
 
 import kopf
-import pykube
 
 from .objects import create_from_dict
 from .helpers import xget, substitute_variables
 from .analytics import report_analytics_event
+from .sharding import labels_are_local, session_is_local
+from .timings import PhaseTimer
 
 
 logger = logging.getLogger("educates.workshopallocation")
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
 
 @kopf.index(
     "",
@@ -27,6 +26,7 @@ api = pykube.HTTPClient(pykube.KubeConfig.from_env())
         "training.educates.dev/environment.name": kopf.PRESENT,
         "training.educates.dev/session.name": kopf.PRESENT,
     },
+    when=labels_are_local,
 )
 def session_variables_secret_index(
     namespace,
@@ -66,6 +66,7 @@ def session_variables_secret_index(
         "training.educates.dev/environment.name": kopf.PRESENT,
         "training.educates.dev/session.name": kopf.PRESENT,
     },
+    when=labels_are_local,
 )
 def request_variables_secret_index(
     namespace,
@@ -101,6 +102,7 @@ def request_variables_secret_index(
     "training.educates.dev",
     "v1beta1",
     "workshopallocations",
+    when=session_is_local,
 )
 def workshop_allocation_resume(name, **_):
     """Used to acknowledge that an existing workshop allocation request has been
@@ -118,6 +120,7 @@ def workshop_allocation_resume(name, **_):
     "training.educates.dev",
     "v1beta1",
     "workshopallocations",
+    when=session_is_local,
 )
 def workshop_allocation_create(
     name,
@@ -139,6 +142,10 @@ def workshop_allocation_create(
     allocation request to "Allocated" to indicate that the request has been
     processed."""
 
+    # Track how long each phase of processing the allocation request takes.
+
+    timer = PhaseTimer("WorkshopAllocation")
+
     portal_name = meta.get("labels", {}).get(
         "training.educates.dev/portal.name", ""
     )
@@ -419,6 +426,8 @@ def workshop_allocation_create(
                 delay=5,
             )
 
+    timer.mark("wait-for-cache")
+
     # Get the session variables and request variables from the cache.
 
     cached_session_variables, *_ = session_variables_secret_index[
@@ -455,21 +464,16 @@ def workshop_allocation_create(
             "UTF-8"
         )
 
-    # Get the workshop name and the request objects from the status of the
-    # workshop environment instance.
+    # Get the workshop name and the request objects from the details of the
+    # workshop environment held in the index.
 
-    workshop_name = xget(
-        environment_instance, f"status.educates.workshop.name"
-    )
-
-    workshop_spec = xget(
-        environment_instance, f"status.educates.workshop.spec"
-    )
+    workshop_name = xget(environment_instance, "workshop.name")
 
     objects = []
 
-    if workshop_spec.get("request"):
-        objects.extend(workshop_spec["request"].get("objects", []))
+    objects.extend(xget(environment_instance, "workshop.request.objects", []))
+
+    timer.mark("prepare")
 
     # Create the request objects for the workshop session.
 
@@ -558,6 +562,8 @@ def workshop_allocation_create(
                 f"Unable to create workshop request objects for workshop session, failed on creating workshop request object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}."
             ) from exc
 
+    timer.mark("request-objects")
+
     # Set the status of the workshop allocation request to "Allocated" to
     # indicate that the request has been processed.
 
@@ -566,11 +572,16 @@ def workshop_allocation_create(
     patch["status"]["educates"] = {
         "phase": "Allocated",
         "message": None,
+        "timings": timer.finish(),
     }
 
 
 @kopf.on.delete(
-    "training.educates.dev", "v1beta1", "workshopallocations", optional=True
+    "training.educates.dev",
+    "v1beta1",
+    "workshopallocations",
+    optional=True,
+    when=session_is_local,
 )
 def workshop_allocation_delete(name, **_):
     """Nothing to do here at this point because the owner references will
@@ -582,7 +593,12 @@ def workshop_allocation_delete(name, **_):
     # allocation request is deleted.
 
 
-@kopf.on.event("training.educates.dev", "v1beta1", "workshopallocations")
+@kopf.on.event(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopallocations",
+    when=session_is_local,
+)
 def workshop_allocation_event(type, event, **_):  # pylint: disable=redefined-builtin
     """Log when a workshop allocation request is deleted."""
 
@@ -8,17 +8,25 @@ import yaml
 import kopf
 import pykube
 
-from .objects import create_from_dict, Workshop, SecretCopier
+from .kubeclient import api
+from .objects import create_from_dict, SecretCopier, WorkshopEnvironment
+from .informers import workshops
+from .scheduling import background_handler
+from .sharding import environment_is_local, labels_are_local
+from .timings import PhaseTimer
 from .helpers import (
     xget,
     resource_owned_by,
     substitute_variables,
-    smart_overlay_merge,
     image_pull_policy,
-    Applications,
 )
-from .applications import environment_objects_list, workshop_spec_patches
+from .rendering import resolve_workshop_spec, render_environment_objects
+from .prepull import prepull_images, prepull_daemonset_body, prepull_progress
+from .waiting import wait_for_condition
+from .image_digests import resolve_image_digests
+from .shared_registry import shared_registry_objects
 from .kyverno_rules import kyverno_environment_rules
+from .workshopsession import replenish_session_namespaces
 from .analytics import report_analytics_event
 
 from .operator_config import (
@@ -46,20 +54,28 @@ from .operator_config import (
     TUNNEL_MANAGER_IMAGE,
     IMAGE_CACHE_IMAGE,
     ASSETS_SERVER_IMAGE,
+    IMAGE_PREPULL_ENABLED,
+    IMAGE_PULL_SECRETS,
+    IMAGE_DIGESTS_ENABLED,
 )
 
 __all__ = ["workshop_environment_create", "workshop_environment_delete"]
 
 logger = logging.getLogger("educates.workshopenvironment")
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
 
-
-@kopf.index("training.educates.dev", "v1beta1", "workshopenvironments")
+@kopf.index(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopenvironments",
+    when=environment_is_local,
+)
 def workshop_environment_index(name, meta, body, **_):
     """Keeps an index of the workshop environments. This is used to allow
     workshop environments to be found when processing a workshop allocation
-    request."""
+    request. Only the details needed when processing a workshop allocation
+    are kept rather than the full resource, as the status of the workshop
+    environment holds a complete copy of the workshop definition."""
 
     generation = meta["generation"]
 
@@ -67,13 +83,24 @@ def workshop_environment_index(name, meta, body, **_):
         "Workshop environment %s with generation %s has been cached.", name, generation
     )
 
-    return {(None, name): body}
+    return {
+        (None, name): {
+            "uid": meta["uid"],
+            "workshop": {
+                "name": xget(body, "status.educates.workshop.name"),
+                "request": copy.deepcopy(
+                    xget(body, "status.educates.workshop.spec.request", {})
+                ),
+            },
+        }
+    }
 
 
 @kopf.on.resume(
     "training.educates.dev",
     "v1beta1",
     "workshopenvironments",
+    when=environment_is_local,
 )
 def workshop_environment_resume(name, **_):
     """Used to acknowledge that there was an existing workshop environment
@@ -89,7 +116,9 @@ def workshop_environment_resume(name, **_):
     "training.educates.dev",
     "v1beta1",
     "workshopenvironments",
+    when=environment_is_local,
 )
+@background_handler
 def workshop_environment_create(
     name, uid, body, meta, spec, status, patch, runtime, retry, **_
 ):
@@ -97,6 +126,10 @@ def workshop_environment_create(
     shared namespace for holding workshop session instances and any other
     resources associated with the workshop environment."""
 
+    # Track how long each phase of creating the workshop environment takes.
+
+    timer = PhaseTimer("WorkshopEnvironment")
+
     # Report analytics event indicating processing workshop environment.
 
     report_analytics_event(
@@ -144,7 +177,7 @@ def workshop_environment_create(
     workshop_name = spec["workshop"]["name"]
 
     try:
-        workshop_instance = Workshop.objects(api).get(name=workshop_name)
+        workshop_instance = workshops.get(workshop_name, refresh=retry > 0)
 
     except pykube.exceptions.ObjectDoesNotExist as exc:
         if runtime.total_seconds() >= 300:
@@ -224,16 +257,7 @@ def workshop_environment_create(
     # patching. It is the modified version of the config which gets saved in
     # the status so that it can be used later by the workshop session.
 
-    applications = Applications(workshop_spec["session"].get("applications", {}))
-
-    for application in applications:
-        if applications.is_enabled(application):
-            workshop_config_patch = workshop_spec_patches(
-                application, workshop_spec, applications.properties(application)
-            )
-            smart_overlay_merge(workshop_spec, workshop_config_patch.get("spec", {}))
-
-    applications = Applications(workshop_spec["session"].get("applications", {}))
+    applications = resolve_workshop_spec(workshop_spec)
 
     # Create the namespace for holding the workshop environment before we create
     # anything else. Before we attempt to create the namespace, we first see
@@ -448,6 +472,8 @@ def workshop_environment_create(
                     delay=30,
                 )
 
+    timer.mark("prepare")
+
     # Namespace doesn't already exist so we need to create it. We set the owner
     # of the namespace to be the workshop environment resource, but set anything
     # created as part of the workshop environment as being owned by the
@@ -483,10 +509,10 @@ def workshop_environment_create(
 
     kopf.adopt(namespace_body)
 
-    try:
-        pykube.Namespace(api, namespace_body).create()
+    namespace_instance = pykube.Namespace(api, namespace_body)
 
-        namespace_instance = pykube.Namespace.objects(api).get(name=workshop_namespace)
+    try:
+        namespace_instance.create()
 
     except pykube.exceptions.PyKubeError as exc:
         logger.exception(
@@ -515,6 +541,8 @@ def workshop_environment_create(
 
     patch["status"] = {"educates": {"phase": "Retrying"}}
 
+    timer.mark("namespace")
+
     # Apply security policies to whole namespace if enabled. We need to set the
     # whole namespace as requiring privilged as we need to run docker in docker
     # in this namespace.
@@ -1127,6 +1155,8 @@ def workshop_environment_create(
 
     pykube.ServiceAccount(api, service_account_body).create()
 
+    timer.mark("namespace-setup")
+
     # Potentially use base workshop image later on to initialize storage
     # permissions.
 
@@ -1340,6 +1370,31 @@ def workshop_environment_create(
                 kopf.adopt(object_body, namespace_instance.obj)
                 create_from_dict(object_body)
 
+    # If the image registry is to be shared by all workshop sessions, deploy
+    # it in the workshop namespace. Workshop sessions then only need to add
+    # their credentials to it rather than deploying a separate registry.
+
+    if applications.is_enabled("registry") and applications.property(
+        "registry", "shared", False
+    ):
+        registry_objects = shared_registry_objects(
+            workshop_namespace,
+            applications.property("registry", "memory", "768Mi"),
+            applications.property("registry", "storage", "5Gi"),
+            {
+                "training.educates.dev/component": "environment",
+                "training.educates.dev/workshop.name": workshop_name,
+                "training.educates.dev/portal.name": portal_name,
+                "training.educates.dev/portal.uid": portal_uid,
+                "training.educates.dev/environment.name": environment_name,
+                "training.educates.dev/environment.uid": environment_uid,
+            },
+        )
+
+        for object_body in registry_objects:
+            kopf.adopt(object_body, namespace_instance.obj)
+            create_from_dict(object_body)
+
     # If list of workshop image dependencies are defined, and any are configured
     # to be cached, deploy and artifact registry and configure it to mirror the
     # required workshop images.
@@ -2160,6 +2215,8 @@ def workshop_environment_create(
             kopf.adopt(object_body, namespace_instance.obj)
             create_from_dict(object_body)
 
+    timer.mark("services")
+
     # If kyverno is being used as the workshop security rules engine then create
     # a policy encapsulating all the restrictions on session namespaces for a
     # workshop.
@@ -2182,48 +2239,24 @@ def workshop_environment_create(
     # resource type is namespaced or not with the Python Kubernetes client
     # appears to be a bit of a hack.
 
-    objects = []
-
-    if workshop_spec.get("environment", {}).get("objects"):
-        for application in applications:
-            if applications.is_enabled(application):
-                objects.extend(
-                    environment_objects_list(
-                        application, workshop_spec, applications.properties(application)
-                    )
-                )
-
-        objects.extend(workshop_spec["environment"]["objects"])
-
-    if spec.get("environment", {}).get("objects"):
-        objects.extend(spec["environment"]["objects"])
+    objects = render_environment_objects(
+        workshop_spec,
+        applications,
+        spec.get("environment", {}).get("objects", []),
+        environment_variables,
+        workshop_namespace,
+        {
+            "training.educates.dev/component": "environment",
+            "training.educates.dev/workshop.name": workshop_name,
+            "training.educates.dev/portal.name": portal_name,
+            "training.educates.dev/portal.uid": portal_uid,
+            "training.educates.dev/environment.name": environment_name,
+            "training.educates.dev/environment.uid": environment_uid,
+            "training.educates.dev/environment.objects": "true",
+        },
+    )
 
     for object_body in objects:
-        # Substitute any data variables in the request objects.
-
-        object_body = substitute_variables(object_body, environment_variables)
-
-        # Set the namespace on the request object to the workshop namespace if
-        # it is not already set.
-
-        if not object_body["metadata"].get("namespace"):
-            object_body["metadata"]["namespace"] = workshop_namespace
-
-        # Set the labels on the request object to indicate that it was created
-        # for this specific workshop environment.
-
-        object_body["metadata"].setdefault("labels", {}).update(
-            {
-                "training.educates.dev/component": "environment",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/environment.objects": "true",
-            }
-        )
-
         # Adopt the request objects so that they are owned by the workshop
         # namespace. This way they will be deleted automatically when the
         # workshop environment and workshop namespace are deleted.
@@ -2233,11 +2266,6 @@ def workshop_environment_create(
         object_name = object_body["metadata"]["name"]
         object_namespace = object_body["metadata"]["namespace"]
         object_type = object_body["kind"]
-        object_api_version = object_body["apiVersion"]
-
-        if object_api_version == "v1" and object_type.lower() == "namespace":
-            annotations = object_body["metadata"].setdefault("annotations", {})
-            annotations["secretgen.carvel.dev/excluded-from-wildcard-matching"] = ""
 
         try:
             logger.info(
@@ -2281,6 +2309,112 @@ def workshop_environment_create(
                 f"Unable to create workshop environment objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop environment {environment_name}."
             ) from exc
 
+    timer.mark("environment-objects")
+
+    # Work out the images used by workshop sessions. If enabled, each image is
+    # resolved to the digest of the image it currently refers to. Workshop
+    # sessions will then use the digest, so that all workshop sessions of the
+    # workshop environment run the same image, and the image doesn't need to
+    # be checked against the registry each time a workshop session starts.
+
+    session_workshop_image = resolve_workshop_image(
+        substitute_variables(
+            workshop_spec.get("workshop", {}).get(
+                "image",
+                workshop_spec.get("content", {}).get("image", "base-environment:*"),
+            ),
+            environment_variables,
+        )
+    )
+
+    session_images = prepull_images(session_workshop_image, applications)
+
+    pinned_images = {}
+
+    if IMAGE_DIGESTS_ENABLED:
+        pinned_images = resolve_image_digests(
+            session_images + [BASE_ENVIRONMENT_IMAGE]
+        )
+
+        timer.mark("image-digests")
+
+    # If enabled, pre-pull the images required by workshop sessions onto all
+    # nodes, so that the first workshop session on a node doesn't need to wait
+    # for the images to be pulled. The progress is reported in the status of
+    # the workshop environment as the status of the daemon set changes.
+
+    if IMAGE_PREPULL_ENABLED:
+        # The daemon set runs in the workshop namespace, so any image pull
+        # secrets for the cluster need to be copied there first, else images
+        # from private image registries can't be pulled.
+
+        if IMAGE_PULL_SECRETS:
+            secret_copier_body = {
+                "apiVersion": "secrets.educates.dev/v1beta1",
+                "kind": "SecretCopier",
+                "metadata": {
+                    "name": f"educates-image-pull-secrets-{workshop_namespace}",
+                    "labels": {
+                        "training.educates.dev/component": "environment",
+                        "training.educates.dev/workshop.name": workshop_name,
+                        "training.educates.dev/portal.name": portal_name,
+                        "training.educates.dev/portal.uid": portal_uid,
+                        "training.educates.dev/environment.name": environment_name,
+                        "training.educates.dev/environment.uid": environment_uid,
+                    },
+                },
+                "spec": {
+                    "rules": [
+                        {
+                            "sourceSecret": {
+                                "name": secret_name,
+                                "namespace": OPERATOR_NAMESPACE,
+                            },
+                            "targetNamespaces": {
+                                "nameSelector": {"matchNames": [workshop_namespace]}
+                            },
+                            "reclaimPolicy": "Delete",
+                        }
+                        for secret_name in IMAGE_PULL_SECRETS
+                    ],
+                },
+            }
+
+            kopf.adopt(secret_copier_body, namespace_instance.obj)
+
+            SecretCopier(api, secret_copier_body).create()
+
+            # Give the secrets a chance to be copied before the pods are
+            # created. If they haven't been copied in time, pulling of the
+            # images is retried by the kubelet once they have been.
+
+            wait_for_condition(
+                pykube.Secret.objects(api, namespace=workshop_namespace),
+                lambda secrets: set(IMAGE_PULL_SECRETS)
+                <= {secret.name for secret in secrets},
+                timeout=5,
+            )
+
+        prepull_body = prepull_daemonset_body(
+            workshop_namespace,
+            [pinned_images.get(image, image) for image in session_images],
+            {
+                "training.educates.dev/component": "environment",
+                "training.educates.dev/workshop.name": workshop_name,
+                "training.educates.dev/portal.name": portal_name,
+                "training.educates.dev/portal.uid": portal_uid,
+                "training.educates.dev/environment.name": environment_name,
+                "training.educates.dev/environment.uid": environment_uid,
+                "training.educates.dev/environment.services.prepull": "true",
+            },
+        )
+
+        kopf.adopt(prepull_body, namespace_instance.obj)
+
+        pykube.DaemonSet(api, prepull_body).create()
+
+        timer.mark("image-prepull")
+
     # Report analytics event workshop environment should be ready.
 
     report_analytics_event(
@@ -2311,14 +2445,35 @@ def workshop_environment_create(
             "generation": workshop_generation,
             "spec": workshop_spec,
         },
+        "images": pinned_images,
+        "timings": timer.finish(),
     }
 
+    # Provision namespaces in advance for the first workshop sessions. The
+    # status of the workshop environment will only be updated once this
+    # handler returns, so the details needed are supplied directly.
+
+    replenish_session_namespaces(
+        {
+            "apiVersion": body["apiVersion"],
+            "kind": body["kind"],
+            "metadata": {
+                "name": name,
+                "uid": uid,
+                "labels": dict(meta.get("labels", {})),
+            },
+            "status": {"educates": patch["status"]["educates"]},
+        },
+        "s000",
+    )
+
 
 @kopf.on.delete(
     "training.educates.dev",
     "v1beta1",
     "workshopenvironments",
     optional=True,
+    when=environment_is_local,
 )
 def workshop_environment_delete(**_):
     """Nothing to do here at this point because the owner references will
@@ -2330,7 +2485,12 @@ def workshop_environment_delete(**_):
     # environment is deleted.
 
 
-@kopf.on.event("training.educates.dev", "v1beta1", "workshopenvironments")
+@kopf.on.event(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopenvironments",
+    when=environment_is_local,
+)
 def workshop_environment_event(type, event, **_):  # pylint: disable=redefined-builtin
     """Log when a workshop environment is deleted."""
 
@@ -2339,3 +2499,70 @@ def workshop_environment_event(type, event, **_):  # pylint: disable=redefined-b
             "Workshop environment %s has been deleted.",
             event["object"]["metadata"]["name"],
         )
+
+
+# Last progress of pre-pulling images reported in the status of each workshop
+# environment, used to avoid patching the status when nothing has changed.
+
+_prepull_reported = {}
+
+
+@kopf.on.event(
+    "apps",
+    "v1",
+    "daemonsets",
+    labels={
+        "training.educates.dev/component": "environment",
+        "training.educates.dev/environment.name": kopf.PRESENT,
+        "training.educates.dev/environment.services.prepull": "true",
+    },
+    when=labels_are_local,
+)
+def workshop_environment_prepull_event(type, event, labels, **_):  # pylint: disable=redefined-builtin
+    """Report progress of pre-pulling images in the status of the workshop
+    environment."""
+
+    environment_name = labels["training.educates.dev/environment.name"]
+
+    if type == "DELETED":
+        _prepull_reported.pop(environment_name, None)
+        return
+
+    # Once complete the daemon set is deleted, after which the count of ready
+    # pods drops as they are terminated, which mustn't be reported.
+
+    if event["object"]["metadata"].get("deletionTimestamp"):
+        return
+
+    progress = prepull_progress(event["object"])
+
+    if _prepull_reported.get(environment_name) == progress:
+        return
+
+    try:
+        WorkshopEnvironment(api, {"metadata": {"name": environment_name}}).patch(
+            {"status": {"educates": {"prepull": progress}}}
+        )
+
+    except pykube.exceptions.ObjectDoesNotExist:
+        _prepull_reported.pop(environment_name, None)
+        return
+
+    _prepull_reported[environment_name] = progress
+
+    if progress["phase"] == "Completed":
+        logger.info(
+            "Images for workshop environment %s have been pulled to %d nodes.",
+            environment_name,
+            progress["ready"],
+        )
+
+        # The pods of the daemon set would otherwise be left running on every
+        # node for the life of the workshop environment, so delete it. The
+        # progress recorded in the status of the workshop environment is kept.
+
+        try:
+            pykube.DaemonSet(api, event["object"]).delete()
+
+        except pykube.exceptions.ObjectDoesNotExist:
+            pass
@@ -4,8 +4,11 @@ import string
 import kopf
 import pykube
 
-from .objects import WorkshopEnvironment, WorkshopSession
+from .kubeclient import api
+from .objects import WorkshopSession
+from .informers import workshop_environments
 from .helpers import substitute_variables
+from .sharding import session_is_local
 
 from .operator_config import (
     INGRESS_DOMAIN,
@@ -15,16 +18,15 @@ from .operator_config import (
 
 __all__ = ["workshop_request_create", "workshop_request_delete"]
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
 
 @kopf.on.create(
     "training.educates.dev",
     "v1beta1",
     "workshoprequests",
     id="educates",
+    when=session_is_local,
 )
-def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
+def workshop_request_create(name, uid, namespace, spec, patch, logger, retry, **_):
     # The name of the custom resource for requesting a workshop doesn't
     # matter, we are going to generate a uniquely named session custom
     # resource anyway. First lookup up the desired workshop environment
@@ -40,8 +42,8 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
     environment_name = spec["environment"]["name"]
 
     try:
-        environment_instance = WorkshopEnvironment.objects(api).get(
-            name=environment_name
+        environment_instance = workshop_environments.get(
+            environment_name, refresh=retry > 0
         )
 
     except pykube.exceptions.ObjectDoesNotExist:
@@ -187,7 +189,12 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
     }
 
 
-@kopf.on.delete("training.educates.dev", "v1beta1", "workshoprequests")
+@kopf.on.delete(
+    "training.educates.dev",
+    "v1beta1",
+    "workshoprequests",
+    when=session_is_local,
+)
 def workshop_request_delete(name, uid, namespace, spec, status, logger, **_):
     # We need to pull the session details from the status of the request,
     # look it up to see if it still exists, verify we created it, and then
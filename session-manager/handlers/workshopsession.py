@@ -3,49 +3,115 @@ import copy
 import json
 import logging
 import random
+import re
 import string
-import time
+import threading
+from datetime import datetime, timezone
 
-import bcrypt
-import cryptography.hazmat.primitives
 import kopf
 import pykube
 import yaml
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
 
 from .analytics import report_analytics_event
-from .applications import pod_template_spec_patches, session_objects_list
-from .helpers import (Applications, image_pull_policy, smart_overlay_merge,
-                      substitute_variables, xget)
-from .namespace_budgets import namespace_budgets
-from .objects import WorkshopEnvironment, create_from_dict
+from .application_vcluster import VCLUSTER_INSTANCE_LABEL
+from .applications import session_objects_list
+from .credentials import registry_credentials_pool, ssh_keypair_pool
+from .helpers import (Applications, image_pull_policy, substitute_variables,
+                      xget)
+from .hibernation import hibernate_session, resume_session
+from .informers import workshop_environments
+from .kubeclient import api
+from .objects import WorkshopSession, create_from_dict
 from .operator_config import (AMPLITUDE_TRACKING_ID, BASE_ENVIRONMENT_IMAGE,
                               CLARITY_TRACKING_ID, CLUSTER_DOMAIN,
                               CLUSTER_SECURITY_POLICY_ENGINE,
-                              CLUSTER_STORAGE_CLASS, CLUSTER_STORAGE_GROUP,
-                              CLUSTER_STORAGE_USER, DOCKER_IN_DOCKER_IMAGE,
-                              DOCKER_REGISTRY_IMAGE, DOCKERD_MIRROR_REMOTE,
-                              DOCKERD_MTU, GOOGLE_TRACKING_ID,
+                              CLUSTER_STORAGE_CLASS, DOCKER_IN_DOCKER_IMAGE,
+                              DOCKER_REGISTRY_IMAGE, GOOGLE_TRACKING_ID,
                               IMAGE_REPOSITORY, INGRESS_CA_SECRET,
                               INGRESS_CLASS, INGRESS_DOMAIN, INGRESS_PROTOCOL,
-                              INGRESS_SECRET, NETWORK_BLOCKCIDRS,
-                              PLATFORM_ARCH,
-                              RUNTIME_CLASS, SESSION_COOKIE_DOMAIN,
+                              INGRESS_SECRET, PLATFORM_ARCH,
+                              SESSION_COOKIE_DOMAIN,
+                              SESSION_NAMESPACE_POOL_SIZE,
                               resolve_workshop_image)
-
-__all__ = ["workshop_session_create", "workshop_session_delete"]
+from .pipeline import CreationPipeline
+from .rendering import (add_application_labels, add_docker_daemon,
+                        add_image_registry, add_session_volumes,
+                        apply_registry_credentials, apply_session_patches,
+                        build_session_template, render_console_objects,
+                        render_namespace_setup_objects,
+                        render_session_deployment, render_session_ingress,
+                        render_session_namespace, render_session_objects,
+                        render_session_service, render_session_service_account,
+                        render_ssh_keys_secret, render_variables_secret,
+                        resolve_namespace_budget, resolve_security_policy,
+                        session_labels, session_namespace_settings,
+                        session_storage_settings, session_volume_subpath,
+                        session_workshop_memory)
+from .scheduling import background_handler, run_in_background
+from .shared_registry import (add_shared_registry_user,
+                              remove_shared_registry_user)
+from .sharding import labels_are_local, session_is_local
+from .timings import PhaseTimer, observe_session_startup
+from .waiting import wait_for_condition
+
+__all__ = [
+    "workshop_session_create",
+    "workshop_session_delete",
+    "replenish_session_namespaces",
+]
 
 logger = logging.getLogger("educates.workshopsession")
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
+# Cache of the parts of the session template which are derived only from the
+# workshop definition held by a workshop environment and so are the same for
+# every workshop session created against that environment. Entries are keyed
+# by the environment uid and workshop generation, with the oldest entries
+# being discarded when the cache is full.
+
+_session_templates = {}
+
+_session_templates_lock = threading.Lock()
+
+SESSION_TEMPLATES_CACHE_SIZE = 64
+
+
+def _session_template(
+    environment_uid, workshop_generation, workshop_spec, applications
+):
+    key = (environment_uid, workshop_generation)
+
+    with _session_templates_lock:
+        template = _session_templates.get(key)
 
+    if template is not None:
+        return template
 
-@kopf.index("training.educates.dev", "v1beta1", "workshopsessions")
+    # The session template still contains references to session variables
+    # and must be passed through substitute_variables() before use. That
+    # returns new objects, so the cached versions are never modified.
+
+    template = build_session_template(workshop_spec, applications)
+
+    with _session_templates_lock:
+        _session_templates[key] = template
+
+        while len(_session_templates) > SESSION_TEMPLATES_CACHE_SIZE:
+            del _session_templates[next(iter(_session_templates))]
+
+    return template
+
+
+@kopf.index(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopsessions",
+    when=session_is_local,
+)
 def workshop_session_index(name, meta, body, **_):
     """Keeps an index of the workshop session. This is used to allow
     workshop sessions to be found when processing a workshop allocation
-    request."""
+    request. Only the existence of the workshop session is checked so just
+    the uid is kept rather than the full resource."""
 
     generation = meta["generation"]
 
@@ -53,13 +119,14 @@ def workshop_session_index(name, meta, body, **_):
         "Workshop session %s with generation %s has been cached.", name, generation
     )
 
-    return {(None, name): body}
+    return {(None, name): meta["uid"]}
 
 
 @kopf.on.resume(
     "training.educates.dev",
     "v1beta1",
     "workshopsessions",
+    when=session_is_local,
 )
 def workshop_session_resume(name, **_):
     """Used to acknowledge that there was an existing workshop session
@@ -71,6 +138,85 @@ def workshop_session_resume(name, **_):
     )
 
 
+def _resource_quotas_ready(resource_quotas):
+    # Resource quotas are ready once the quota controller has calculated the
+    # hard limits and current usage and recorded them in the status.
+
+    for resource_quota in resource_quotas:
+        if (
+            not resource_quota.obj.get("status")
+            or not resource_quota.obj["status"].get("used")
+            or not resource_quota.obj["status"].get("hard")
+        ):
+            return False
+
+    return True
+
+
+def _session_namespace_body(
+    workshop_name,
+    portal_name,
+    portal_uid,
+    environment_name,
+    environment_uid,
+    session_name,
+    session_namespace,
+    namespace_security_policy,
+):
+    return render_session_namespace(
+        session_namespace,
+        session_labels(
+            workshop_name,
+            portal_name,
+            portal_uid,
+            environment_name,
+            environment_uid,
+            session_name,
+        ),
+        namespace_security_policy,
+    )
+
+
+def _registry_secret_body(
+    workshop_name,
+    portal_name,
+    portal_uid,
+    environment_name,
+    environment_uid,
+    session_name,
+    target_namespace,
+    applications,
+):
+    registry_host = applications.property("registry", "host")
+    registry_username = applications.property("registry", "username")
+    registry_password = applications.property("registry", "password")
+    registry_auth_token = applications.property("registry", "basic_auth_token")
+    registry_secret = applications.property("registry", "secret")
+
+    registry_config = {"auths": {registry_host: {"auth": f"{registry_auth_token}"}}}
+
+    secret_body = {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {
+            "name": registry_secret,
+            "namespace": target_namespace,
+            "labels": session_labels(
+                workshop_name,
+                portal_name,
+                portal_uid,
+                environment_name,
+                environment_uid,
+                session_name,
+            ),
+        },
+        "type": "kubernetes.io/dockerconfigjson",
+        "stringData": {".dockerconfigjson": json.dumps(registry_config, indent=4)},
+    }
+
+    return secret_body
+
+
 def _setup_session_namespace(
     primary_namespace_body,
     workshop_name,
@@ -96,47 +242,17 @@ def _setup_session_namespace(
     # must always exist. Others are more problematic since they may or may not
     # exist.
 
-    for _ in range(25):
-        try:
-            service_account_instance = pykube.ServiceAccount.objects(
-                api, namespace=target_namespace
-            ).get(name="default")
-
-        except pykube.exceptions.ObjectDoesNotExist:
-            time.sleep(0.1)
-
-        else:
-            break
+    wait_for_condition(
+        pykube.ServiceAccount.objects(api, namespace=target_namespace).filter(
+            field_selector={"metadata.name": "default"}
+        ),
+        lambda service_accounts: len(service_accounts) != 0,
+        timeout=2.5,
+    )
 
     # Determine which limit ranges and resources quotas to be used.
 
-    if budget != "custom":
-        if budget not in namespace_budgets:
-            budget = "default"
-        elif not namespace_budgets[budget]:
-            budget = "default"
-
-    if budget not in ("default", "custom"):
-        budget_item = namespace_budgets[budget]
-
-        resource_limits_definition = budget_item["resource-limits"]
-        compute_resources_definition = budget_item["compute-resources"]
-        compute_resources_timebound_definition = budget_item[
-            "compute-resources-timebound"
-        ]
-        object_counts_definition = budget_item["object-counts"]
-
-        if limits:
-            resource_limits_definition = copy.deepcopy(resource_limits_definition)
-
-            container_limits_patch = {"type": "Container"}
-            container_limits_patch.update(limits)
-
-            smart_overlay_merge(
-                resource_limits_definition["spec"]["limits"],
-                [container_limits_patch],
-                "type",
-            )
+    budget = resolve_namespace_budget(budget)
 
     # Delete any limit ranges applied to the namespace that may conflict with
     # the limit range being applied. For the case of custom, we delete any being
@@ -164,362 +280,595 @@ def _setup_session_namespace(
             except pykube.exceptions.ObjectDoesNotExist:
                 pass
 
-    # If there is a CIDR list of networks to block create a network policy in
-    # the target session environment to restrict access from all pods. The
-    # customised roles for "admin", "edit" and "view" used below ensure that the
-    # network policy objects cannot be deleted from the session namespaces by a
-    # user.
+    # The remaining resources created in the namespace are independent of each
+    # other so are created in parallel.
 
-    if NETWORK_BLOCKCIDRS:
-        network_policy_body = {
-            "apiVersion": "networking.k8s.io/v1",
-            "kind": "NetworkPolicy",
-            "metadata": {
-                "name": "educates-network-policy",
-                "namespace": target_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "spec": {
-                "policyTypes": ["Egress"],
-                "egress": [],
-            },
-        }
+    pipeline = CreationPipeline()
 
-        egresses = []
+    # The network policy is owned by the primary session namespace, the
+    # remaining resources being deleted along with the namespace they are in.
 
-        ipv4_blockcidrs = []
-        ipv6_blockcidrs = []
+    setup_objects = render_namespace_setup_objects(
+        target_namespace,
+        workshop_namespace,
+        service_account,
+        role,
+        budget,
+        limits,
+        security_policy,
+        session_labels(
+            workshop_name,
+            portal_name,
+            portal_uid,
+            environment_name,
+            environment_uid,
+            session_name,
+        ),
+    )
 
-        for block in list(NETWORK_BLOCKCIDRS):
-            if ":" in block:
-                ipv6_blockcidrs.append(block)
-            else:
-                ipv4_blockcidrs.append(block)
+    for object_body in setup_objects:
+        if object_body["kind"] == "NetworkPolicy":
+            kopf.adopt(object_body, primary_namespace_body)
 
-        if ipv4_blockcidrs:
-            egresses.append(
-                {"to": [{"ipBlock": {"cidr": "0.0.0.0/0", "except": ipv4_blockcidrs}}]}
-            )
+        pipeline.add(
+            f"{object_body['kind']}/{object_body['metadata']['name']}",
+            create_from_dict,
+            object_body,
+        )
 
-        if ipv6_blockcidrs:
-            egresses.append(
-                {"to": [{"ipBlock": {"cidr": "::/0", "except": ipv6_blockcidrs}}]}
-            )
+    # Create secret which holds image registry '.docker/config.json' and apply
+    # it to the default service account in the target namespace so that any
+    # deployment using that service account can pull images from the image
+    # registry without needing to explicitly add their own image pull secret.
 
-        network_policy_body["spec"]["egress"] = egresses
+    if applications.is_enabled("registry"):
+        secret_body = _registry_secret_body(
+            workshop_name,
+            portal_name,
+            portal_uid,
+            environment_name,
+            environment_uid,
+            session_name,
+            target_namespace,
+            applications,
+        )
 
-        kopf.adopt(network_policy_body, primary_namespace_body)
+        pipeline.add("registry-secret", pykube.Secret(api, secret_body).create)
 
-        NetworkPolicy = pykube.object_factory(
-            api, "networking.k8s.io/v1", "NetworkPolicy"
-        )
+    pipeline.run()
 
-        NetworkPolicy(api, network_policy_body).create()
-
-    # Create role binding in the namespace so the service account under which
-    # the workshop environment runs can create resources in it. We only allow a
-    # select set of roles which are "admin", "edit", "view" and "cluster-admin".
-    # Except for "cluster-admin" these will be mapped to our own version of the
-    # respective cluster roles which have any edit access to network policies
-    # dropped. If a role is provided we don't know about, we will map it to
-    # "view" which because it is the most restrictive will flag more easily that
-    # something is wrong in what a workshop defines. If want no role at all to
-    # be set up so you can define your own, then can set "custom".
-
-    role_mappings = {
-        "admin": "educates-admin-session-role",
-        "edit": "educates-edit-session-role",
-        "view": "educates-view-session-role",
-        "cluster-admin": "cluster-admin",
-        "custom": None,
-    }
+    if budget not in ("default", "custom"):
+        # Verify that the status of the resource quotas have been updated. If we
+        # don't do this, then the calculated hard limits may not be calculated
+        # before we start creating resources in the namespace resulting in a
+        # failure. If we can't manage to verify quotas after a period, give up.
+        # This may result in a subsequent failure.
 
-    role_resource_name = role_mappings.get(role)
+        wait_for_condition(
+            pykube.ResourceQuota.objects(api, namespace=target_namespace),
+            _resource_quotas_ready,
+            timeout=2.5,
+        )
 
-    if role_resource_name is None and role != "custom":
-        role_resource_name = "educates-view-session-role"
 
-    if role_resource_name is not None:
-        role_binding_body = {
-            "apiVersion": "rbac.authorization.k8s.io/v1",
-            "kind": "RoleBinding",
-            "metadata": {
-                "name": "educates-session-role",
-                "namespace": target_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "roleRef": {
-                "apiGroup": "rbac.authorization.k8s.io",
-                "kind": "ClusterRole",
-                "name": role_resource_name,
-            },
-            "subjects": [
-                {
-                    "kind": "ServiceAccount",
-                    "name": service_account,
-                    "namespace": workshop_namespace,
-                }
-            ],
-        }
+def _object_namespace_settings(namespace_body, role, budget, namespace_security_policy):
+    """Returns the role, budget, limits and security policy for a namespace
+    created from the session objects, as overridden by annotations on the
+    namespace, and adds the labels for the security policy to it."""
 
-        pykube.RoleBinding(api, role_binding_body).create()
+    annotations = namespace_body["metadata"].setdefault("annotations", {})
 
-    # Create rolebinding so that all service accounts in the namespace are bound
-    # by the specified security policy.
+    annotations["secretgen.carvel.dev/excluded-from-wildcard-matching"] = ""
 
-    if CLUSTER_SECURITY_POLICY_ENGINE == "pod-security-policies":
-        psp_role_binding_body = {
-            "apiVersion": "rbac.authorization.k8s.io/v1",
-            "kind": "RoleBinding",
-            "metadata": {
-                "name": "educates-security-policy",
-                "namespace": target_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "roleRef": {
-                "apiGroup": "rbac.authorization.k8s.io",
-                "kind": "ClusterRole",
-                "name": f"educates-{security_policy}-psp",
-            },
-            "subjects": [
-                {
-                    "apiGroup": "rbac.authorization.k8s.io",
-                    "kind": "Group",
-                    "name": f"system:serviceaccounts:{target_namespace}",
-                }
-            ],
-        }
+    target_role = annotations.get("training.educates.dev/session.role", role)
 
-        pykube.RoleBinding(api, psp_role_binding_body).create()
+    target_security_policy = resolve_security_policy(
+        annotations.get(
+            "training.educates.dev/session.policy", namespace_security_policy
+        )
+    )
 
-    if CLUSTER_SECURITY_POLICY_ENGINE == "security-context-constraints":
-        scc_role_binding_body = {
-            "apiVersion": "rbac.authorization.k8s.io/v1",
-            "kind": "RoleBinding",
-            "metadata": {
-                "name": "educates-security-policy",
-                "namespace": target_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "roleRef": {
-                "apiGroup": "rbac.authorization.k8s.io",
-                "kind": "ClusterRole",
-                "name": f"educates-{security_policy}-scc",
-            },
-            "subjects": [
-                {
-                    "apiGroup": "rbac.authorization.k8s.io",
-                    "kind": "Group",
-                    "name": f"system:serviceaccounts:{target_namespace}",
-                }
-            ],
+    namespace_body["metadata"].setdefault("labels", {}).update(
+        {
+            "training.educates.dev/policy.engine": CLUSTER_SECURITY_POLICY_ENGINE,
+            "training.educates.dev/policy.name": target_security_policy,
         }
+    )
 
-        pykube.RoleBinding(api, scc_role_binding_body).create()
+    if CLUSTER_SECURITY_POLICY_ENGINE == "pod-security-standards":
+        namespace_body["metadata"]["labels"][
+            "pod-security.kubernetes.io/enforce"
+        ] = target_security_policy
 
-    # Create secret which holds image registry '.docker/config.json' and apply
-    # it to the default service account in the target namespace so that any
-    # deployment using that service account can pull images from the image
-    # registry without needing to explicitly add their own image pull secret.
+    target_budget = annotations.get("training.educates.dev/session.budget", budget)
 
-    if applications.is_enabled("registry"):
-        registry_host = applications.property("registry", "host")
-        registry_username = applications.property("registry", "username")
-        registry_password = applications.property("registry", "password")
-        registry_auth_token = applications.property("registry", "basic_auth_token")
-        registry_secret = applications.property("registry", "secret")
+    target_limits = {}
 
-        registry_config = {"auths": {registry_host: {"auth": f"{registry_auth_token}"}}}
+    if annotations.get("training.educates.dev/session.limits.min.cpu"):
+        target_limits.setdefault("min", {})["cpu"] = annotations[
+            "training.educates.dev/session.limits.min.cpu"
+        ]
+    if annotations.get("training.educates.dev/session.limits.min.memory"):
+        target_limits.setdefault("min", {})["memory"] = annotations[
+            "training.educates.dev/session.limits.min.memory"
+        ]
 
-        secret_body = {
-            "apiVersion": "v1",
-            "kind": "Secret",
-            "metadata": {
-                "name": registry_secret,
-                "namespace": target_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "type": "kubernetes.io/dockerconfigjson",
-            "stringData": {".dockerconfigjson": json.dumps(registry_config, indent=4)},
-        }
+    if annotations.get("training.educates.dev/session.limits.max.cpu"):
+        target_limits.setdefault("max", {})["cpu"] = annotations[
+            "training.educates.dev/session.limits.max.cpu"
+        ]
+    if annotations.get("training.educates.dev/session.limits.max.memory"):
+        target_limits.setdefault("max", {})["memory"] = annotations[
+            "training.educates.dev/session.limits.max.memory"
+        ]
 
-        pykube.Secret(api, secret_body).create()
+    if annotations.get("training.educates.dev/session.limits.defaultrequest.cpu"):
+        target_limits.setdefault("defaultRequest", {})["cpu"] = annotations[
+            "training.educates.dev/session.limits.defaultrequest.cpu"
+        ]
+    if annotations.get("training.educates.dev/session.limits.defaultrequest.memory"):
+        target_limits.setdefault("defaultRequest", {})["memory"] = annotations[
+            "training.educates.dev/session.limits.defaultrequest.memory"
+        ]
 
-    # Create limit ranges for the namespace so any deployments will have default
-    # memory/cpu min and max values.
+    if annotations.get("training.educates.dev/session.limits.default.cpu"):
+        target_limits.setdefault("default", {})["cpu"] = annotations[
+            "training.educates.dev/session.limits.default.cpu"
+        ]
+    if annotations.get("training.educates.dev/session.limits.default.memory"):
+        target_limits.setdefault("default", {})["memory"] = annotations[
+            "training.educates.dev/session.limits.default.memory"
+        ]
 
-    if budget not in ("default", "custom"):
-        resource_limits_body = copy.deepcopy(resource_limits_definition)
+    return target_role, target_budget, target_limits, target_security_policy
 
-        resource_limits_body["metadata"].setdefault("labels", {}).update(
-            {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            }
-        )
 
-        resource_limits_body["metadata"]["namespace"] = target_namespace
+# Namespaces for workshop sessions can be provisioned ahead of time, with the
+# budget, role bindings and network policy applied, so that the namespace only
+# needs to be claimed when the workshop session is created. As the training
+# portal names workshop sessions using an incrementing count, a pool of
+# namespaces for the next workshop sessions of a workshop environment are
+# provisioned when the workshop environment is created, and then each time a
+# workshop session is created. Until claimed, the namespaces are owned by the
+# workshop environment. A namespace which has not finished being provisioned
+# within the timeout, such as when the operator was restarted while doing so,
+# is discarded.
 
-        pykube.LimitRange(api, resource_limits_body).create()
+_session_pool_label = "training.educates.dev/session.pool"
 
-    # Create resource quotas for the namespace so there is a maximum for what
-    # resources can be used.
+_session_pool_timeout = 300
 
-    if budget not in ("default", "custom"):
-        resource_quota_body = copy.deepcopy(compute_resources_definition)
+_workshop_generation_annotation = "training.educates.dev/workshop.generation"
 
-        resource_quota_body["metadata"].setdefault("labels", {}).update(
-            {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            }
-        )
+_session_id_pattern = re.compile(r"^s(\d+)$")
 
-        resource_quota_body["metadata"]["namespace"] = target_namespace
+_vcluster_provisioned_annotation = "training.educates.dev/vcluster.provisioned"
 
-        pykube.ResourceQuota(api, resource_quota_body).create()
 
-        resource_quota_body = copy.deepcopy(compute_resources_timebound_definition)
+def _session_vcluster_pool_size(workshop_spec):
+    """Returns for how many of the workshop sessions expected to be created
+    next the virtual cluster should be started in advance. This can't be
+    done where additional objects are to be deployed to the virtual cluster,
+    as they may depend on session variables only known when the workshop
+    session is created."""
 
-        resource_quota_body["metadata"].setdefault("labels", {}).update(
-            {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            }
-        )
+    applications = Applications(xget(workshop_spec, "session.applications", {}))
 
-        resource_quota_body["metadata"]["namespace"] = target_namespace
+    if not applications.is_enabled("vcluster"):
+        return 0
 
-        pykube.ResourceQuota(api, resource_quota_body).create()
+    if applications.property("vcluster", "objects", []):
+        return 0
 
-        resource_quota_body = copy.deepcopy(object_counts_definition)
+    return applications.property("vcluster", "pool.size", 0)
 
-        resource_quota_body["metadata"].setdefault("labels", {}).update(
-            {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            }
-        )
 
-        resource_quota_body["metadata"]["namespace"] = target_namespace
+def _provision_session_vcluster(
+    namespace_obj, environment_obj, session_name, session_namespace
+):
+    """Create the objects making up the virtual cluster for a workshop
+    session which has not yet been created. These are adopted by the primary
+    namespace provisioned for the workshop session. The objects which bind
+    the virtual cluster to the workshop session, such as the copy of the
+    kubeconfig secret into the workshop namespace, are only created when
+    the workshop session is created."""
 
-        pykube.ResourceQuota(api, resource_quota_body).create()
+    environment_name = environment_obj["metadata"]["name"]
+    environment_uid = environment_obj["metadata"]["uid"]
 
-        # Verify that the status of the resource quotas have been updated. If we
-        # don't do this, then the calculated hard limits may not be calculated
-        # before we start creating resources in the namespace resulting in a
-        # failure. If we can't manage to verify quotas after a period, give up.
-        # This may result in a subsequent failure.
+    environment_labels = environment_obj["metadata"].get("labels", {})
 
-        for _ in range(25):
-            resource_quotas = pykube.ResourceQuota.objects(
-                api, namespace=target_namespace
-            ).all()
+    portal_name = environment_labels.get("training.educates.dev/portal.name", "")
+    portal_uid = environment_labels.get("training.educates.dev/portal.uid", "")
 
-            for resource_quota in resource_quotas:
-                if (
-                    not resource_quota.obj.get("status")
-                    or not resource_quota.obj["status"].get("used")
-                    or not resource_quota.obj["status"].get("hard")
-                ):
-                    time.sleep(0.1)
-                    continue
+    workshop_name = environment_obj["status"]["educates"]["workshop"]["name"]
+    workshop_spec = environment_obj["status"]["educates"]["workshop"]["spec"]
 
-            break
+    workshop_namespace = environment_name
 
+    role, budget, _, namespace_security_policy = session_namespace_settings(
+        workshop_spec
+    )
 
-@kopf.on.create(
-    "training.educates.dev",
-    "v1beta1",
-    "workshopsessions",
-)
-def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, **_):
-    # Report analytics event indicating processing workshop session.
+    applications = Applications(workshop_spec["session"].get("applications", {}))
 
-    report_analytics_event(
-        "Resource/Create",
-        {"kind": "WorkshopSession", "name": name, "uid": uid, "retry": retry},
+    template = dict(
+        objects=[
+            object_body
+            for object_body in session_objects_list(
+                "vcluster", workshop_spec, applications.properties("vcluster")
+            )
+            if xget(object_body, "metadata.labels", {}).get(VCLUSTER_INSTANCE_LABEL)
+        ]
     )
 
-    if retry > 0:
-        logger.info(
-            "Workshop session creation request for %s being retried, retries %d.",
-            name,
-            retry,
-        )
-    else:
-        logger.info("Workshop session creation request for %s being processed.", name)
+    variables = dict(
+        session_namespace=session_namespace,
+        vcluster_namespace=f"{session_namespace}-vc",
+        cluster_domain=CLUSTER_DOMAIN,
+    )
 
-    # Make sure that if any unexpected error occurs prior to session namespace
-    # being created that status is set to Pending indicating the that successful
-    # creation based on the custom resource still needs to be done. For any
-    # errors occurring after the session namespace has been created we will set
-    # a Failed status instead.
+    objects = render_session_objects(
+        template,
+        variables,
+        session_namespace,
+        {
+            "training.educates.dev/component": "session",
+            "training.educates.dev/workshop.name": workshop_name,
+            "training.educates.dev/portal.name": portal_name,
+            "training.educates.dev/portal.uid": portal_uid,
+            "training.educates.dev/environment.name": environment_name,
+            "training.educates.dev/environment.uid": environment_uid,
+            "training.educates.dev/session.name": session_name,
+            "training.educates.dev/session.objects": "true",
+        },
+    )
 
-    patch["status"] = {"educates": {"phase": "Pending"}}
+    for object_body in objects:
+        kopf.adopt(object_body, namespace_obj)
 
-    # The namespace created for the session is the name of the workshop
-    # namespace suffixed by the session ID. By convention this should be
+        if object_body["apiVersion"] == "v1" and object_body["kind"] == "Namespace":
+            (
+                target_role,
+                target_budget,
+                target_limits,
+                target_security_policy,
+            ) = _object_namespace_settings(
+                object_body, role, budget, namespace_security_policy
+            )
+
+            create_from_dict(object_body)
+
+            _setup_session_namespace(
+                namespace_obj,
+                workshop_name,
+                portal_name,
+                portal_uid,
+                environment_name,
+                environment_uid,
+                session_name,
+                workshop_namespace,
+                session_namespace,
+                object_body["metadata"]["name"],
+                session_namespace,
+                Applications({}),
+                target_role,
+                target_budget,
+                target_limits,
+                target_security_policy,
+            )
+
+        else:
+            create_from_dict(object_body)
+
+
+def _provision_session_namespace(environment_obj, session_id, provision_vcluster):
+    """Provision the primary namespace for a workshop session which has not
+    yet been created, so that it can be claimed by the workshop session. The
+    virtual cluster for the workshop session is also started if requested."""
+
+    environment_name = environment_obj["metadata"]["name"]
+    environment_uid = environment_obj["metadata"]["uid"]
+
+    environment_labels = environment_obj["metadata"].get("labels", {})
+
+    portal_name = environment_labels.get("training.educates.dev/portal.name", "")
+    portal_uid = environment_labels.get("training.educates.dev/portal.uid", "")
+
+    workshop_name = environment_obj["status"]["educates"]["workshop"]["name"]
+    workshop_spec = environment_obj["status"]["educates"]["workshop"]["spec"]
+
+    workshop_generation = environment_obj["status"]["educates"]["workshop"].get(
+        "generation"
+    )
+
+    workshop_namespace = environment_name
+
+    session_name = f"{environment_name}-{session_id}"
+    session_namespace = session_name
+
+    role, budget, limits, namespace_security_policy = session_namespace_settings(
+        workshop_spec
+    )
+
+    namespace_body = _session_namespace_body(
+        workshop_name,
+        portal_name,
+        portal_uid,
+        environment_name,
+        environment_uid,
+        session_name,
+        session_namespace,
+        namespace_security_policy,
+    )
+
+    namespace_body["metadata"]["labels"][_session_pool_label] = "pending"
+
+    namespace_body["metadata"]["annotations"][_workshop_generation_annotation] = str(
+        workshop_generation
+    )
+
+    if provision_vcluster:
+        namespace_body["metadata"]["annotations"][
+            _vcluster_provisioned_annotation
+        ] = "true"
+
+    kopf.adopt(namespace_body, environment_obj)
+
+    namespace_instance = pykube.Namespace(api, namespace_body)
+
+    try:
+        namespace_instance.create()
+
+    except pykube.exceptions.PyKubeError as exc:
+        if exc.code != 409:
+            logger.warning(
+                "Unable to provision namespace %s for pool: %s",
+                session_namespace,
+                exc,
+            )
+        return
+
+    # The registry secret is not created here as the credentials for the image
+    # registry are only generated when the workshop session is created.
+
+    try:
+        _setup_session_namespace(
+            namespace_instance.obj,
+            workshop_name,
+            portal_name,
+            portal_uid,
+            environment_name,
+            environment_uid,
+            session_name,
+            workshop_namespace,
+            session_namespace,
+            session_namespace,
+            session_namespace,
+            Applications({}),
+            role,
+            budget,
+            limits,
+            namespace_security_policy,
+        )
+
+        if provision_vcluster:
+            _provision_session_vcluster(
+                namespace_instance.obj,
+                environment_obj,
+                session_name,
+                session_namespace,
+            )
+
+        namespace_instance.obj["metadata"]["labels"][_session_pool_label] = "ready"
+        namespace_instance.update()
+
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Unable to provision namespace %s for pool.", session_namespace
+        )
+
+        try:
+            namespace_instance.delete()
+        except pykube.exceptions.PyKubeError:
+            pass
+
+        return
+
+    logger.info("Provisioned namespace %s for pool.", session_namespace)
+
+
+def _replenish_session_namespaces(environment_obj, session_id):
+    """Provision namespaces for the workshop sessions which are expected to
+    be created next for the workshop environment."""
+
+    match = _session_id_pattern.match(session_id)
+
+    if not match:
+        return
+
+    environment_name = environment_obj["metadata"]["name"]
+    environment_uid = environment_obj["metadata"]["uid"]
+
+    try:
+        existing = set(
+            namespace.name
+            for namespace in pykube.Namespace.objects(api).filter(
+                selector={"training.educates.dev/environment.uid": environment_uid}
+            )
+        )
+
+    except pykube.exceptions.PyKubeError:
+        logger.exception("Unable to query namespaces for %s.", environment_name)
+
+        return
+
+    count = int(match.group(1))
+
+    vcluster_pool_size = _session_vcluster_pool_size(
+        environment_obj["status"]["educates"]["workshop"]["spec"]
+    )
+
+    pool_size = max(SESSION_NAMESPACE_POOL_SIZE, vcluster_pool_size)
+
+    for tally in range(count + 1, count + pool_size + 1):
+        if f"{environment_name}-s{tally:03}" not in existing:
+            _provision_session_namespace(
+                environment_obj, f"s{tally:03}", tally <= count + vcluster_pool_size
+            )
+
+
+def replenish_session_namespaces(environment_obj, session_id):
+    """Schedules provisioning of namespaces for the workshop sessions which are
+    expected to be created after the given workshop session, if namespaces
+    are to be provisioned in advance for the workshop environment. When the
+    workshop environment is first created, the session ID should be "s000"."""
+
+    workshop_spec = environment_obj["status"]["educates"]["workshop"]["spec"]
+
+    if SESSION_NAMESPACE_POOL_SIZE > 0 or _session_vcluster_pool_size(workshop_spec):
+        run_in_background(_replenish_session_namespaces, environment_obj, session_id)
+
+
+def _claim_session_namespace(namespace_body, workshop_generation):
+    """Claim a provisioned namespace for the workshop session, returning it
+    if one was available and matches what would have been created for the
+    workshop session. The namespace body must already be adopted by the
+    workshop session."""
+
+    session_namespace = namespace_body["metadata"]["name"]
+
+    try:
+        namespace_instance = pykube.Namespace.objects(api).get(name=session_namespace)
+
+    except pykube.exceptions.ObjectDoesNotExist:
+        return None
+
+    labels = dict(namespace_instance.labels)
+
+    state = labels.pop(_session_pool_label, None)
+
+    if state is None:
+        return None
+
+    # A namespace being deleted, whether discarded from the pool or as the
+    # workshop environment is being deleted, can't be claimed. Once it has
+    # been deleted the namespace will be created as normal.
+
+    if namespace_instance.metadata.get("deletionTimestamp"):
+        raise kopf.TemporaryError(
+            f"Namespace {session_namespace} is being deleted.", delay=5
+        )
+
+    if state != "ready":
+        created = _parse_timestamp(namespace_instance.metadata["creationTimestamp"])
+
+        age = datetime.now(timezone.utc) - created
+
+        if age.total_seconds() < _session_pool_timeout:
+            raise kopf.TemporaryError(
+                f"Namespace {session_namespace} is still being provisioned.", delay=5
+            )
+
+        logger.info("Discarding incomplete pool namespace %s.", session_namespace)
+
+        namespace_instance.delete()
+
+        raise kopf.TemporaryError(
+            f"Namespace {session_namespace} is being replaced.", delay=5
+        )
+
+    provisioned_generation = namespace_instance.annotations.get(
+        _workshop_generation_annotation
+    )
+
+    expected_labels = namespace_body["metadata"]["labels"]
+
+    if provisioned_generation != str(workshop_generation) or any(
+        labels.get(key) != value for key, value in expected_labels.items()
+    ):
+        # The workshop environment has changed since the namespace was
+        # provisioned so it needs to be discarded and created again.
+
+        logger.info("Discarding stale pool namespace %s.", session_namespace)
+
+        namespace_instance.delete()
+
+        raise kopf.TemporaryError(
+            f"Namespace {session_namespace} is being replaced.", delay=5
+        )
+
+    namespace_instance.obj["metadata"]["labels"] = labels
+    namespace_instance.obj["metadata"]["annotations"].pop(
+        _workshop_generation_annotation, None
+    )
+    namespace_instance.obj["metadata"]["ownerReferences"] = namespace_body[
+        "metadata"
+    ]["ownerReferences"]
+
+    try:
+        namespace_instance.update()
+
+    except pykube.exceptions.PyKubeError as exc:
+        raise kopf.TemporaryError(
+            f"Unable to claim namespace {session_namespace}."
+        ) from exc
+
+    logger.info("Claimed namespace %s from pool.", session_namespace)
+
+    return namespace_instance
+
+
+def _session_is_allocated(annotations, **_):
+    # A workshop session created by the training portal for a user who is
+    # waiting on it, rather than as a reserved session, is annotated as such
+    # by the training portal when it is created. The status of the workshop
+    # session cannot be used as the training portal only records the user
+    # in it after the workshop session has been created.
+
+    return (
+        annotations.get("training.educates.dev/session.allocation") == "on-demand"
+    )
+
+
+@kopf.on.create(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopsessions",
+    when=session_is_local,
+)
+@background_handler(foreground=_session_is_allocated)
+def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, **_):
+    # Track how long each phase of creating the workshop session takes.
+
+    timer = PhaseTimer("WorkshopSession")
+
+    # Report analytics event indicating processing workshop session.
+
+    report_analytics_event(
+        "Resource/Create",
+        {"kind": "WorkshopSession", "name": name, "uid": uid, "retry": retry},
+    )
+
+    if retry > 0:
+        logger.info(
+            "Workshop session creation request for %s being retried, retries %d.",
+            name,
+            retry,
+        )
+    else:
+        logger.info("Workshop session creation request for %s being processed.", name)
+
+    # Make sure that if any unexpected error occurs prior to session namespace
+    # being created that status is set to Pending indicating the that successful
+    # creation based on the custom resource still needs to be done. For any
+    # errors occurring after the session namespace has been created we will set
+    # a Failed status instead.
+
+    patch["status"] = {"educates": {"phase": "Pending"}}
+
+    # The namespace created for the session is the name of the workshop
+    # namespace suffixed by the session ID. By convention this should be
     # the same as what would be used for the name of the session
     # resource definition, but we can't rely on that being the case, as
     # may be different during development and testing, so we construct
@@ -532,8 +881,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     session_name = name
 
     try:
-        environment_instance = WorkshopEnvironment.objects(api).get(
-            name=workshop_namespace
+        environment_instance = workshop_environments.get(
+            workshop_namespace, refresh=retry > 0
         )
 
     except pykube.exceptions.ObjectDoesNotExist as exc:
@@ -576,14 +925,30 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         "spec"
     ]
 
+    workshop_generation = environment_instance.obj["status"]["educates"][
+        "workshop"
+    ].get("generation")
+
     workshop_version = workshop_spec.get("version", "latest")
 
+    # Images used by the workshop session which were resolved to a digest
+    # when the workshop environment was created.
+
+    pinned_images = environment_instance.obj["status"]["educates"].get("images", {})
+
     # Create a wrapper for determining if applications enabled and what
     # configuration they provide. Apply any patches to the workshop config
     # required by enabled applications.
 
     applications = Applications(workshop_spec["session"].get("applications", {}))
 
+    # Lookup the parts of the session template which are common to all
+    # sessions created for the workshop environment.
+
+    session_template = _session_template(
+        environment_uid, workshop_generation, workshop_spec, applications
+    )
+
     # Calculate the hostname to be used for this workshop session.
 
     session_hostname = f"{session_namespace}.{INGRESS_DOMAIN}"
@@ -598,61 +963,24 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
 
     # Calculate role, security policy and quota details for primary namespace.
 
-    role = "admin"
-    budget = "default"
-    limits = {}
-
-    namespace_security_policy = "restricted"
-
-    security_policy_mapping = {
-        "restricted": "restricted",
-        "baseline": "baseline",
-        "privileged": "privileged",
-        # Following are obsolete and should not be used.
-        "nonroot": "restricted",
-        "anyuid": "baseline",
-        "custom": "privileged",
-    }
-
-    def resolve_security_policy(name):
-        return security_policy_mapping.get(name, "restricted")
-
-    if workshop_spec.get("session"):
-        role = workshop_spec["session"].get("namespaces", {}).get("role", role)
-        budget = workshop_spec["session"].get("namespaces", {}).get("budget", budget)
-        limits = workshop_spec["session"].get("namespaces", {}).get("limits", limits)
-
-        namespace_security_policy = resolve_security_policy(
-            workshop_spec["session"]
-            .get("namespaces", {})
-            .get("security", {})
-            .get("policy", namespace_security_policy)
-        )
+    role, budget, limits, namespace_security_policy = session_namespace_settings(
+        workshop_spec
+    )
 
-    # Generate a random password for the image registry if required.
+    # Take a random password for the image registry if required. The bcrypt
+    # hash of the password needed for the registry htpasswd file is generated
+    # along with it in the background as it is expensive to compute.
 
     characters = string.ascii_letters + string.digits
 
-    if applications.is_enabled("registry"):
-        registry_host = f"registry-{session_namespace}.{INGRESS_DOMAIN}"
-        registry_username = session_namespace
-        registry_password = "".join(random.sample(characters, 32))
-
-        registry_auth_token = (
-            base64.b64encode(f"{registry_username}:{registry_password}".encode("utf-8"))
-            .decode("ascii")
-            .strip()
-        )
-
-        registry_secret = "educates-registry-credentials"
-
-        applications.properties("registry")["host"] = registry_host
-        applications.properties("registry")["username"] = registry_username
-        applications.properties("registry")["password"] = registry_password
+    registry_htpasswd_hash = None
 
-        applications.properties("registry")["basic_auth_token"] = registry_auth_token
+    if applications.is_enabled("registry"):
+        registry_password, registry_htpasswd_hash = registry_credentials_pool.take()
 
-        applications.properties("registry")["secret"] = registry_secret
+        apply_registry_credentials(
+            applications, workshop_namespace, session_namespace, registry_password
+        )
 
     # Generate a random password to be used for any services or applications
     # deployed for a workshop, as well as one specifically for accessing the
@@ -708,6 +1036,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             yaml.dump(secret_obj, Dumper=yaml.Dumper).encode("utf-8")
         ).decode("utf-8")
 
+    timer.mark("prepare")
+
     # Create the namespace for everything related to this session. We set the
     # owner of the namespace to be the workshop session resource, but set
     # anything created as part of the workshop session as being owned by
@@ -715,83 +1045,59 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     # state until the child resources are deleted. Believe this makes clearer
     # what is going on as you may miss that workshop environment is stuck.
 
-    namespace_body = {
-        "apiVersion": "v1",
-        "kind": "Namespace",
-        "metadata": {
-            "name": session_namespace,
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-                "training.educates.dev/policy.engine": CLUSTER_SECURITY_POLICY_ENGINE,
-                "training.educates.dev/policy.name": namespace_security_policy,
-            },
-            "annotations": {"secretgen.carvel.dev/excluded-from-wildcard-matching": ""},
-        },
-    }
-
-    if CLUSTER_SECURITY_POLICY_ENGINE == "pod-security-standards":
-        namespace_body["metadata"]["labels"][
-            "pod-security.kubernetes.io/enforce"
-        ] = namespace_security_policy
+    namespace_body = _session_namespace_body(
+        workshop_name,
+        portal_name,
+        portal_uid,
+        environment_name,
+        environment_uid,
+        session_name,
+        session_namespace,
+        namespace_security_policy,
+    )
 
     kopf.adopt(namespace_body)
 
+    # Claim a namespace which was provisioned in advance for the session if
+    # one is available, otherwise create it. The namespace object is updated
+    # from the response when it is created, so we don't need to query it back
+    # to get the resource uid for the namespace so can make it the parent of
+    # all other resources created.
+
     try:
-        pykube.Namespace(api, namespace_body).create()
+        namespace_instance = _claim_session_namespace(
+            namespace_body, workshop_generation
+        )
 
-    except pykube.exceptions.PyKubeError as exc:
-        if exc.code == 409:
-            patch["status"] = {"educates": {"phase": "Pending"}}
-            raise kopf.TemporaryError(
-                f"Namespace {session_namespace} already exists."
-            ) from exc
+    except kopf.TemporaryError:
+        patch["status"] = {"educates": {"phase": "Pending"}}
         raise
 
-    try:
-        namespace_instance = pykube.Namespace.objects(api).get(name=session_namespace)
-
-    # To get resource uuid for the namespace so can make it the parent of all
-    # other resources created, we need to query it back. If this fails something
-    # drastic would have had to happen so raise a permanent error.
+    namespace_provisioned = namespace_instance is not None
 
-    except pykube.exceptions.KubernetesError as exc:
-        logger.exception("Unexpected error fetching namespace %s.", session_namespace)
-        patch["status"] = {"educates": {"phase": "Failed"}}
-        raise kopf.PermanentError(
-            f"Failed to fetch namespace {session_namespace}."
-        ) from exc
+    if not namespace_provisioned:
+        namespace_instance = pykube.Namespace(api, namespace_body)
 
-    # Generate a SSH key pair for injection into workshop container and any
-    # potential services that need it.
+        try:
+            namespace_instance.create()
 
-    private_key = rsa.generate_private_key(
-        public_exponent=65537, key_size=2048
-    )
+        except pykube.exceptions.PyKubeError as exc:
+            if exc.code == 409:
+                patch["status"] = {"educates": {"phase": "Pending"}}
+                raise kopf.TemporaryError(
+                    f"Namespace {session_namespace} already exists."
+                ) from exc
+            raise
 
-    unencrypted_pem_private_key = private_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
-        encryption_algorithm=serialization.NoEncryption(),
-    )
+    timer.mark("namespace")
 
-    rsa_public_key = private_key.public_key().public_bytes(
-        encoding=serialization.Encoding.OpenSSH,
-        format=serialization.PublicFormat.OpenSSH,
-    )
+    # Take a SSH key pair for injection into workshop container and any
+    # potential services that need it. These are pre-generated in the
+    # background as generating them is expensive.
 
-    # pem_public_key = private_key.public_key().public_bytes(
-    #     encoding=serialization.Encoding.PEM,
-    #     format=serialization.PublicFormat.SubjectPublicKeyInfo,
-    # )
+    ssh_private_key, ssh_public_key = ssh_keypair_pool.take()
 
-    ssh_private_key = unencrypted_pem_private_key.decode("utf-8")
-    ssh_public_key = rsa_public_key.decode("utf-8")
+    timer.mark("ssh-keys")
 
     # For unexpected errors beyond this point we will set the status to say
     # things Failed since we can't really recover.
@@ -808,151 +1114,144 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
 
     service_account = session_namespace
 
-    service_account_body = {
-        "apiVersion": "v1",
-        "kind": "ServiceAccount",
-        "metadata": {
-            "name": service_account,
-            "namespace": workshop_namespace,
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            },
-        },
-    }
-
-    kopf.adopt(service_account_body, namespace_instance.obj)
+    labels = session_labels(
+        workshop_name,
+        portal_name,
+        portal_uid,
+        environment_name,
+        environment_uid,
+        session_name,
+    )
 
-    try:
-        pykube.ServiceAccount(api, service_account_body).create()
-
-    except pykube.exceptions.PyKubeError as exc:
-        logger.exception(
-            "Unexpected error creating service account %s.", service_account
-        )
-        patch["status"] = {
-            "educates": {
-                "phase": "Failed",
-                "message": f"Failed to create service account {service_account}: {exc}",
-            }
-        }
-        raise kopf.PermanentError(
-            f"Failed to create service account {service_account}: {exc}"
-        ) from exc
-
-    service_account_token_body = {
-        "apiVersion": "v1",
-        "kind": "Secret",
-        "metadata": {
-            "name": f"{service_account}-token",
-            "namespace": workshop_namespace,
-            "annotations": {"kubernetes.io/service-account.name": service_account},
-            "labels": {
-                "training.educates.dev/component": "portal",
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-            },
+    (
+        service_account_body,
+        service_account_token_body,
+        cluster_role_binding_body,
+    ) = render_session_service_account(
+        service_account,
+        workshop_namespace,
+        session_namespace,
+        labels,
+        {
+            "training.educates.dev/component": "portal",
+            "training.educates.dev/portal.name": portal_name,
+            "training.educates.dev/portal.uid": portal_uid,
         },
-        "type": "kubernetes.io/service-account-token",
-    }
+    )
 
+    kopf.adopt(service_account_body, namespace_instance.obj)
     kopf.adopt(service_account_token_body, namespace_instance.obj)
+    kopf.adopt(cluster_role_binding_body, namespace_instance.obj)
 
-    try:
-        pykube.Secret(api, service_account_token_body).create()
+    def _create_service_account():
+        try:
+            pykube.ServiceAccount(api, service_account_body).create()
 
-    except pykube.exceptions.PyKubeError as exc:
-        logger.exception(
-            "Unexpected error creating access token %s-token.", service_account
-        )
-        patch["status"] = {
-            "educates": {
-                "phase": "Failed",
-                "message": f"Failed to create access token {service_account}-token: {exc}",
-            }
-        }
-        raise kopf.PermanentError(
-            f"Failed to create access token {service_account}-token: {exc}"
-        )
+        except pykube.exceptions.PyKubeError as exc:
+            logger.exception(
+                "Unexpected error creating service account %s.", service_account
+            )
+            raise kopf.PermanentError(
+                f"Failed to create service account {service_account}: {exc}"
+            ) from exc
 
-    # Create the rolebinding for this service account to add access to
-    # the additional roles that the Kubernetes web console requires.
+    def _create_service_account_token():
+        try:
+            pykube.Secret(api, service_account_token_body).create()
 
-    cluster_role_binding_body = {
-        "apiVersion": "rbac.authorization.k8s.io/v1",
-        "kind": "ClusterRoleBinding",
-        "metadata": {
-            "name": f"educates-web-console-{session_namespace}",
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            },
-        },
-        "roleRef": {
-            "apiGroup": "rbac.authorization.k8s.io",
-            "kind": "ClusterRole",
-            "name": f"educates-web-console-{workshop_namespace}",
-        },
-        "subjects": [
-            {
-                "kind": "ServiceAccount",
-                "namespace": workshop_namespace,
-                "name": service_account,
-            }
-        ],
-    }
+        except pykube.exceptions.PyKubeError as exc:
+            logger.exception(
+                "Unexpected error creating access token %s-token.", service_account
+            )
+            raise kopf.PermanentError(
+                f"Failed to create access token {service_account}-token: {exc}"
+            )
 
-    kopf.adopt(cluster_role_binding_body, namespace_instance.obj)
+    # The cluster role binding adds access for this service account to the
+    # additional roles that the Kubernetes web console requires.
+
+    def _create_cluster_role_binding():
+        try:
+            pykube.ClusterRoleBinding(api, cluster_role_binding_body).create()
+
+        except pykube.exceptions.PyKubeError as exc:
+            logger.exception(
+                "Unexpected error creating cluster role binding %s-web-console-%s.",
+                "educates",
+                session_namespace,
+            )
+            raise kopf.PermanentError(
+                f"Failed to create cluster role binding educates-web-console-{session_namespace}: {exc}"
+            )
+
+    # Create the service account, its access token and the cluster role
+    # binding in parallel. The access token must only be created after the
+    # service account exists else the token controller will delete it.
+
+    pipeline = CreationPipeline()
+
+    pipeline.add("service-account", _create_service_account)
+    pipeline.add(
+        "service-account-token",
+        _create_service_account_token,
+        depends=["service-account"],
+    )
+    pipeline.add("cluster-role-binding", _create_cluster_role_binding)
 
     try:
-        pykube.ClusterRoleBinding(api, cluster_role_binding_body).create()
+        pipeline.run()
 
-    except pykube.exceptions.PyKubeError as exc:
-        logger.exception(
-            "Unexpected error creating cluster role binding %s-web-console-%s.",
-            "educates",
-            session_namespace,
-        )
+    except kopf.PermanentError as exc:
         patch["status"] = {
             "educates": {
                 "phase": "Failed",
-                "message": f"Failed to create cluster role binding educates-web-console-{session_namespace}: {exc}",
+                "message": str(exc),
             }
         }
-        raise kopf.PermanentError(
-            f"Failed to create cluster role binding educates-web-console-{session_namespace}: {exc}"
+        raise
+
+    timer.mark("service-account")
+
+    # Setup configuration on the primary session namespace. If the namespace
+    # was provisioned in advance, only the image registry secret still needs
+    # to be created.
+
+    if not namespace_provisioned:
+        _setup_session_namespace(
+            namespace_instance.obj,
+            workshop_name,
+            portal_name,
+            portal_uid,
+            environment_name,
+            environment_uid,
+            session_name,
+            workshop_namespace,
+            session_namespace,
+            session_namespace,
+            service_account,
+            applications,
+            role,
+            budget,
+            limits,
+            namespace_security_policy,
         )
 
-    # Setup configuration on the primary session namespace.
+    elif applications.is_enabled("registry"):
+        pykube.Secret(
+            api,
+            _registry_secret_body(
+                workshop_name,
+                portal_name,
+                portal_uid,
+                environment_name,
+                environment_uid,
+                session_name,
+                session_namespace,
+                applications,
+            ),
+        ).create()
 
-    _setup_session_namespace(
-        namespace_instance.obj,
-        workshop_name,
-        portal_name,
-        portal_uid,
-        environment_name,
-        environment_uid,
-        session_name,
-        workshop_namespace,
-        session_namespace,
-        session_namespace,
-        service_account,
-        applications,
-        role,
-        budget,
-        limits,
-        namespace_security_policy,
-    )
+    timer.mark("namespace-setup")
 
     # List of variables that can be replaced in session objects etc. For those
     # set by applications they are passed through from when the workshop
@@ -1017,7 +1316,9 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         config_password=config_password,
     )
 
-    base_workshop_image = BASE_ENVIRONMENT_IMAGE
+    base_workshop_image = pinned_images.get(
+        BASE_ENVIRONMENT_IMAGE, BASE_ENVIRONMENT_IMAGE
+    )
     base_workshop_image_pull_policy = image_pull_policy(base_workshop_image)
 
     workshop_image = workshop_spec.get("workshop", {}).get(
@@ -1025,6 +1326,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     )
     workshop_image = substitute_variables(workshop_image, session_variables)
     workshop_image = resolve_workshop_image(workshop_image)
+    workshop_image = pinned_images.get(workshop_image, workshop_image)
 
     workshop_image_pull_policy = image_pull_policy(workshop_image)
 
@@ -1041,39 +1343,22 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     if applications.is_enabled("registry"):
         session_variables.update(
             dict(
-                registry_host=registry_host,
-                registry_username=registry_username,
-                registry_password=registry_password,
-                registry_auth_token=registry_auth_token,
-                registry_secret=registry_secret,
+                registry_host=applications.property("registry", "host"),
+                registry_username=applications.property("registry", "username"),
+                registry_password=applications.property("registry", "password"),
+                registry_auth_token=applications.property(
+                    "registry", "basic_auth_token"
+                ),
+                registry_secret=applications.property("registry", "secret"),
             )
         )
 
     # Claim a persistent volume for the workshop session if requested.
 
-    storage = workshop_spec.get("session", {}).get("resources", {}).get("storage")
-
-    storage_volume_name = substitute_variables(
-        workshop_spec.get("session", {})
-        .get("resources", {})
-        .get("volume", {})
-        .get("name", ""),
-        session_variables,
+    storage, storage_volume_name, storage_volume_subpath = session_storage_settings(
+        workshop_spec, session_variables
     )
 
-    storage_volume_subpath = ""
-
-    if storage_volume_name:
-        storage = None
-
-        storage_volume_subpath = substitute_variables(
-            workshop_spec.get("session", {})
-            .get("resources", {})
-            .get("volume", {})
-            .get("subPath", ""),
-            session_variables,
-        )
-
     if storage:
         persistent_volume_claim_body = {
             "apiVersion": "v1",
@@ -1081,15 +1366,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             "metadata": {
                 "name": session_namespace,
                 "namespace": workshop_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
+                "labels": dict(labels),
             },
             "spec": {
                 "accessModes": [
@@ -1115,32 +1392,9 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     # Create secret containing session variables for later use when allocating
     # a user to a workshop session.
 
-    variables_secret_body = {
-        "apiVersion": "v1",
-        "kind": "Secret",
-        "metadata": {
-            "name": f"{session_namespace}-session",
-            "namespace": workshop_namespace,
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/component.group": "variables",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            },
-        },
-        "data": {},
-    }
-
-    variables_data = {}
-
-    for key, value in session_variables.items():
-        variables_data[key] = base64.b64encode(value.encode("UTF-8")).decode("UTF-8")
-
-    variables_secret_body["data"] = variables_data
+    variables_secret_body = render_variables_secret(
+        session_namespace, workshop_namespace, session_variables, labels
+    )
 
     kopf.adopt(variables_secret_body, namespace_instance.obj)
 
@@ -1155,6 +1409,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             )
         raise
 
+    timer.mark("session-variables")
+
     # Create any secondary namespaces required for the session.
 
     namespaces = []
@@ -1235,6 +1491,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
                 target_security_policy,
             )
 
+    timer.mark("secondary-namespaces")
+
     # Create any additional resource objects required for the session.
     #
     # XXX For now make the session resource definition the parent of
@@ -1243,127 +1501,78 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     # How to work out if a resource type is namespaced or not with the
     # Python Kubernetes client appears to be a bit of a hack.
 
-    objects = []
+    objects = render_session_objects(
+        session_template,
+        session_variables,
+        session_namespace,
+        {
+            "training.educates.dev/component": "session",
+            "training.educates.dev/workshop.name": workshop_name,
+            "training.educates.dev/portal.name": portal_name,
+            "training.educates.dev/portal.uid": portal_uid,
+            "training.educates.dev/environment.name": environment_name,
+            "training.educates.dev/environment.uid": environment_uid,
+            "training.educates.dev/session.name": session_name,
+            "training.educates.dev/session.objects": "true",
+        },
+    )
 
-    for application in applications:
-        if applications.is_enabled(application):
-            objects.extend(
-                session_objects_list(
-                    application, workshop_spec, applications.properties(application)
-                )
-            )
+    # If the virtual cluster was started when the namespace was provisioned,
+    # the objects for the virtual cluster itself already exist.
 
-    if workshop_spec.get("session"):
-        objects.extend(workshop_spec["session"].get("objects", []))
+    vcluster_provisioned = (
+        namespace_provisioned
+        and namespace_instance.annotations.get(_vcluster_provisioned_annotation)
+        == "true"
+    )
 
     for object_body in objects:
-        object_body = substitute_variables(object_body, session_variables)
-
-        if not object_body["metadata"].get("namespace"):
-            object_body["metadata"]["namespace"] = session_namespace
-
         object_name = object_body["metadata"]["name"]
         object_namespace = object_body["metadata"]["namespace"]
         object_type = object_body["kind"]
         object_api_version = object_body["apiVersion"]
 
-        object_body["metadata"].setdefault("labels", {}).update(
-            {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-                "training.educates.dev/session.objects": "true",
-            }
-        )
+        if vcluster_provisioned and object_body["metadata"]["labels"].get(
+            VCLUSTER_INSTANCE_LABEL
+        ):
+            # Namespaces for the virtual cluster were set up when provisioned
+            # but without the image registry secret, as with the primary
+            # session namespace. The secret injector then adds it to the
+            # default service account of the namespace.
+
+            if (
+                object_api_version == "v1"
+                and object_type.lower() == "namespace"
+                and applications.is_enabled("registry")
+            ):
+                pykube.Secret(
+                    api,
+                    _registry_secret_body(
+                        workshop_name,
+                        portal_name,
+                        portal_uid,
+                        environment_name,
+                        environment_uid,
+                        session_name,
+                        object_name,
+                        applications,
+                    ),
+                ).create()
+
+            continue
 
         kopf.adopt(object_body, namespace_instance.obj)
 
         if object_api_version == "v1" and object_type.lower() == "namespace":
-            annotations = object_body["metadata"].setdefault("annotations", {})
-
-            annotations["secretgen.carvel.dev/excluded-from-wildcard-matching"] = ""
-
-            target_role = annotations.get(
-                "training.educates.dev/session.role", role
-            )
-
-            target_security_policy = resolve_security_policy(
-                annotations.get(
-                    "training.educates.dev/session.policy",
-                    namespace_security_policy,
-                )
-            )
-
-            object_body["metadata"].setdefault("labels", {}).update(
-                {
-                    "training.educates.dev/policy.engine": CLUSTER_SECURITY_POLICY_ENGINE,
-                    "training.educates.dev/policy.name": target_security_policy,
-                }
-            )
-
-            if CLUSTER_SECURITY_POLICY_ENGINE == "pod-security-standards":
-                object_body["metadata"]["labels"][
-                    "pod-security.kubernetes.io/enforce"
-                ] = target_security_policy
-
-            target_budget = annotations.get(
-                "training.educates.dev/session.budget", budget
+            (
+                target_role,
+                target_budget,
+                target_limits,
+                target_security_policy,
+            ) = _object_namespace_settings(
+                object_body, role, budget, namespace_security_policy
             )
 
-            target_limits = {}
-
-            if annotations.get("training.educates.dev/session.limits.min.cpu"):
-                target_limits.setdefault("min", {})["cpu"] = annotations[
-                    "training.educates.dev/session.limits.min.cpu"
-                ]
-            if annotations.get(
-                "training.educates.dev/session.limits.min.memory"
-            ):
-                target_limits.setdefault("min", {})["memory"] = annotations[
-                    "training.educates.dev/session.limits.min.memory"
-                ]
-
-            if annotations.get("training.educates.dev/session.limits.max.cpu"):
-                target_limits.setdefault("max", {})["cpu"] = annotations[
-                    "training.educates.dev/session.limits.max.cpu"
-                ]
-            if annotations.get(
-                "training.educates.dev/session.limits.max.memory"
-            ):
-                target_limits.setdefault("max", {})["memory"] = annotations[
-                    "training.educates.dev/session.limits.max.memory"
-                ]
-
-            if annotations.get(
-                "training.educates.dev/session.limits.defaultrequest.cpu"
-            ):
-                target_limits.setdefault("defaultRequest", {})["cpu"] = annotations[
-                    "training.educates.dev/session.limits.defaultrequest.cpu"
-                ]
-            if annotations.get(
-                "training.educates.dev/session.limits.defaultrequest.memory"
-            ):
-                target_limits.setdefault("defaultRequest", {})["memory"] = annotations[
-                    "training.educates.dev/session.limits.defaultrequest.memory"
-                ]
-
-            if annotations.get(
-                "training.educates.dev/session.limits.default.cpu"
-            ):
-                target_limits.setdefault("default", {})["cpu"] = annotations[
-                    "training.educates.dev/session.limits.default.cpu"
-                ]
-            if annotations.get(
-                "training.educates.dev/session.limits.default.memory"
-            ):
-                target_limits.setdefault("default", {})["memory"] = annotations[
-                    "training.educates.dev/session.limits.default.memory"
-                ]
-
             logger.info(
                 "Creating workshop session object %s of type %s in namespace %s for workshop session %s.",
                 object_name,
@@ -1478,18 +1687,18 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             # can't manage to verify quotas after a period, give up.
             # This may result in a subsequent failure.
 
-            for _ in range(25):
-                resource_quota = pykube.ResourceQuota.objects(
+            wait_for_condition(
+                pykube.ResourceQuota.objects(
                     api, namespace=object_body["metadata"]["namespace"]
-                ).get(name=object_body["metadata"]["name"])
+                ).filter(
+                    field_selector={"metadata.name": object_body["metadata"]["name"]}
+                ),
+                lambda resource_quotas: len(resource_quotas) != 0
+                and _resource_quotas_ready(resource_quotas),
+                timeout=2.5,
+            )
 
-                if (
-                    not resource_quota.obj.get("status")
-                    or not resource_quota.obj["status"].get("used")
-                    or not resource_quota.obj["status"].get("hard")
-                ):
-                    time.sleep(0.1)
-                    continue
+    timer.mark("session-objects")
 
     # Work out the name of the workshop config secret to use for a session. This
     # will usually be the common workshop-config secret created with the
@@ -1516,16 +1725,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     username = spec["session"].get("username", "")
     password = spec["session"].get("password", "")
 
-    default_memory = "512Mi"
-
-    if applications.is_enabled("editor"):
-        default_memory = "1Gi"
-
-    workshop_memory = (
-        workshop_spec.get("session", {})
-        .get("resources", {})
-        .get("memory", default_memory)
-    )
+    workshop_memory = session_workshop_memory(workshop_spec, applications)
 
     google_tracking_id = (
         spec.get("analytics", {})
@@ -1545,1261 +1745,83 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         .get("trackingId", AMPLITUDE_TRACKING_ID)
     )
 
-    workshop_env_from = workshop_spec.get("session", {}).get("envFrom", [])
-    workshop_env_from = substitute_variables(workshop_env_from, session_variables)
-
-    deployment_body = {
-        "apiVersion": "apps/v1",
-        "kind": "Deployment",
-        "metadata": {
-            "name": session_namespace,
-            "namespace": workshop_namespace,
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/application": "workshop",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-                "training.educates.dev/session.services.workshop": "true",
-            },
-        },
-        "spec": {
-            "replicas": 1,
-            "selector": {"matchLabels": {"deployment": session_namespace}},
-            "strategy": {"type": "Recreate"},
-            "template": {
-                "metadata": {
-                    "labels": {
-                        "deployment": session_namespace,
-                        "training.educates.dev/component": "session",
-                        "training.educates.dev/application": "workshop",
-                        "training.educates.dev/workshop.name": workshop_name,
-                        "training.educates.dev/portal.name": portal_name,
-                        "training.educates.dev/portal.uid": portal_uid,
-                        "training.educates.dev/environment.name": environment_name,
-                        "training.educates.dev/environment.uid": environment_uid,
-                        "training.educates.dev/session.name": session_name,
-                        "training.educates.dev/session.services.workshop": "true",
-                    },
-                },
-                "spec": {
-                    "serviceAccountName": service_account,
-                    "securityContext": {
-                        "fsGroup": CLUSTER_STORAGE_GROUP,
-                        "supplementalGroups": [CLUSTER_STORAGE_GROUP],
-                    },
-                    "enableServiceLinks": False,
-                    "initContainers": [],
-                    "containers": [
-                        {
-                            "name": "workshop",
-                            "image": workshop_image,
-                            "imagePullPolicy": workshop_image_pull_policy,
-                            "securityContext": {
-                                "allowPrivilegeEscalation": False,
-                                "capabilities": {"drop": ["ALL"]},
-                                "runAsNonRoot": True,
-                                # "seccompProfile": {"type": "RuntimeDefault"},
-                                "privileged": False,
-                            },
-                            "resources": {
-                                "requests": {"memory": workshop_memory},
-                                "limits": {"memory": workshop_memory},
-                            },
-                            "ports": [
-                                {
-                                    "name": "10080-tcp",
-                                    "containerPort": 10080,
-                                    "protocol": "TCP",
-                                }
-                            ],
-                            "envFrom": workshop_env_from,
-                            "env": [
-                                {
-                                    "name": "GOOGLE_TRACKING_ID",
-                                    "value": google_tracking_id,
-                                },
-                                {
-                                    "name": "CLARITY_TRACKING_ID",
-                                    "value": clarity_tracking_id,
-                                },
-                                {
-                                    "name": "AMPLITUDE_TRACKING_ID",
-                                    "value": amplitude_tracking_id,
-                                },
-                                {
-                                    "name": "ENVIRONMENT_NAME",
-                                    "value": environment_name,
-                                },
-                                {
-                                    "name": "WORKSHOP_NAME",
-                                    "value": workshop_name,
-                                },
-                                {
-                                    "name": "WORKSHOP_VERSION",
-                                    "value": workshop_version,
-                                },
-                                {
-                                    "name": "WORKSHOP_NAMESPACE",
-                                    "value": workshop_namespace,
-                                },
-                                {
-                                    "name": "SESSION_NAMESPACE",
-                                    "value": session_namespace,
-                                },
-                                {
-                                    "name": "SESSION_NAME",
-                                    "value": session_name,
-                                },
-                                {
-                                    "name": "SESSION_ID",
-                                    "value": session_id,
-                                },
-                                {
-                                    "name": "SESSION_URL",
-                                    "value": session_url,
-                                },
-                                {
-                                    "name": "SESSION_HOSTNAME",
-                                    "value": session_hostname,
-                                },
-                                {
-                                    "name": "AUTH_USERNAME",
-                                    "value": username,
-                                },
-                                {
-                                    "name": "AUTH_PASSWORD",
-                                    "value": password,
-                                },
-                                {
-                                    "name": "GATEWAY_PORT",
-                                    "value": "10080",
-                                },
-                                {
-                                    "name": "CLUSTER_DOMAIN",
-                                    "value": CLUSTER_DOMAIN,
-                                },
-                                {
-                                    "name": "INGRESS_DOMAIN",
-                                    "value": INGRESS_DOMAIN,
-                                },
-                                {
-                                    "name": "INGRESS_PORT_SUFFIX",
-                                    "value": "",
-                                },
-                                {"name": "INGRESS_PROTOCOL", "value": INGRESS_PROTOCOL},
-                                {
-                                    "name": "SESSION_COOKIE_DOMAIN",
-                                    "value": cookie_domain,
-                                },
-                                {
-                                    "name": "IMAGE_REPOSITORY",
-                                    "value": image_repository,
-                                },
-                                {
-                                    "name": "OCI_IMAGE_CACHE",
-                                    "value": oci_image_cache,
-                                },
-                                {
-                                    "name": "ASSETS_REPOSITORY",
-                                    "value": assets_repository,
-                                },
-                                {"name": "INGRESS_CLASS", "value": INGRESS_CLASS},
-                                {
-                                    "name": "STORAGE_CLASS",
-                                    "value": CLUSTER_STORAGE_CLASS,
-                                },
-                                {
-                                    "name": "POLICY_ENGINE",
-                                    "value": CLUSTER_SECURITY_POLICY_ENGINE,
-                                },
-                                {
-                                    "name": "POLICY_NAME",
-                                    "value": namespace_security_policy,
-                                },
-                                {
-                                    "name": "SERVICES_PASSWORD",
-                                    "value": services_password,
-                                },
-                                {
-                                    "name": "CONFIG_PASSWORD",
-                                    "value": config_password,
-                                },
-                            ],
-                            "volumeMounts": [
-                                {
-                                    "name": "workshop-config",
-                                    "mountPath": "/opt/eduk8s/config",
-                                },
-                                {
-                                    "name": "workshop-theme",
-                                    "mountPath": "/opt/eduk8s/theme",
-                                },
-                            ],
-                        },
-                    ],
-                    "volumes": [
-                        {
-                            "name": "workshop-config",
-                            "secret": {"secretName": workshop_config_secret_name},
-                        },
-                        {
-                            "name": "workshop-theme",
-                            "secret": {"secretName": "workshop-theme"},
-                        },
-                    ],
-                    "hostAliases": [],
-                },
-            },
+    deployment_body = render_session_deployment(
+        workshop_spec,
+        session_variables,
+        labels,
+        {
+            "GOOGLE_TRACKING_ID": google_tracking_id,
+            "CLARITY_TRACKING_ID": clarity_tracking_id,
+            "AMPLITUDE_TRACKING_ID": amplitude_tracking_id,
+            "AUTH_USERNAME": username,
+            "AUTH_PASSWORD": password,
+            "SESSION_COOKIE_DOMAIN": cookie_domain,
+            "POLICY_NAME": namespace_security_policy,
         },
-    }
+        workshop_memory,
+        workshop_config_secret_name,
+        base_workshop_image,
+        storage,
+        storage_volume_name,
+        storage_volume_subpath,
+    )
 
     deployment_pod_template_spec = deployment_body["spec"]["template"]["spec"]
 
-    if RUNTIME_CLASS:
-        deployment_pod_template_spec["runtimeClassName"] = RUNTIME_CLASS
-
-    token_enabled = (
-        workshop_spec["session"]
-        .get("namespaces", {})
-        .get("security", {})
-        .get("token", {})
-        .get("enabled", True)
-    )
-
-    deployment_pod_template_spec["automountServiceAccountToken"] = False
+    # Work out whether workshop downloads require any secrets and if so we
+    # create an init container and perform workshop downloads from that rather
+    # than the main container so we don't need to expose secrets to the workshop
+    # user.
 
-    deployment_pod_template_spec["volumes"].append(
-        {
-            "name": "cluster-token",
-            "secret": {"secretName": f"{session_namespace}-token"},
-        },
-    )
+    def vendir_secrets_required(contents):
+        for content in contents:
+            if content.get("git", {}).get("secretRef"):
+                return True
+            if (
+                content.get("git", {})
+                .get("verification", {})
+                .get("publicKeysSecretRef")
+            ):
+                return True
+            elif content.get("hg", {}).get("secretRef"):
+                return True
+            elif content.get("http", {}).get("secretRef"):
+                return True
+            elif content.get("image", {}).get("secretRef"):
+                return True
+            elif content.get("imgpkgBundle", {}).get("secretRef"):
+                return True
+            elif content.get("githubRelease", {}).get("secretRef"):
+                return True
+            elif content.get("helmChart", {}).get("repository", {}).get("secretRef"):
+                return True
+            elif content.get("inline", {}).get("pathsFrom", []):
+                return True
 
-    if token_enabled:
-        deployment_pod_template_spec["containers"][0]["volumeMounts"].append(
-            {
-                "name": "cluster-token",
-                "mountPath": "/var/run/secrets/kubernetes.io/serviceaccount",
-                "readOnly": True,
-            },
-        )
+    workshop_files = workshop_spec.get("workshop", {}).get("files", [])
 
-    if INGRESS_CA_SECRET:
-        deployment_pod_template_spec["volumes"].extend(
-            [
-                {
-                    "name": "workshop-ca",
-                    "secret": {
-                        "secretName": INGRESS_CA_SECRET,
-                    },
-                },
-                {
-                    "name": "workshop-ca-trust",
-                    "emptyDir": {},
-                },
-            ]
-        )
-
-        certificates_init_container = {
-            "name": "ca-trust-store-initialization",
-            "image": base_workshop_image,
-            "imagePullPolicy": base_workshop_image_pull_policy,
-            "securityContext": {
-                "allowPrivilegeEscalation": False,
-                # Not sure why can't drop all capabilities here.
-                # "capabilities": {"drop": ["ALL"]},
-                "runAsNonRoot": False,
-                "runAsUser": 0,
-                # "seccompProfile": {"type": "RuntimeDefault"},
-            },
-            "command": ["/opt/eduk8s/sbin/setup-certificates"],
-            "resources": {
-                "requests": {"memory": workshop_memory},
-                "limits": {"memory": workshop_memory},
-            },
-            "volumeMounts": [
-                {
-                    "name": "workshop-ca",
-                    "mountPath": "/etc/pki/ca-trust/source/anchors/Cluster_Ingress_CA.pem",
-                    # "readOnly": True,
-                    "subPath": "ca.crt",
-                },
-                {"name": "workshop-ca-trust", "mountPath": "/mnt"},
-            ],
-        }
-
-        deployment_pod_template_spec["initContainers"].append(
-            certificates_init_container
-        )
-
-        deployment_pod_template_spec["containers"][0]["volumeMounts"].append(
-            {
-                "name": "workshop-ca-trust",
-                "mountPath": "/etc/pki/ca-trust",
-                "readOnly": True,
-            },
-        )
-
-    workshop_volume_subpath = "home/eduk8s"
-
-    if storage_volume_subpath:
-        workshop_volume_subpath = f"{storage_volume_subpath}/{workshop_volume_subpath}"
-
-    assets_volume_subpath = "opt/assets"
-
-    if storage_volume_subpath:
-        assets_volume_subpath = f"{storage_volume_subpath}/{assets_volume_subpath}"
-
-    packages_volume_subpath = "opt/packages"
-
-    if storage_volume_subpath:
-        packages_volume_subpath = f"{storage_volume_subpath}/{packages_volume_subpath}"
-
-    git_repos_volume_subpath = "opt/git/repositories"
-
-    if storage_volume_subpath:
-        git_repos_volume_subpath = (
-            f"{storage_volume_subpath}/{git_repos_volume_subpath}"
-        )
-
-    if storage_volume_name:
-        deployment_pod_template_spec["volumes"].append(
-            {
-                "name": "workshop-data",
-                "persistentVolumeClaim": {"claimName": storage_volume_name},
-            }
-        )
-
-    elif storage:
-        deployment_pod_template_spec["volumes"].append(
-            {
-                "name": "workshop-data",
-                "persistentVolumeClaim": {"claimName": session_namespace},
-            }
-        )
-
-    # elif applications.is_enabled("docker"):
-    #     if storage_volume_name:
-    #         deployment_pod_template_spec["volumes"].append(
-    #             {
-    #                 "name": "workshop-data",
-    #                 "persistentVolumeClaim": {"claimName": storage_volume_name},
-    #             }
-    #         )
-    #     else:
-    #         deployment_pod_template_spec["volumes"].append(
-    #             {"name": "workshop-data", "emptyDir": {}}
-    #         )
-
-    else:
-        deployment_pod_template_spec["volumes"].append(
-            {"name": "workshop-data", "emptyDir": {}}
-        )
-
-    deployment_pod_template_spec["containers"][0]["volumeMounts"].extend(
-        [
-            {
-                "name": "workshop-data",
-                "mountPath": "/home/eduk8s",
-                "subPath": workshop_volume_subpath,
-            },
-            {
-                "name": "workshop-data",
-                "mountPath": "/opt/assets",
-                "subPath": assets_volume_subpath,
-            },
-            {
-                "name": "workshop-data",
-                "mountPath": "/opt/packages",
-                "subPath": packages_volume_subpath,
-            },
-            {
-                "name": "workshop-data",
-                "mountPath": "/opt/git/repositories",
-                "subPath": git_repos_volume_subpath,
-            },
-        ]
-    )
-
-    # Since using at least an emptyDir for workshop user home directory we
-    # must always use an init container to copy the home directory from the
-    # workshop image to the volume.
-
-    if CLUSTER_STORAGE_USER:
-        # This hack is to cope with Kubernetes clusters which don't properly
-        # set up persistent volume ownership. IBM Kubernetes is one example.
-        # The init container runs as root and sets permissions on the
-        # storage and ensures it is group writable. Note that this will only
-        # work where pod security policies are not enforced. Don't attempt
-        # to use it if they are. If they are, this hack should not be
-        # required.
-
-        volume_init_container = {
-            "name": "storage-permissions-initialization",
-            "image": base_workshop_image,
-            "imagePullPolicy": base_workshop_image_pull_policy,
-            "securityContext": {
-                "allowPrivilegeEscalation": False,
-                "capabilities": {"drop": ["ALL"]},
-                "runAsNonRoot": False,
-                "runAsUser": 0,
-                # "seccompProfile": {"type": "RuntimeDefault"},
-            },
-            "command": ["/bin/sh", "-c"],
-            "args": [
-                f"chown {CLUSTER_STORAGE_USER}:{CLUSTER_STORAGE_GROUP} /mnt && chmod og+rwx /mnt"
-            ],
-            "resources": {
-                "requests": {"memory": workshop_memory},
-                "limits": {"memory": workshop_memory},
-            },
-            "volumeMounts": [{"name": "workshop-data", "mountPath": "/mnt"}],
-        }
-
-        deployment_pod_template_spec["initContainers"].append(volume_init_container)
-
-    workshop_init_container = {
-        "name": "workshop-volume-initialization",
-        "image": workshop_image,
-        "imagePullPolicy": workshop_image_pull_policy,
-        "securityContext": {
-            "allowPrivilegeEscalation": False,
-            "capabilities": {"drop": ["ALL"]},
-            "runAsNonRoot": True,
-            # "seccompProfile": {"type": "RuntimeDefault"},
-        },
-        "command": [
-            "/opt/eduk8s/sbin/setup-volume",
-            "/home/eduk8s",
-            f"/mnt/{workshop_volume_subpath}",
-        ],
-        "resources": {
-            "requests": {"memory": workshop_memory},
-            "limits": {"memory": workshop_memory},
-        },
-        "volumeMounts": [{"name": "workshop-data", "mountPath": "/mnt"}],
-    }
-
-    deployment_pod_template_spec["initContainers"].append(workshop_init_container)
-
-    # Work out whether workshop downloads require any secrets and if so we
-    # create an init container and perform workshop downloads from that rather
-    # than the main container so we don't need to expose secrets to the workshop
-    # user.
-
-    def vendir_secrets_required(contents):
-        for content in contents:
-            if content.get("git", {}).get("secretRef"):
-                return True
-            if (
-                content.get("git", {})
-                .get("verification", {})
-                .get("publicKeysSecretRef")
-            ):
-                return True
-            elif content.get("hg", {}).get("secretRef"):
-                return True
-            elif content.get("http", {}).get("secretRef"):
-                return True
-            elif content.get("image", {}).get("secretRef"):
-                return True
-            elif content.get("imgpkgBundle", {}).get("secretRef"):
-                return True
-            elif content.get("githubRelease", {}).get("secretRef"):
-                return True
-            elif content.get("helmChart", {}).get("repository", {}).get("secretRef"):
-                return True
-            elif content.get("inline", {}).get("pathsFrom", []):
-                return True
-
-    workshop_files = workshop_spec.get("workshop", {}).get("files", [])
-
-    need_secrets = vendir_secrets_required(workshop_files)
+    need_secrets = vendir_secrets_required(workshop_files)
 
     if not need_secrets:
         for package in workshop_spec.get("workshop", {}).get("packages", []):
             package_files = package.get("files", [])
             need_secrets = vendir_secrets_required(package_files)
             if need_secrets:
-                break
-
-    if need_secrets and environment_secrets:
-        # Need download secrets, so we need create a new secret which is a
-        # composite of all the other secrets so we can mount the full Kubernetes
-        # resource definitions for the secrets into the init container.
-
-        secret_body = {
-            "apiVersion": "v1",
-            "kind": "Secret",
-            "metadata": {
-                "name": f"{session_namespace}-vendir-secrets",
-                "namespace": workshop_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "data": environment_secrets,
-        }
-
-        kopf.adopt(secret_body, namespace_instance.obj)
-
-        pykube.Secret(api, secret_body).create()
-
-        deployment_pod_template_spec["volumes"].append(
-            {
-                "name": "vendir-secrets",
-                "secret": {"secretName": f"{session_namespace}-vendir-secrets"},
-            }
-        )
-
-        downloads_init_container = {
-            "name": "workshop-downloads-initialization",
-            "image": base_workshop_image,
-            "imagePullPolicy": base_workshop_image_pull_policy,
-            "securityContext": {
-                "allowPrivilegeEscalation": False,
-                "capabilities": {"drop": ["ALL"]},
-                "runAsNonRoot": True,
-                # "seccompProfile": {"type": "RuntimeDefault"},
-            },
-            "command": ["/opt/eduk8s/sbin/setup-downloads"],
-            "resources": {
-                "requests": {"memory": workshop_memory},
-                "limits": {"memory": workshop_memory},
-            },
-            "volumeMounts": [
-                {
-                    "name": "workshop-data",
-                    "mountPath": "/opt/assets",
-                    "subPath": assets_volume_subpath,
-                },
-                {
-                    "name": "workshop-data",
-                    "mountPath": "/opt/packages",
-                    "subPath": packages_volume_subpath,
-                },
-                {"name": "vendir-secrets", "mountPath": "/opt/secrets"},
-                {"name": "workshop-config", "mountPath": "/opt/eduk8s/config"},
-            ],
-        }
-
-        if INGRESS_CA_SECRET:
-            downloads_init_container["volumeMounts"].append(
-                {
-                    "name": "workshop-ca-trust",
-                    "mountPath": "/etc/pki/ca-trust",
-                    "readOnly": True,
-                },
-            )
-
-        deployment_pod_template_spec["initContainers"].append(downloads_init_container)
-
-    # Append any init containers specified in the workshop definition.
-
-    session_init_containers = workshop_spec["session"].get("initContainers", [])
-
-    session_init_containers = substitute_variables(
-        session_init_containers, session_variables
-    )
-
-    deployment_pod_template_spec["initContainers"].extend(session_init_containers)
-
-    # Apply any patches for the pod specification for the deployment which
-    # are specified in the workshop resource definition. This would be used
-    # to set resources and setup volumes. If the target item is a list, look
-    # for items within that which have a name field that matches a named item
-    # in the patch and attempt to merge that with one in the target, but
-    # don't do this if the item in the target was added by the patch as
-    # that is likely an attempt to deliberately add two named items, such
-    # as in the case of volume mounts.
-
-    for application in applications:
-        if applications.is_enabled(application):
-            deployment_patch = pod_template_spec_patches(
-                application, workshop_spec, applications.properties(application)
-            )
-            deployment_patch = substitute_variables(deployment_patch, session_variables)
-            smart_overlay_merge(deployment_pod_template_spec, deployment_patch)
-
-    if workshop_spec.get("session"):
-        deployment_patch = workshop_spec["session"].get("patches", {})
-        deployment_patch = substitute_variables(deployment_patch, session_variables)
-        smart_overlay_merge(deployment_pod_template_spec, deployment_patch)
-
-    # Apply any environment variable overrides for the workshop/environment.
-
-    def _apply_environment_patch(patch):
-        if not patch:
-            return
-
-        patch = substitute_variables(patch, session_variables)
-
-        if deployment_pod_template_spec["containers"][0].get("env") is None:
-            deployment_pod_template_spec["containers"][0]["env"] = patch
-        else:
-            smart_overlay_merge(
-                deployment_pod_template_spec["containers"][0]["env"],
-                patch,
-            )
-
-    if workshop_spec.get("session"):
-        _apply_environment_patch(workshop_spec["session"].get("env", []))
-
-    _apply_environment_patch(spec["session"].get("env", []))
-
-    # Add additional labels for any applications which have been enabled.
-
-    additional_env = []
-    additional_labels = {}
-
-    for application in applications:
-        if applications.is_enabled(application):
-            additional_labels[
-                f"training.educates.dev/session.applications.{application.lower()}"
-            ] = "true"
-
-    # Add in extra configuation for web console.
-
-    if applications.is_enabled("console"):
-        if applications.property("console", "vendor", "kubernetes") == "kubernetes":
-            secret_body = {
-                "apiVersion": "v1",
-                "kind": "Secret",
-                "metadata": {
-                    "name": "kubernetes-dashboard-csrf",
-                    "namespace": session_namespace,
-                    "labels": {
-                        "training.educates.dev/component": "session",
-                        "training.educates.dev/workshop.name": workshop_name,
-                        "training.educates.dev/portal.name": portal_name,
-                        "training.educates.dev/portal.uid": portal_uid,
-                        "training.educates.dev/environment.name": environment_name,
-                        "training.educates.dev/environment.uid": environment_uid,
-                        "training.educates.dev/session.name": session_name,
-                    },
-                },
-            }
-
-            pykube.Secret(api, secret_body).create()
-
-    # Add in extra configuration for special cases, as well as bind policy.
-
-    resource_objects = []
-
-    if applications.is_enabled("docker"):
-        docker_volumes = [{"name": "docker-socket", "emptyDir": {}}]
-
-        docker_volume_subpath = "var/lib/docker"
-
-        if storage_volume_subpath:
-            docker_volume_subpath = f"{storage_volume_subpath}/{docker_volume_subpath}"
-
-        if not storage_volume_name:
-            docker_volumes.append(
-                {
-                    "name": "docker-data",
-                    "persistentVolumeClaim": {
-                        "claimName": f"{session_namespace}-docker"
-                    },
-                }
-            )
-
-        deployment_pod_template_spec["volumes"].extend(docker_volumes)
-
-        docker_compose = applications.property("docker", "compose", {})
-        docker_socket = applications.property("docker", "socket.enabled", None)
-
-        if docker_socket or (docker_socket is None and not docker_compose):
-            docker_workshop_volume_mounts = [
-                {
-                    "name": "docker-socket",
-                    "mountPath": "/var/run/docker",
-                    "readOnly": True,
-                },
-            ]
-
-            deployment_pod_template_spec["containers"][0]["volumeMounts"].extend(
-                docker_workshop_volume_mounts
-            )
-
-        docker_memory = applications.property("docker", "memory", "768Mi")
-        docker_storage = applications.property("docker", "storage", "5Gi")
-
-        dockerd_image = DOCKER_IN_DOCKER_IMAGE
-        dockerd_image_pull_policy = image_pull_policy(dockerd_image)
-
-        # Build args for dockerd daemon ahead of inection into the pod's args list
-
-        dockerd_daemon_args = ["--host=unix:///var/run/workshop/docker.sock", f"--mtu={DOCKERD_MTU}"]
-
-        if applications.is_enabled("registry"):
-            if not INGRESS_SECRET:
-                dockerd_daemon_args.append(f"--insecure-registry={registry_host}")
-
-        if DOCKERD_MIRROR_REMOTE:
-            dockerd_daemon_args.extend(
-                [
-                    f"--insecure-registry={workshop_namespace}-mirror",
-                    f"--registry-mirror=http://{workshop_namespace}-mirror:5000",
-                ]
-            )
-
-        dockerd_args = [
-            "/bin/sh",
-            "-c",
-            f"mkdir -p /var/run/workshop && ln -s /var/run/workshop/docker.sock /var/run/docker.sock && (test -f /usr/local/share/ca-certificates/Cluster_Ingress_CA.crt && /usr/sbin/update-ca-certificates || true) && dockerd {' '.join(dockerd_daemon_args)}",
-        ]
-
-        docker_container = {
-            "name": "docker",
-            "image": dockerd_image,
-            "imagePullPolicy": dockerd_image_pull_policy,
-            "args": dockerd_args,
-            "securityContext": {
-                "allowPrivilegeEscalation": True,
-                "privileged": True,
-                "runAsUser": 0,
-                "capabilities": {"drop": ["KILL", "MKNOD", "SETUID", "SETGID"]},
-                # "seccompProfile": {"type": "RuntimeDefault"},
-            },
-            "resources": {
-                "limits": {"memory": docker_memory},
-                "requests": {"memory": docker_memory},
-            },
-            "volumeMounts": [
-                {
-                    "name": "docker-socket",
-                    "mountPath": "/var/run/workshop",
-                },
-                {
-                    "name": "workshop-data",
-                    "mountPath": "/home/eduk8s",
-                    "subPath": workshop_volume_subpath,
-                },
-            ],
-        }
-
-        if storage_volume_name:
-            docker_container["volumeMounts"].append(
-                {
-                    "name": "workshop-data",
-                    "mountPath": "/var/lib/docker",
-                    "subPath": docker_volume_subpath,
-                }
-            )
-        else:
-            docker_container["volumeMounts"].append(
-                {
-                    "name": "docker-data",
-                    "mountPath": "/var/lib/docker",
-                    "subPath": docker_volume_subpath,
-                }
-            )
-
-        if INGRESS_CA_SECRET:
-            docker_container["volumeMounts"].append(
-                {
-                    "name": "workshop-ca",
-                    "mountPath": "/usr/local/share/ca-certificates/Cluster_Ingress_CA.crt",
-                    # "readOnly": True,
-                    "subPath": "ca.crt",
-                },
-            )
-
-        deployment_pod_template_spec["containers"].append(docker_container)
-
-        deployment_body["metadata"]["labels"].update(
-            {"training.educates.dev/session.services.docker": "true"}
-        )
-        deployment_body["spec"]["template"]["metadata"]["labels"].update(
-            {"training.educates.dev/session.services.docker": "true"}
-        )
-
-        if not storage_volume_name:
-            docker_persistent_volume_claim = {
-                "apiVersion": "v1",
-                "kind": "PersistentVolumeClaim",
-                "metadata": {
-                    "name": f"{session_namespace}-docker",
-                    "namespace": workshop_namespace,
-                    "labels": {
-                        "training.educates.dev/component": "session",
-                        "training.educates.dev/workshop.name": workshop_name,
-                        "training.educates.dev/portal.name": portal_name,
-                        "training.educates.dev/portal.uid": portal_uid,
-                        "training.educates.dev/environment.name": environment_name,
-                        "training.educates.dev/environment.uid": environment_uid,
-                        "training.educates.dev/session.name": session_name,
-                    },
-                },
-                "spec": {
-                    "accessModes": [
-                        "ReadWriteOnce",
-                    ],
-                    "resources": {
-                        "requests": {
-                            "storage": docker_storage,
-                        }
-                    },
-                },
-            }
-
-            if CLUSTER_STORAGE_CLASS:
-                docker_persistent_volume_claim["spec"][
-                    "storageClassName"
-                ] = CLUSTER_STORAGE_CLASS
-
-            resource_objects = [docker_persistent_volume_claim]
-
-        if docker_compose:
-            # Where a volume mount references the named volume "workshop"
-            # convert that to a bind mount of workshop home directory. We
-            # should probably block certain types of mounts but allow
-            # everything for now.
-
-            docker_compose_services = xget(docker_compose, "services", {})
-
-            for docker_compose_service in docker_compose_services.values():
-                docker_compose_service_volumes = []
-
-                for volume_details in xget(docker_compose_service, "volumes", []):
-                    if xget(volume_details, "type") == "volume":
-                        if xget(volume_details, "source") == "workshop":
-                            docker_compose_service_volumes.append(
-                                {
-                                    "type": "bind",
-                                    "source": "/home/eduk8s",
-                                    "target": xget(volume_details, "target"),
-                                }
-                            )
-                        else:
-                            docker_compose_service_volumes.append(volume_details)
-                    else:
-                        docker_compose_service_volumes.append(volume_details)
-
-                docker_compose_service["volumes"] = docker_compose_service_volumes
-
-            docker_compose_config_map_body = {
-                "apiVersion": "v1",
-                "kind": "ConfigMap",
-                "metadata": {
-                    "name": f"{session_namespace}-docker-compose",
-                    "namespace": workshop_namespace,
-                    "labels": {
-                        "training.educates.dev/component": "session",
-                        "training.educates.dev/workshop.name": workshop_name,
-                        "training.educates.dev/portal.name": portal_name,
-                        "training.educates.dev/portal.uid": portal_uid,
-                        "training.educates.dev/environment.name": environment_name,
-                        "training.educates.dev/environment.uid": environment_uid,
-                        "training.educates.dev/session.name": session_name,
-                    },
-                },
-                "data": {
-                    "compose-dev.yaml": yaml.dump(
-                        substitute_variables(docker_compose, session_variables),
-                        Dumper=yaml.Dumper,
-                    )
-                },
-            }
-
-            resource_objects.append(docker_compose_config_map_body)
-
-            docker_compose_container = {
-                "name": "docker-compose",
-                "image": dockerd_image,
-                "imagePullPolicy": dockerd_image_pull_policy,
-                "command": [
-                    "docker",
-                    "--host=unix:///var/run/docker/docker.sock",
-                    "compose",
-                    "--file=/opt/eduk8s/config/compose-dev.yaml",
-                    "--project-directory=/home/eduk8s",
-                    f"--project-name={session_namespace}",
-                    "up",
-                ],
-                "securityContext": {
-                    "allowPrivilegeEscalation": False,
-                    "capabilities": {"drop": ["ALL"]},
-                    "runAsNonRoot": True,
-                    "runAsUser": 1001,
-                    "runAsGroup": 2375,
-                    # "seccompProfile": {"type": "RuntimeDefault"},
-                },
-                "resources": {
-                    "limits": {"memory": "256Mi"},
-                    "requests": {"memory": "32Mi"},
-                },
-                "env": [{"name": "HOME", "value": "/home/eduk8s"}],
-                "volumeMounts": [
-                    {
-                        "name": "docker-socket",
-                        "mountPath": "/var/run/docker",
-                        "readOnly": True,
-                    },
-                    {
-                        "name": "compose-config",
-                        "mountPath": "/opt/eduk8s/config",
-                    },
-                    {
-                        "name": "workshop-data",
-                        "mountPath": "/home/eduk8s",
-                        "subPath": workshop_volume_subpath,
-                    },
-                ],
-            }
-
-            docker_compose_volumes = [
-                {
-                    "name": "compose-config",
-                    "configMap": {
-                        "name": f"{session_namespace}-docker-compose",
-                    },
-                },
-            ]
-
-            deployment_pod_template_spec["volumes"].extend(docker_compose_volumes)
-
-            deployment_pod_template_spec["containers"].append(docker_compose_container)
-
-    for object_body in resource_objects:
-        object_body = substitute_variables(object_body, session_variables)
-        kopf.adopt(object_body, namespace_instance.obj)
-        create_from_dict(object_body)
-
-    # Add in extra configuration for registry and create session objects.
-
-    if applications.is_enabled("registry"):
-        registry_htpasswd_hash = bcrypt.hashpw(
-            bytes(registry_password, "ascii"), bcrypt.gensalt(prefix=b"2a")
-        ).decode("ascii")
-
-        registry_htpasswd = f"{registry_username}:{registry_htpasswd_hash}\n"
-
-        additional_env.append(
-            {
-                "name": "REGISTRY_HOST",
-                "value": registry_host,
-            }
-        )
-        additional_env.append(
-            {
-                "name": "REGISTRY_USERNAME",
-                "value": registry_username,
-            }
-        )
-        additional_env.append(
-            {
-                "name": "REGISTRY_PASSWORD",
-                "value": registry_password,
-            }
-        )
-        additional_env.append(
-            {
-                "name": "REGISTRY_AUTH_TOKEN",
-                "value": registry_auth_token,
-            }
-        )
-        additional_env.append(
-            {
-                "name": "REGISTRY_SECRET",
-                "value": registry_secret,
-            }
-        )
-
-        registry_volumes = [
-            {
-                "name": "registry",
-                "configMap": {
-                    "name": f"{session_namespace}-registry",
-                    "items": [{"key": "config.json", "path": "config.json"}],
-                },
-            },
-        ]
-
-        deployment_body["spec"]["template"]["spec"]["volumes"].extend(registry_volumes)
-
-        registry_workshop_volume_mounts = [
-            {
-                "name": "registry",
-                "mountPath": "/var/run/registry",
-            },
-        ]
-
-        deployment_pod_template_spec["containers"][0]["volumeMounts"].extend(
-            registry_workshop_volume_mounts
-        )
-
-        registry_memory = applications.property("registry", "memory", "768Mi")
-        registry_storage = applications.property("registry", "storage", "5Gi")
-
-        registry_volume_name = substitute_variables(
-            applications.property("registry", "volume.name", ""),
-            session_variables,
-        )
-
-        if registry_volume_name:
-            registry_storage = None
-
-            registry_volume_subpath = substitute_variables(
-                applications.property("registry", "volume.subPath", ""),
-                session_variables,
-            )
-
-            if registry_volume_subpath:
-                registry_volume_subpath = f"{registry_volume_subpath}/var/lib/registry"
-            else:
-                registry_volume_subpath = "var/lib/registry"
-
-        else:
-            registry_volume_subpath = "var/lib/registry"
-
-        if not registry_volume_name:
-            registry_volume_name = f"{session_namespace}-registry"
-
-        if registry_storage:
-            registry_persistent_volume_claim_body = {
-                "apiVersion": "v1",
-                "kind": "PersistentVolumeClaim",
-                "metadata": {
-                    "name": f"{session_namespace}-registry",
-                    "namespace": workshop_namespace,
-                    "labels": {
-                        "training.educates.dev/component": "session",
-                        "training.educates.dev/workshop.name": workshop_name,
-                        "training.educates.dev/portal.name": portal_name,
-                        "training.educates.dev/portal.uid": portal_uid,
-                        "training.educates.dev/environment.name": environment_name,
-                        "training.educates.dev/environment.uid": environment_uid,
-                        "training.educates.dev/session.name": session_name,
-                    },
-                },
-                "spec": {
-                    "accessModes": ["ReadWriteOnce"],
-                    "resources": {"requests": {"storage": registry_storage}},
-                },
-            }
-
-            if CLUSTER_STORAGE_CLASS:
-                registry_persistent_volume_claim_body["spec"][
-                    "storageClassName"
-                ] = CLUSTER_STORAGE_CLASS
-
-        registry_config = {"auths": {registry_host: {"auth": f"{registry_auth_token}"}}}
-
-        registry_config_map_body = {
-            "apiVersion": "v1",
-            "kind": "ConfigMap",
-            "metadata": {
-                "name": f"{session_namespace}-registry",
-                "namespace": workshop_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "data": {
-                "htpasswd": registry_htpasswd,
-                "config.json": json.dumps(registry_config, indent=4),
-            },
-        }
-
-        registry_image = DOCKER_REGISTRY_IMAGE
-        registry_image_pull_policy = image_pull_policy(registry_image)
-
-        registry_deployment_body = {
-            "apiVersion": "apps/v1",
-            "kind": "Deployment",
-            "metadata": {
-                "name": f"{session_namespace}-registry",
-                "namespace": workshop_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/application": "registry",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                    "training.educates.dev/session.services.registry": "true",
-                },
-            },
-            "spec": {
-                "replicas": 1,
-                "selector": {
-                    "matchLabels": {"deployment": f"{session_namespace}-registry"}
-                },
-                "strategy": {"type": "Recreate"},
-                "template": {
-                    "metadata": {
-                        "labels": {
-                            "deployment": f"{session_namespace}-registry",
-                            "training.educates.dev/component": "session",
-                            "training.educates.dev/application": "registry",
-                            "training.educates.dev/workshop.name": workshop_name,
-                            "training.educates.dev/portal.name": portal_name,
-                            "training.educates.dev/portal.uid": portal_uid,
-                            "training.educates.dev/environment.name": environment_name,
-                            "training.educates.dev/environment.uid": environment_uid,
-                            "training.educates.dev/session.name": session_name,
-                            "training.educates.dev/session.services.registry": "true",
-                        },
-                    },
-                    "spec": {
-                        "serviceAccountName": "educates-services",
-                        "initContainers": [],
-                        "containers": [
-                            {
-                                "name": "registry",
-                                "image": registry_image,
-                                "imagePullPolicy": registry_image_pull_policy,
-                                "securityContext": {
-                                    "allowPrivilegeEscalation": False,
-                                    "capabilities": {"drop": ["ALL"]},
-                                    "runAsNonRoot": True,
-                                    # "seccompProfile": {"type": "RuntimeDefault"},
-                                },
-                                "resources": {
-                                    "limits": {"memory": registry_memory},
-                                    "requests": {"memory": registry_memory},
-                                },
-                                "ports": [{"containerPort": 5000, "protocol": "TCP"}],
-                                "env": [
-                                    {
-                                        "name": "REGISTRY_STORAGE_DELETE_ENABLED",
-                                        "value": "true",
-                                    },
-                                    {"name": "REGISTRY_AUTH", "value": "htpasswd"},
-                                    {
-                                        "name": "REGISTRY_AUTH_HTPASSWD_REALM",
-                                        "value": "Image Registry",
-                                    },
-                                    {
-                                        "name": "REGISTRY_AUTH_HTPASSWD_PATH",
-                                        "value": "/auth/htpasswd",
-                                    },
-                                ],
-                                "volumeMounts": [
-                                    {
-                                        "name": "data",
-                                        "mountPath": "/var/lib/registry",
-                                        "subPath": registry_volume_subpath,
-                                    },
-                                    {"name": "auth", "mountPath": "/auth"},
-                                ],
-                            }
-                        ],
-                        "securityContext": {
-                            "runAsUser": 1000,
-                            "fsGroup": CLUSTER_STORAGE_GROUP,
-                            "supplementalGroups": [CLUSTER_STORAGE_GROUP],
-                        },
-                        "volumes": [
-                            {
-                                "name": "data",
-                                "persistentVolumeClaim": {
-                                    "claimName": registry_volume_name
-                                },
-                            },
-                            {
-                                "name": "auth",
-                                "configMap": {
-                                    "name": f"{session_namespace}-registry",
-                                    "items": [{"key": "htpasswd", "path": "htpasswd"}],
-                                },
-                            },
-                        ],
-                    },
-                },
-            },
-        }
-
-        if CLUSTER_STORAGE_USER:
-            # This hack is to cope with Kubernetes clusters which don't
-            # properly set up persistent volume ownership. IBM
-            # Kubernetes is one example. The init container runs as root
-            # and sets permissions on the storage and ensures it is
-            # group writable. Note that this will only work where pod
-            # security policies are not enforced. Don't attempt to use
-            # it if they are. If they are, this hack should not be
-            # required.
-
-            workshop_init_container = {
-                "name": "storage-permissions-initialization",
-                "image": registry_image,
-                "imagePullPolicy": registry_image_pull_policy,
-                "securityContext": {
-                    "allowPrivilegeEscalation": False,
-                    "capabilities": {"drop": ["ALL"]},
-                    "runAsNonRoot": False,
-                    "runAsUser": 0,
-                    # "seccompProfile": {"type": "RuntimeDefault"},
-                },
-                "command": ["/bin/sh", "-c"],
-                "args": [
-                    f"chown {CLUSTER_STORAGE_USER}:{CLUSTER_STORAGE_GROUP} /mnt && chmod og+rwx /mnt"
-                ],
-                "resources": {
-                    "limits": {"memory": registry_memory},
-                    "requests": {"memory": registry_memory},
-                },
-                "volumeMounts": [{"name": "data", "mountPath": "/mnt"}],
-            }
-
-            registry_deployment_body["spec"]["template"]["spec"][
-                "initContainers"
-            ].append(workshop_init_container)
-
-        registry_service_body = {
-            "apiVersion": "v1",
-            "kind": "Service",
-            "metadata": {
-                "name": f"{session_namespace}-registry",
-                "namespace": workshop_namespace,
-                "labels": {
-                    "training.educates.dev/component": "session",
-                    "training.educates.dev/application": "registry",
-                    "training.educates.dev/workshop.name": workshop_name,
-                    "training.educates.dev/portal.name": portal_name,
-                    "training.educates.dev/portal.uid": portal_uid,
-                    "training.educates.dev/environment.name": environment_name,
-                    "training.educates.dev/environment.uid": environment_uid,
-                    "training.educates.dev/session.name": session_name,
-                },
-            },
-            "spec": {
-                "type": "ClusterIP",
-                "ports": [{"port": 5000, "targetPort": 5000}],
-                "selector": {"deployment": f"{session_namespace}-registry"},
-            },
-        }
+                break
+
+    if need_secrets and environment_secrets:
+        # Need download secrets, so we need create a new secret which is a
+        # composite of all the other secrets so we can mount the full Kubernetes
+        # resource definitions for the secrets into the init container.
 
-        registry_ingress_body = {
-            "apiVersion": "networking.k8s.io/v1",
-            "kind": "Ingress",
+        secret_body = {
+            "apiVersion": "v1",
+            "kind": "Secret",
             "metadata": {
-                "name": f"{session_namespace}-registry",
+                "name": f"{session_namespace}-vendir-secrets",
                 "namespace": workshop_namespace,
-                "annotations": {"nginx.ingress.kubernetes.io/proxy-body-size": "512m"},
                 "labels": {
                     "training.educates.dev/component": "session",
-                    "training.educates.dev/application": "registry",
                     "training.educates.dev/workshop.name": workshop_name,
                     "training.educates.dev/portal.name": portal_name,
                     "training.educates.dev/portal.uid": portal_uid,
@@ -2808,398 +1830,183 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
                     "training.educates.dev/session.name": session_name,
                 },
             },
-            "spec": {
-                "rules": [
-                    {
-                        "host": registry_host,
-                        "http": {
-                            "paths": [
-                                {
-                                    "path": "/",
-                                    "pathType": "Prefix",
-                                    "backend": {
-                                        "service": {
-                                            "name": f"{session_namespace}-registry",
-                                            "port": {"number": 5000},
-                                        }
-                                    },
-                                }
-                            ]
-                        },
-                    }
-                ]
-            },
+            "data": environment_secrets,
         }
 
-        if INGRESS_SECRET:
-            registry_ingress_body["metadata"]["annotations"].update(
-                {
-                    "ingress.kubernetes.io/force-ssl-redirect": "true",
-                    "nginx.ingress.kubernetes.io/ssl-redirect": "true",
-                    "nginx.ingress.kubernetes.io/force-ssl-redirect": "true",
-                }
-            )
-
-        if INGRESS_SECRET:
-            registry_ingress_body["spec"]["tls"] = [
-                {
-                    "hosts": [registry_host],
-                    "secretName": INGRESS_SECRET,
-                }
-            ]
-
-        registry_objects = [
-            registry_config_map_body,
-            registry_deployment_body,
-            registry_service_body,
-            registry_ingress_body,
-        ]
-
-        if registry_storage:
-            registry_objects.insert(0, registry_persistent_volume_claim_body)
-
-        for object_body in registry_objects:
-            object_body = substitute_variables(object_body, session_variables)
-            kopf.adopt(object_body, namespace_instance.obj)
-            create_from_dict(object_body)
-
-    # Apply any additional environment variables to the deployment.
-
-    _apply_environment_patch(additional_env)
-
-    # Overlay any additional labels to the deployment.
-
-    deployment_body["metadata"]["labels"].update(additional_labels)
-    deployment_body["spec"]["template"]["metadata"]["labels"].update(additional_labels)
-
-    # Create a secret which contains the SSH key pair so that it can be
-    # mounted into the workshop container.
-
-    ssh_keys_secret_body = {
-        "apiVersion": "v1",
-        "kind": "Secret",
-        "metadata": {
-            "name": f"{session_namespace}-ssh-keys",
-            "namespace": workshop_namespace,
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            },
-        },
-        "data": {
-            "id_rsa": base64.b64encode(ssh_private_key.encode("utf-8")).decode("utf-8"),
-            "id_rsa.pub": base64.b64encode(ssh_public_key.encode("utf-8")).decode(
-                "utf-8"
-            ),
-        },
-    }
-
-    deployment_pod_template_spec["volumes"].append(
-        {
-            "name": "ssh-keys",
-            "secret": {
-                "secretName": f"{session_namespace}-ssh-keys",
-                "defaultMode": 0o600,
-            },
-        },
-    )
-
-    deployment_pod_template_spec["containers"][0]["volumeMounts"].append(
-        {
-            "name": "ssh-keys",
-            "mountPath": "/opt/ssh-keys",
-            "readOnly": True,
-        },
-    )
-
-    # Append any volume definitions and corresponding volume mounts. The volume
-    # mounts are only applied to the workshop container. If any extra special
-    # mounts are required for side car containers, a patch would need to be used
-    # instead.
-
-    extra_volumes_list = workshop_spec["session"].get("volumes", [])
-    extra_volume_mounts_list = workshop_spec["session"].get("volumeMounts", [])
+        kopf.adopt(secret_body, namespace_instance.obj)
 
-    if extra_volumes_list:
-        deployment_pod_template_spec["volumes"].extend(
-            substitute_variables(extra_volumes_list, session_variables)
-        )
+        pykube.Secret(api, secret_body).create()
 
-    if extra_volume_mounts_list:
-        deployment_pod_template_spec["containers"][0]["volumeMounts"].extend(
-            substitute_variables(extra_volume_mounts_list, session_variables)
+        deployment_pod_template_spec["volumes"].append(
+            {
+                "name": "vendir-secrets",
+                "secret": {"secretName": f"{session_namespace}-vendir-secrets"},
+            }
         )
 
-    # Create a service so that the workshop environment can be accessed.
-    # This is only internal to the cluster, so port forwarding or an
-    # ingress is still needed to access it from outside of the cluster.
-
-    service_body = {
-        "apiVersion": "v1",
-        "kind": "Service",
-        "metadata": {
-            "name": session_namespace,
-            "namespace": workshop_namespace,
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/application": "workshop",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
+        downloads_init_container = {
+            "name": "workshop-downloads-initialization",
+            "image": base_workshop_image,
+            "imagePullPolicy": base_workshop_image_pull_policy,
+            "securityContext": {
+                "allowPrivilegeEscalation": False,
+                "capabilities": {"drop": ["ALL"]},
+                "runAsNonRoot": True,
+                # "seccompProfile": {"type": "RuntimeDefault"},
             },
-        },
-        "spec": {
-            "type": "ClusterIP",
-            "ports": [
+            "command": ["/opt/eduk8s/sbin/setup-downloads"],
+            "resources": {
+                "requests": {"memory": workshop_memory},
+                "limits": {"memory": workshop_memory},
+            },
+            "volumeMounts": [
                 {
-                    "name": "80-tcp",
-                    "port": 80,
-                    "protocol": "TCP",
-                    "targetPort": 10080,
-                }
+                    "name": "workshop-data",
+                    "mountPath": "/opt/assets",
+                    "subPath": session_volume_subpath(
+                        storage_volume_subpath, "opt/assets"
+                    ),
+                },
+                {
+                    "name": "workshop-data",
+                    "mountPath": "/opt/packages",
+                    "subPath": session_volume_subpath(
+                        storage_volume_subpath, "opt/packages"
+                    ),
+                },
+                {"name": "vendir-secrets", "mountPath": "/opt/secrets"},
+                {"name": "workshop-config", "mountPath": "/opt/eduk8s/config"},
             ],
-            "selector": {"deployment": session_namespace},
-        },
-    }
+        }
 
-    if applications.is_enabled("sshd"):
-        service_body["spec"]["ports"].append(
-            {
-                "name": "22-tcp",
-                "port": 22,
-                "protocol": "TCP",
-                "targetPort": 2022,
-            }
-        )
+        if INGRESS_CA_SECRET:
+            downloads_init_container["volumeMounts"].append(
+                {
+                    "name": "workshop-ca-trust",
+                    "mountPath": "/etc/pki/ca-trust",
+                    "readOnly": True,
+                },
+            )
 
-    # Create the ingress for the workshop, including any for extra named
-    # named ingresses.
+        deployment_pod_template_spec["initContainers"].append(downloads_init_container)
 
-    ingress_rules = [
-        {
-            "host": session_hostname,
-            "http": {
-                "paths": [
-                    {
-                        "path": "/",
-                        "pathType": "Prefix",
-                        "backend": {
-                            "service": {
-                                "name": session_namespace,
-                                "port": {"number": 80},
-                            }
-                        },
-                    }
-                ]
-            },
-        }
-    ]
+    # Append any init containers specified in the workshop definition, then
+    # apply any patches for the pod specification for the deployment which
+    # are specified by applications or in the workshop resource definition,
+    # and any environment variable overrides for the workshop/environment.
 
-    websocket_routes = ["/"]
+    apply_session_patches(
+        deployment_body, session_template, workshop_spec, spec, session_variables
+    )
 
-    if applications.is_enabled("sshd") and applications.property(
-        "sshd", "tunnel.enabled", False
-    ):
-        ingress_rules.insert(
-            0,
-            {
-                "host": session_hostname,
-                "http": {
-                    "paths": [
-                        {
-                            "path": "/tunnel/",
-                            "pathType": "Prefix",
-                            "backend": {
-                                "service": {
-                                    "name": "tunnel-manager",
-                                    "port": {"number": 8080},
-                                }
-                            },
-                        }
-                    ]
-                },
-            },
-        )
+    # Add additional labels for any applications which have been enabled.
 
-        websocket_routes.append("/tunnel/")
+    add_application_labels(deployment_body, applications)
 
-    ingresses = []
-    ingress_hostnames = []
+    # Add in extra configuation for web console.
 
-    if workshop_spec.get("session"):
-        ingresses = workshop_spec["session"].get("ingresses", [])
-
-    if applications.is_enabled("console"):
-        ingress_hostnames.append(f"console-{session_namespace}.{INGRESS_DOMAIN}")
-        # Suffix use is deprecated. See prior note.
-        ingress_hostnames.append(f"{session_namespace}-console.{INGRESS_DOMAIN}")
-    if applications.is_enabled("editor"):
-        ingress_hostnames.append(f"editor-{session_namespace}.{INGRESS_DOMAIN}")
-        # Suffix use is deprecated. See prior note.
-        ingress_hostnames.append(f"{session_namespace}-editor.{INGRESS_DOMAIN}")
-
-    for ingress in ingresses:
-        ingress_hostnames.append(
-            f"{ingress['name']}-{session_namespace}.{INGRESS_DOMAIN}"
-        )
-        # Suffix use is deprecated. See prior note.
-        ingress_hostnames.append(
-            f"{session_namespace}-{ingress['name']}.{INGRESS_DOMAIN}"
-        )
+    for object_body in render_console_objects(
+        session_namespace, applications, labels
+    ):
+        create_from_dict(object_body)
 
-    for ingress_hostname in ingress_hostnames:
-        ingress_rules.append(
-            {
-                "host": ingress_hostname,
-                "http": {
-                    "paths": [
-                        {
-                            "path": "/",
-                            "pathType": "Prefix",
-                            "backend": {
-                                "service": {
-                                    "name": session_namespace,
-                                    "port": {"number": 80},
-                                }
-                            },
-                        }
-                    ]
-                },
-            }
-        )
+    # Add in the docker daemon and image registry if enabled, creating any
+    # resources they require.
 
-    ingress_body = {
-        "apiVersion": "networking.k8s.io/v1",
-        "kind": "Ingress",
-        "metadata": {
-            "name": session_namespace,
-            "namespace": workshop_namespace,
-            "annotations": {
-                "nginx.ingress.kubernetes.io/enable-cors": "true",
-                "nginx.ingress.kubernetes.io/proxy-send-timeout": "3600",
-                "nginx.ingress.kubernetes.io/proxy-read-timeout": "3600",
-                "projectcontour.io/websocket-routes": ",".join(websocket_routes),
-                "projectcontour.io/response-timeout": "3600s",
-            },
-            "labels": {
-                "training.educates.dev/component": "session",
-                "training.educates.dev/application": "workshop",
-                "training.educates.dev/workshop.name": workshop_name,
-                "training.educates.dev/portal.name": portal_name,
-                "training.educates.dev/portal.uid": portal_uid,
-                "training.educates.dev/environment.name": environment_name,
-                "training.educates.dev/environment.uid": environment_uid,
-                "training.educates.dev/session.name": session_name,
-            },
-        },
-        "spec": {
-            "rules": ingress_rules,
-        },
-    }
+    resource_objects = add_docker_daemon(
+        deployment_body,
+        applications,
+        session_variables,
+        labels,
+        storage_volume_name,
+        storage_volume_subpath,
+        pinned_images.get(DOCKER_IN_DOCKER_IMAGE, DOCKER_IN_DOCKER_IMAGE),
+    )
 
-    if INGRESS_SECRET:
-        ingress_body["metadata"]["annotations"].update(
-            {
-                "ingress.kubernetes.io/force-ssl-redirect": "true",
-                "nginx.ingress.kubernetes.io/ssl-redirect": "true",
-                "nginx.ingress.kubernetes.io/force-ssl-redirect": "true",
-            }
+    resource_objects.extend(
+        add_image_registry(
+            deployment_body,
+            applications,
+            session_variables,
+            labels,
+            registry_htpasswd_hash,
+            pinned_images.get(DOCKER_REGISTRY_IMAGE, DOCKER_REGISTRY_IMAGE),
         )
+    )
 
-    if INGRESS_SECRET:
-        ingress_body["spec"]["tls"] = [
-            {
-                "hosts": [session_hostname] + ingress_hostnames,
-                "secretName": INGRESS_SECRET,
-            }
-        ]
+    # When the image registry is shared by all workshop sessions of the
+    # workshop environment, the credentials for the workshop session also
+    # need to be added to it.
 
-    if INGRESS_CLASS:
-        ingress_body["spec"]["ingressClassName"] = INGRESS_CLASS
+    if applications.is_enabled("registry") and applications.property(
+        "registry", "shared", False
+    ):
+        add_shared_registry_user(
+            workshop_namespace,
+            applications.property("registry", "username"),
+            registry_htpasswd_hash,
+        )
 
-    # Update deployment with host aliases for the ports which ingresses are
-    # targeting. This is so thay can be accessed by hostname rather than by
-    # localhost. If follow convention of accessing by hostname then can be
-    # compatible if workshop deployed with docker-compose. Note that originally
-    # was using suffixes for the ingress name but switched to a prefix as DNS
-    # resolvers like nip.io support a prefix on a hostname consisting of an IP
-    # address which could also be useful when using docker-compose.
-    #
-    # Note this probably isn't needed now as when host is defined for ingress
-    # implicitly proxy to localhost anyway and so don't need these special host
-    # names for embedded components.
+    pipeline = CreationPipeline()
 
-    hostnames = []
+    for index, object_body in enumerate(resource_objects):
+        kopf.adopt(object_body, namespace_instance.obj)
+        pipeline.add(f"resource-{index}", create_from_dict, object_body)
 
-    hostnames.extend(
-        [
-            f"console-{session_namespace}",
-            f"editor-{session_namespace}",
-        ]
-    )
+    pipeline.run()
 
-    # Suffix use is deprecated. See prior note.
+    # Create a secret which contains the SSH key pair so that it can be
+    # mounted into the workshop container, and append any volume definitions
+    # and corresponding volume mounts. The volume mounts are only applied to
+    # the workshop container. If any extra special mounts are required for
+    # side car containers, a patch would need to be used instead.
 
-    hostnames.extend(
-        [
-            f"{session_namespace}-console",
-            f"{session_namespace}-editor",
-        ]
+    ssh_keys_secret_body = render_ssh_keys_secret(
+        session_namespace, workshop_namespace, session_variables, labels
     )
 
-    # if session_namespace != "workshop":
-    #     hostnames.extend(
-    #         [
-    #             f"console-workshop",
-    #             f"editor-workshop",
-    #         ]
-    #     )
+    add_session_volumes(deployment_body, workshop_spec, session_variables)
 
-    for ingress in ingresses:
-        hostnames.append(f"{ingress['name']}-{session_namespace}")
-
-        # if session_namespace != "workshop":
-        #     hostnames.append(f"{ingress['name']}-workshop")
+    # Create a service so that the workshop environment can be accessed.
+    # This is only internal to the cluster, so port forwarding or an
+    # ingress is still needed to access it from outside of the cluster.
 
-        # Suffix use is deprecated. See prior note.
+    service_body = render_session_service(
+        session_namespace, workshop_namespace, applications, labels
+    )
 
-        hostnames.append(f"{session_namespace}-{ingress['name']}")
+    # Create the ingress for the workshop, including any for extra named
+    # named ingresses.
 
-    host_aliases = [
-        {
-            "ip": "127.0.0.1",
-            "hostnames": hostnames,
-        }
-    ]
+    ingress_body = render_session_ingress(
+        session_namespace,
+        workshop_namespace,
+        session_hostname,
+        workshop_spec,
+        applications,
+        labels,
+    )
 
-    deployment_pod_template_spec["hostAliases"].extend(host_aliases)
+    timer.mark("render-deployment")
 
     # Finally create the deployment, service and ingress for the workshop
     # session.
 
     kopf.adopt(ssh_keys_secret_body, namespace_instance.obj)
-
-    pykube.Secret(api, ssh_keys_secret_body).create()
-
     kopf.adopt(deployment_body, namespace_instance.obj)
-
-    pykube.Deployment(api, deployment_body).create()
-
     kopf.adopt(service_body, namespace_instance.obj)
+    kopf.adopt(ingress_body, namespace_instance.obj)
 
-    pykube.Service(api, service_body).create()
+    pipeline = CreationPipeline()
 
-    kopf.adopt(ingress_body, namespace_instance.obj)
+    pipeline.add("ssh-keys", pykube.Secret(api, ssh_keys_secret_body).create)
+    pipeline.add("deployment", pykube.Deployment(api, deployment_body).create)
+    pipeline.add("service", pykube.Service(api, service_body).create)
+    pipeline.add("ingress", pykube.Ingress(api, ingress_body).create)
 
-    pykube.Ingress(api, ingress_body).create()
+    pipeline.run()
+
+    timer.mark("deployment")
 
     # Report analytics event workshop session should be ready.
 
@@ -3234,16 +2041,24 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     if not portal_name:
         changes["phase"] = phase
 
+    changes["timings"] = timer.finish()
+
     patch["status"] = {
         "educates": changes,
     }
 
+    # Provision namespaces in advance for the workshop sessions which are
+    # expected to be created next for the workshop environment.
+
+    replenish_session_namespaces(environment_instance.obj, session_id)
+
 
 @kopf.on.delete(
     "training.educates.dev",
     "v1beta1",
     "workshopsessions",
     optional=True,
+    when=session_is_local,
 )
 def workshop_session_delete(**_):
     """Nothing to do here at this point because the owner references will
@@ -3255,7 +2070,49 @@ def workshop_session_delete(**_):
     # session is deleted.
 
 
-@kopf.on.event("training.educates.dev", "v1beta1", "workshopsessions")
+@kopf.on.field(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopsessions",
+    field="spec.session.hibernated",
+    when=session_is_local,
+)
+def workshop_session_hibernate(name, old, new, patch, **_):
+    """Hibernate the workshop session when it is marked as hibernated, either
+    due to being idle or explicitly, and resume it when the mark is removed.
+    The training portal removes the mark when the user next accesses the
+    workshop session. The time of hibernation is recorded so the training
+    portal can treat a workshop session which stays hibernated as orphaned,
+    as the workshop instance can't be asked how long it has been idle."""
+
+    if new:
+        logger.info("Hibernating workshop session %s.", name)
+
+        hibernate_session(name)
+
+        patch["status"] = {
+            "educates": {
+                "hibernated": True,
+                "hibernatedAt": datetime.now(timezone.utc).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                ),
+            }
+        }
+
+    elif old:
+        logger.info("Resuming workshop session %s.", name)
+
+        resume_session(name)
+
+        patch["status"] = {"educates": {"hibernated": False, "hibernatedAt": None}}
+
+
+@kopf.on.event(
+    "training.educates.dev",
+    "v1beta1",
+    "workshopsessions",
+    when=session_is_local,
+)
 def workshop_session_event(type, event, **_):  # pylint: disable=redefined-builtin
     """Log when a workshop session is deleted."""
 
@@ -3265,6 +2122,135 @@ def workshop_session_event(type, event, **_):  # pylint: disable=redefined-built
             event["object"]["metadata"]["name"],
         )
 
+        _startup_recorded.discard(event["object"]["metadata"]["name"])
+
+        # Credentials for a shared image registry aren't removed along with
+        # the session namespace so need to be removed explicitly.
+
+        spec = event["object"]["spec"]
+
+        workshop_namespace = spec["environment"]["name"]
+
+        try:
+            environment_instance = workshop_environments.get(workshop_namespace)
+
+        except pykube.exceptions.ObjectDoesNotExist:
+            return
+
+        if xget(
+            environment_instance.obj,
+            "status.educates.workshop.spec.session.applications.registry.shared",
+            False,
+        ):
+            remove_shared_registry_user(
+                workshop_namespace, f"{workshop_namespace}-{spec['session']['id']}"
+            )
+
+
+# Names of workshop sessions for which the time taken to start the workshop pod
+# has already been recorded. The record in the status of the workshop session
+# is checked as well, so that the times are not recorded again when the
+# operator is restarted.
+
+_startup_recorded = set()
+
+
+def _parse_timestamp(timestamp):
+    return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z")
+
+
+def _workshop_pod_stages(pod):
+    # Returns the times at which the workshop pod was scheduled to a node, the
+    # workshop container was started, meaning the image had been pulled, and
+    # the pod became ready.
+
+    stages = {}
+
+    status = pod.get("status", {})
+
+    for condition in status.get("conditions", []):
+        if condition.get("status") != "True" or not condition.get(
+            "lastTransitionTime"
+        ):
+            continue
+
+        if condition["type"] == "PodScheduled":
+            stages["scheduled"] = _parse_timestamp(condition["lastTransitionTime"])
+        elif condition["type"] == "Ready":
+            stages["ready"] = _parse_timestamp(condition["lastTransitionTime"])
+
+    for container in status.get("containerStatuses", []):
+        if container["name"] == "workshop":
+            started = xget(container, "state.running.startedAt") or xget(
+                container, "state.terminated.startedAt"
+            )
+
+            if started:
+                stages["pulled"] = _parse_timestamp(started)
+
+    return stages
+
+
+def _record_session_startup(pod):
+    # Records how long it took from creation of the workshop session for the
+    # workshop pod to reach each stage of starting up. This is only done once
+    # the pod is first ready.
+
+    labels = pod["metadata"]["labels"]
+
+    session_name = labels["training.educates.dev/session.name"]
+
+    if session_name in _startup_recorded:
+        return
+
+    stages = _workshop_pod_stages(pod)
+
+    if "ready" not in stages:
+        return
+
+    _startup_recorded.add(session_name)
+
+    try:
+        session = WorkshopSession.objects(api).get(name=session_name)
+
+    except pykube.exceptions.ObjectDoesNotExist:
+        return
+
+    if xget(session.obj, "status.educates.startup"):
+        return
+
+    created = _parse_timestamp(session.obj["metadata"]["creationTimestamp"])
+
+    durations = {
+        stage: max(0.0, (when - created).total_seconds())
+        for stage, when in stages.items()
+    }
+
+    observe_session_startup(
+        labels["training.educates.dev/environment.name"],
+        labels.get("training.educates.dev/workshop.name", ""),
+        durations,
+    )
+
+    session.patch(
+        {
+            "status": {
+                "educates": {
+                    "startup": {
+                        stage: int(duration * 1000)
+                        for stage, duration in durations.items()
+                    }
+                }
+            }
+        }
+    )
+
+    logger.info(
+        "Workshop session %s took %.1fs to become ready.",
+        session_name,
+        durations["ready"],
+    )
+
 
 @kopf.on.event(
     "",
@@ -3277,9 +2263,11 @@ def workshop_session_event(type, event, **_):  # pylint: disable=redefined-built
         "training.educates.dev/environment.name": kopf.PRESENT,
         "training.educates.dev/session.name": kopf.PRESENT,
     },
+    when=labels_are_local,
 )
 def workshop_session_pod_event(type, event, **_):  # pylint: disable=redefined-builtin
-    """Log the status of deployment of any workshop session pods."""
+    """Log the status of deployment of any workshop session pods and record
+    how long the workshop pod took to start."""
 
     pod_name = event["object"]["metadata"]["name"]
     pod_namespace = event["object"]["metadata"]["namespace"]
@@ -3302,3 +2290,6 @@ def workshop_session_pod_event(type, event, **_):  # pylint: disable=redefined-b
             pod_namespace,
             pod_status,
         )
+
+    if type != "DELETED":
+        _record_session_startup(event["object"])
@@ -12,6 +12,7 @@ from threading import Thread, Event
 
 import kopf
 import pykube
+import prometheus_client
 
 logging.basicConfig(level=logging.INFO)
 
@@ -68,6 +69,16 @@ from handlers import workshopallocation
 from handlers import trainingportal
 
 from handlers import daemons
+from handlers import scheduling
+from handlers import kubeclient
+
+from handlers.operator_config import (
+    METRICS_PORT,
+    SESSION_MANAGER_ORDINAL,
+    SESSION_MANAGER_REPLICAS,
+    SESSION_MANAGER_SHARD,
+    SESSION_MANAGER_SHARDS,
+)
 
 _event_loop = None  # pylint: disable=invalid-nam
 
@@ -86,6 +97,37 @@ def configure(settings: kopf.OperatorSettings, **_):
     settings.watching.server_timeout = 5 * 60
     settings.watching.client_timeout = settings.watching.server_timeout + 10
 
+    # Handlers deemed latency critical but which are normally run as background
+    # work need to know which executor kopf uses for synchronous handlers.
+
+    scheduling.configure_executors(settings)
+
+    # Expose metrics, such as the time taken to provision resources, for
+    # scraping by Prometheus. A port of 0 disables the metrics endpoint.
+
+    if METRICS_PORT:
+        logger.info("Serving metrics on port %s.", METRICS_PORT)
+
+        prometheus_client.start_http_server(METRICS_PORT)
+
+    # When work is split into shards across multiple replicas, each shard
+    # uses a separate kopf peering object. Any standby replicas for a shard
+    # take over if the replica with higher priority handling that shard stops.
+    # Replicas with a lower ordinal are given a higher priority.
+
+    if SESSION_MANAGER_REPLICAS > 1:
+        logger.info(
+            "Handling shard %s of %s as replica %s.",
+            SESSION_MANAGER_SHARD,
+            SESSION_MANAGER_SHARDS,
+            SESSION_MANAGER_ORDINAL,
+        )
+
+        settings.peering.name = f"educates-session-manager-{SESSION_MANAGER_SHARD}"
+        settings.peering.priority = 1000 - SESSION_MANAGER_ORDINAL
+        settings.peering.clusterwide = True
+        settings.peering.mandatory = True
+
 
 @kopf.on.login()
 def login_fn(**kwargs):
@@ -95,8 +137,7 @@ def login_fn(**kwargs):
 @kopf.on.probe(id="api")
 def check_api_access(**kwargs):
     try:
-        api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-        pykube.Namespace.objects(api).get(name="default")
+        pykube.Namespace.objects(kubeclient.api).get(name="default")
 
     except pykube.exceptions.KubernetesError:
         logger.error("Failed request to Kubernetes API.")
@@ -131,6 +172,14 @@ def run_kopf():
 
         _event_loop.create_task(daemons.purge_namespaces())
 
+        # Schedule background task to hibernate idle workshop sessions.
+
+        _event_loop.create_task(daemons.hibernate_sessions())
+
+        # Schedule background task to remove stale shared registry users.
+
+        _event_loop.create_task(daemons.reconcile_registry_users())
+
         with contextlib.closing(_event_loop):
             # Run event loop until flagged to shutdown.
 
@@ -0,0 +1,291 @@
+"""Token issuer for the image registry shared by workshop sessions.
+
+The shared image registry uses token authentication, with this server run in
+a sidecar container issuing the tokens. A client authenticates with the
+username and password of a workshop session, which are checked against the
+htpasswd entries held in the config map for the shared image registry. The
+token issued only grants access to repositories under the path given by the
+username, which is the name of the session namespace, so a workshop session
+can't access images pushed by another workshop session.
+
+    python registry_token.py
+
+The server is configured using environment variables for the port to listen
+on, the directory holding the htpasswd entries, the files holding the key and
+certificate used to sign tokens, and the issuer and service names which the
+image registry expects in tokens.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bcrypt
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+TOKEN_PORT = int(os.environ.get("TOKEN_PORT", "5001"))
+TOKEN_USERS_DIRECTORY = os.environ.get("TOKEN_USERS_DIRECTORY", "/auth/users")
+TOKEN_KEY_FILE = os.environ.get("TOKEN_KEY_FILE", "/auth/token/tls.key")
+TOKEN_CERTIFICATE_FILE = os.environ.get("TOKEN_CERTIFICATE_FILE", "/auth/token/tls.crt")
+TOKEN_ISSUER = os.environ.get("TOKEN_ISSUER", "educates-registry-token-issuer")
+TOKEN_SERVICE = os.environ.get("TOKEN_SERVICE", "")
+TOKEN_EXPIRATION = int(os.environ.get("TOKEN_EXPIRATION", "300"))
+
+_granted_actions = ("pull", "push", "delete")
+
+logger = logging.getLogger("registry-token")
+
+
+def _base64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class TokenIssuer:
+    """Checks the credentials of workshop sessions and issues tokens scoped
+    to the repositories belonging to the workshop session."""
+
+    def __init__(self, users_directory, key_file, certificate_file, issuer, service):
+        self.users_directory = users_directory
+        self.issuer = issuer
+        self.service = service
+
+        with open(key_file, "rb") as fp:
+            self._key = serialization.load_pem_private_key(fp.read(), password=None)
+
+        with open(certificate_file, "rb") as fp:
+            certificate = x509.load_pem_x509_certificate(fp.read())
+
+        self._certificate_chain = [
+            base64.b64encode(certificate.public_bytes(serialization.Encoding.DER))
+            .decode("ascii")
+        ]
+
+        # Checking a password against a bcrypt hash is deliberately slow, so
+        # credentials which have already been checked are remembered.
+
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def _htpasswd_hash(self, username):
+        # The entry for each workshop session is held in a separate file
+        # named after the username, with the same format as in a htpasswd
+        # file. The username can't be used to read another file as a path.
+
+        if not username or "/" in username or username.startswith("."):
+            return None
+
+        try:
+            with open(
+                os.path.join(self.users_directory, username), encoding="utf-8"
+            ) as fp:
+                entry = fp.read().strip()
+
+        except OSError:
+            return None
+
+        name, _, password_hash = entry.partition(":")
+
+        if name != username or not password_hash:
+            return None
+
+        return password_hash
+
+    def authenticate(self, username, password):
+        """Returns whether the username and password are those of a workshop
+        session which still exists."""
+
+        password_hash = self._htpasswd_hash(username)
+
+        if not password_hash:
+            return False
+
+        key = hashlib.sha256(
+            f"{username}:{password}:{password_hash}".encode("utf-8")
+        ).digest()
+
+        with self._lock:
+            if key in self._verified:
+                return True
+
+        try:
+            if not bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("ascii")):
+                return False
+
+        except ValueError:
+            return False
+
+        with self._lock:
+            self._verified.add(key)
+
+        return True
+
+    def access(self, username, scopes):
+        """Returns the access granted to the workshop session for the scopes
+        requested. Only repositories under the path given by the username
+        can be accessed."""
+
+        access = []
+
+        for scope in scopes:
+            parts = scope.split(":")
+
+            if len(parts) < 3 or parts[0] != "repository":
+                continue
+
+            name = ":".join(parts[1:-1])
+            actions = parts[-1].split(",")
+
+            if not name.startswith(f"{username}/"):
+                continue
+
+            granted = [action for action in actions if action in _granted_actions]
+
+            if granted:
+                access.append({"type": "repository", "name": name, "actions": granted})
+
+        return access
+
+    def token(self, username, access):
+        """Returns a token signed for the image registry granting the access."""
+
+        now = int(time.time())
+
+        header = {
+            "typ": "JWT",
+            "alg": "RS256",
+            "x5c": self._certificate_chain,
+        }
+
+        claims = {
+            "iss": self.issuer,
+            "sub": username,
+            "aud": self.service,
+            "exp": now + TOKEN_EXPIRATION,
+            "nbf": now - 10,
+            "iat": now,
+            "jti": secrets.token_hex(16),
+            "access": access,
+        }
+
+        payload = ".".join(
+            _base64url(json.dumps(part, separators=(",", ":")).encode("utf-8"))
+            for part in (header, claims)
+        )
+
+        signature = self._key.sign(
+            payload.encode("ascii"), padding.PKCS1v15(), hashes.SHA256()
+        )
+
+        return f"{payload}.{_base64url(signature)}"
+
+
+class TokenRequestHandler(BaseHTTPRequestHandler):
+    issuer = None
+
+    def _credentials(self):
+        authorization = self.headers.get("Authorization", "")
+
+        scheme, _, value = authorization.partition(" ")
+
+        if scheme.lower() != "basic":
+            return None, None
+
+        try:
+            decoded = base64.b64decode(value.strip()).decode("utf-8")
+        except ValueError:
+            return None, None
+
+        username, _, password = decoded.partition(":")
+
+        return username, password
+
+    def _respond(self, status, body, headers={}):
+        content = json.dumps(body).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path == "/healthz":
+            self._respond(200, {})
+            return
+
+        if url.path != "/token":
+            self._respond(404, {"details": "Not found."})
+            return
+
+        username, password = self._credentials()
+
+        if not username or not self.issuer.authenticate(username, password):
+            self._respond(
+                401,
+                {"details": "Authentication required."},
+                {"WWW-Authenticate": 'Basic realm="Image Registry"'},
+            )
+            return
+
+        query = urllib.parse.parse_qs(url.query)
+
+        scopes = [
+            scope
+            for value in query.get("scope", [])
+            for scope in value.split(" ")
+            if scope
+        ]
+
+        token = self.issuer.token(username, self.issuer.access(username, scopes))
+
+        self._respond(
+            200,
+            {
+                "token": token,
+                "access_token": token,
+                "expires_in": TOKEN_EXPIRATION,
+                "issued_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+        )
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s - %(message)s")
+
+    TokenRequestHandler.issuer = TokenIssuer(
+        TOKEN_USERS_DIRECTORY,
+        TOKEN_KEY_FILE,
+        TOKEN_CERTIFICATE_FILE,
+        TOKEN_ISSUER,
+        TOKEN_SERVICE,
+    )
+
+    server = ThreadingHTTPServer(("", TOKEN_PORT), TokenRequestHandler)
+
+    logger.info("Issuing registry tokens on port %s.", TOKEN_PORT)
+
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
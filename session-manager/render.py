@@ -0,0 +1,412 @@
+"""Renders the resources created for a workshop without needing a cluster.
+
+For each Workshop resource found in the supplied YAML files, the additional
+resources which would be created for a workshop environment and a workshop
+session are rendered using placeholder values for anything which would only
+be known when running in a cluster, such as uids and generated passwords.
+This includes the main resources for a workshop session, such as the session
+namespace with its role bindings, limit range and resource quotas, and the
+deployment, service and ingress for the workshop instance, along with the
+containers and resources added for applications such as docker and the image
+registry. Secrets copied from the cluster are not included.
+
+Run with --summary to instead output counts of the rendered resources and the
+CPU time taken to render them, averaged over --repeat iterations. This can be
+used to track the cost of rendering the sample workshops over time.
+
+    python render.py ../workshop-samples/*/resources/workshop.yaml
+"""
+
+import argparse
+import copy
+import sys
+import time
+
+import yaml
+
+from handlers.helpers import image_pull_policy, substitute_variables
+from handlers.kyverno_rules import kyverno_environment_rules
+from handlers.operator_config import (
+    BASE_ENVIRONMENT_IMAGE,
+    CLUSTER_DOMAIN,
+    CLUSTER_STORAGE_CLASS,
+    DOCKER_IN_DOCKER_IMAGE,
+    DOCKER_REGISTRY_IMAGE,
+    IMAGE_REPOSITORY,
+    INGRESS_CLASS,
+    INGRESS_DOMAIN,
+    INGRESS_PROTOCOL,
+    INGRESS_SECRET,
+    PLATFORM_ARCH,
+    WORKSHOP_SECURITY_RULES_ENGINE,
+    resolve_workshop_image,
+)
+from handlers.rendering import (
+    add_application_labels,
+    add_docker_daemon,
+    add_image_registry,
+    add_session_volumes,
+    apply_registry_credentials,
+    apply_session_patches,
+    build_session_template,
+    render_console_objects,
+    render_environment_objects,
+    render_namespace_setup_objects,
+    render_session_deployment,
+    render_session_ingress,
+    render_session_namespace,
+    render_session_objects,
+    render_session_service,
+    render_session_service_account,
+    render_ssh_keys_secret,
+    render_variables_secret,
+    resolve_namespace_budget,
+    resolve_workshop_spec,
+    session_labels,
+    session_namespace_settings,
+    session_storage_settings,
+    session_workshop_memory,
+)
+
+
+def load_workshops(paths):
+    workshops = []
+
+    for path in paths:
+        with open(path) as fp:
+            for resource in yaml.safe_load_all(fp):
+                if resource and resource.get("kind") == "Workshop":
+                    workshops.append(resource)
+
+    return workshops
+
+
+def common_variables(workshop, environment_name):
+    workshop_name = workshop["metadata"]["name"]
+    workshop_spec = workshop["spec"]
+
+    workshop_namespace = environment_name
+
+    assets_repository = f"assets-server.{workshop_namespace}.svc.{CLUSTER_DOMAIN}"
+    oci_image_cache = f"image-cache.{workshop_namespace}.svc.{CLUSTER_DOMAIN}"
+
+    return dict(
+        platform_arch=PLATFORM_ARCH,
+        image_repository=IMAGE_REPOSITORY,
+        oci_image_cache=oci_image_cache,
+        assets_repository=assets_repository,
+        workshop_name=workshop_name,
+        workshop_version=workshop_spec.get("version", "latest"),
+        environment_name=environment_name,
+        workshop_namespace=workshop_namespace,
+        training_portal="",
+        cluster_domain=CLUSTER_DOMAIN,
+        ingress_domain=INGRESS_DOMAIN,
+        ingress_protocol=INGRESS_PROTOCOL,
+        ingress_port="443" if INGRESS_PROTOCOL == "https" else "80",
+        ingress_port_suffix="",
+        ingress_secret=INGRESS_SECRET or "",
+        ingress_class=INGRESS_CLASS,
+        storage_class=CLUSTER_STORAGE_CLASS,
+    )
+
+
+def render_session_resources(workshop_spec, applications, template, variables):
+    """Returns the session namespace and the resources created in it when it
+    is set up, plus the service account, secrets, deployment, service and
+    ingress for the workshop instance, and any resources for the docker daemon
+    and image registry."""
+
+    session_namespace = variables["session_namespace"]
+    workshop_namespace = variables["workshop_namespace"]
+
+    labels = session_labels(
+        variables["workshop_name"],
+        "",
+        "",
+        variables["environment_name"],
+        "00000000-0000-0000-0000-000000000000",
+        variables["session_name"],
+    )
+
+    role, budget, limits, security_policy = session_namespace_settings(workshop_spec)
+
+    objects = [render_session_namespace(session_namespace, labels, security_policy)]
+
+    objects.extend(
+        render_namespace_setup_objects(
+            session_namespace,
+            workshop_namespace,
+            variables["service_account"],
+            role,
+            resolve_namespace_budget(budget),
+            limits,
+            security_policy,
+            labels,
+        )
+    )
+
+    objects.extend(
+        render_session_service_account(
+            variables["service_account"],
+            workshop_namespace,
+            session_namespace,
+            labels,
+            {"training.educates.dev/component": "portal"},
+        )
+    )
+
+    objects.append(
+        render_variables_secret(session_namespace, workshop_namespace, variables, labels)
+    )
+
+    storage, storage_volume_name, storage_volume_subpath = session_storage_settings(
+        workshop_spec, variables
+    )
+
+    deployment_body = render_session_deployment(
+        workshop_spec,
+        variables,
+        labels,
+        {
+            "GOOGLE_TRACKING_ID": "",
+            "CLARITY_TRACKING_ID": "",
+            "AMPLITUDE_TRACKING_ID": "",
+            "AUTH_USERNAME": "",
+            "AUTH_PASSWORD": "",
+            "SESSION_COOKIE_DOMAIN": "",
+            "POLICY_NAME": security_policy,
+        },
+        session_workshop_memory(workshop_spec, applications),
+        "workshop-config",
+        BASE_ENVIRONMENT_IMAGE,
+        storage,
+        storage_volume_name,
+        storage_volume_subpath,
+    )
+
+    apply_session_patches(deployment_body, template, workshop_spec, {}, variables)
+
+    add_application_labels(deployment_body, applications)
+
+    objects.extend(render_console_objects(session_namespace, applications, labels))
+
+    objects.extend(
+        add_docker_daemon(
+            deployment_body,
+            applications,
+            variables,
+            labels,
+            storage_volume_name,
+            storage_volume_subpath,
+            DOCKER_IN_DOCKER_IMAGE,
+        )
+    )
+
+    objects.extend(
+        add_image_registry(
+            deployment_body,
+            applications,
+            variables,
+            labels,
+            "registry-htpasswd-hash",
+            DOCKER_REGISTRY_IMAGE,
+        )
+    )
+
+    add_session_volumes(deployment_body, workshop_spec, variables)
+
+    objects.extend(
+        [
+            render_ssh_keys_secret(
+                session_namespace, workshop_namespace, variables, labels
+            ),
+            deployment_body,
+            render_session_service(
+                session_namespace, workshop_namespace, applications, labels
+            ),
+            render_session_ingress(
+                session_namespace,
+                workshop_namespace,
+                variables["session_hostname"],
+                workshop_spec,
+                applications,
+                labels,
+            ),
+        ]
+    )
+
+    return objects
+
+
+def render_workshop(workshop, environment_name, session_id):
+    """Returns the resources for the workshop environment and a single
+    workshop session, and the number of pod template patches which would be
+    applied to the workshop session deployment."""
+
+    workshop_name = workshop["metadata"]["name"]
+
+    # The workshop definition is updated in place when resolved, so work with
+    # a copy so the same definition can be rendered more than once.
+
+    workshop_spec = copy.deepcopy(workshop["spec"])
+    workshop_spec.setdefault("session", {})
+
+    applications = resolve_workshop_spec(workshop_spec)
+
+    variables = common_variables(workshop, environment_name)
+
+    workshop_image = workshop_spec.get("workshop", {}).get(
+        "image", workshop_spec.get("content", {}).get("image", "base-environment:*")
+    )
+    workshop_image = resolve_workshop_image(
+        substitute_variables(workshop_image, variables)
+    )
+
+    variables.update(
+        workshop_image=workshop_image,
+        workshop_image_pull_policy=image_pull_policy(workshop_image),
+    )
+
+    environment_variables = dict(
+        variables,
+        workshop_environment_uid="00000000-0000-0000-0000-000000000000",
+        environment_token="",
+        service_account="educates-services",
+    )
+
+    for variable in substitute_variables(
+        workshop_spec.get("environment", {}).get("variables", []),
+        environment_variables,
+    ):
+        environment_variables[variable["name"]] = variable["value"]
+
+    objects = []
+
+    if WORKSHOP_SECURITY_RULES_ENGINE == "kyverno":
+        objects.extend(kyverno_environment_rules(workshop_spec, environment_name))
+
+    objects.extend(
+        render_environment_objects(
+            workshop_spec,
+            applications,
+            [],
+            environment_variables,
+            environment_name,
+            {
+                "training.educates.dev/component": "environment",
+                "training.educates.dev/workshop.name": workshop_name,
+                "training.educates.dev/environment.name": environment_name,
+                "training.educates.dev/environment.objects": "true",
+            },
+        )
+    )
+
+    session_name = f"{environment_name}-{session_id}"
+    session_hostname = f"{session_name}.{INGRESS_DOMAIN}"
+
+    session_variables = dict(
+        variables,
+        workshop_session_uid="00000000-0000-0000-0000-000000000000",
+        session_id=session_id,
+        session_name=session_name,
+        session_namespace=session_name,
+        service_account=session_name,
+        session_url=f"{INGRESS_PROTOCOL}://{session_hostname}",
+        session_hostname=session_hostname,
+        ssh_private_key="",
+        ssh_public_key="",
+        ssh_keys_secret=f"{session_name}-ssh-keys",
+        services_password="services-password",
+        config_password="config-password",
+    )
+
+    for variable in workshop_spec["session"].get("variables", []):
+        session_variables[variable["name"]] = substitute_variables(
+            variable["value"], session_variables
+        )
+
+    if applications.is_enabled("registry"):
+        apply_registry_credentials(
+            applications, environment_name, session_name, "registry-password"
+        )
+
+        session_variables.update(
+            registry_host=applications.property("registry", "host"),
+            registry_username=applications.property("registry", "username"),
+            registry_password=applications.property("registry", "password"),
+            registry_auth_token=applications.property("registry", "basic_auth_token"),
+            registry_secret=applications.property("registry", "secret"),
+        )
+
+    template = build_session_template(workshop_spec, applications)
+
+    objects.extend(
+        render_session_resources(
+            workshop_spec, applications, template, session_variables
+        )
+    )
+
+    objects.extend(
+        render_session_objects(
+            template,
+            session_variables,
+            session_name,
+            {
+                "training.educates.dev/component": "session",
+                "training.educates.dev/workshop.name": workshop_name,
+                "training.educates.dev/environment.name": environment_name,
+                "training.educates.dev/session.name": session_name,
+                "training.educates.dev/session.objects": "true",
+            },
+        )
+    )
+
+    return objects, len(template["pod_template_spec_patches"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render the resources created for workshops offline."
+    )
+
+    parser.add_argument("paths", nargs="+", help="YAML files holding workshops")
+    parser.add_argument(
+        "--environment", help="name of the workshop environment (<workshop>-w01)"
+    )
+    parser.add_argument("--session-id", default="s001", help="session id (s001)")
+    parser.add_argument(
+        "--summary",
+        action="store_true",
+        help="output counts and render times instead of resources",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="times to render each workshop"
+    )
+
+    args = parser.parse_args()
+
+    for workshop in load_workshops(args.paths):
+        workshop_name = workshop["metadata"]["name"]
+        environment_name = args.environment or f"{workshop_name}-w01"
+
+        started = time.process_time()
+
+        for _ in range(max(1, args.repeat)):
+            objects, patches = render_workshop(
+                workshop, environment_name, args.session_id
+            )
+
+        elapsed = (time.process_time() - started) / max(1, args.repeat)
+
+        if args.summary:
+            print(
+                f"{workshop_name}: objects={len(objects)} patches={patches} "
+                f"cpu={elapsed * 1000:.3f}ms"
+            )
+        else:
+            yaml.safe_dump_all(objects, sys.stdout, explicit_start=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmarks rendering the resources for the sample workshops.
+
+Requires pytest and pytest-benchmark, and is run from the directory above:
+
+    python -m pytest tests --benchmark-columns=min,mean,max
+"""
+
+import glob
+import os
+
+import pytest
+
+from render import load_workshops, render_workshop
+
+SAMPLES = sorted(
+    glob.glob(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+            "..",
+            "workshop-samples",
+            "*",
+            "resources",
+            "workshop.yaml",
+        )
+    )
+)
+
+# None of the sample workshops enable the docker daemon or the image registry,
+# which add the most resources, so a workshop which does is also rendered.
+
+DOCKER_WORKSHOP = {
+    "apiVersion": "training.educates.dev/v1beta1",
+    "kind": "Workshop",
+    "metadata": {"name": "lab-docker-registry"},
+    "spec": {
+        "session": {
+            "applications": {
+                "docker": {
+                    "enabled": True,
+                    "compose": {"services": {"web": {"image": "nginx"}}},
+                },
+                "registry": {"enabled": True},
+            }
+        }
+    },
+}
+
+WORKSHOPS = load_workshops(SAMPLES) + [DOCKER_WORKSHOP]
+
+
+@pytest.mark.parametrize(
+    "workshop", WORKSHOPS, ids=[workshop["metadata"]["name"] for workshop in WORKSHOPS]
+)
+def test_render_workshop(benchmark, workshop):
+    environment_name = f"{workshop['metadata']['name']}-w01"
+
+    objects, _ = benchmark(render_workshop, workshop, environment_name, "s001")
+
+    kinds = {object_body["kind"] for object_body in objects}
+
+    assert {"Namespace", "ServiceAccount", "Deployment", "Service", "Ingress"} <= kinds
+
+    deployment = next(
+        object_body
+        for object_body in objects
+        if object_body["kind"] == "Deployment"
+        and object_body["metadata"]["name"] == f"{environment_name}-s001"
+    )
+
+    assert deployment["spec"]["template"]["spec"]["containers"][0]["name"] == "workshop"
+
+
+def test_render_docker_registry():
+    objects, _ = render_workshop(DOCKER_WORKSHOP, "lab-docker-registry-w01", "s001")
+
+    names = {(body["kind"], body["metadata"]["name"]) for body in objects}
+
+    session_name = "lab-docker-registry-w01-s001"
+
+    assert {
+        ("PersistentVolumeClaim", f"{session_name}-docker"),
+        ("ConfigMap", f"{session_name}-docker-compose"),
+        ("ConfigMap", f"{session_name}-registry"),
+        ("Deployment", f"{session_name}-registry"),
+    } <= names
+
+    deployment = next(
+        body
+        for body in objects
+        if body["kind"] == "Deployment" and body["metadata"]["name"] == session_name
+    )
+
+    containers = deployment["spec"]["template"]["spec"]["containers"]
+
+    assert [container["name"] for container in containers] == [
+        "workshop",
+        "docker",
+        "docker-compose",
+    ]
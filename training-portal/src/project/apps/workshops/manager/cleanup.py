@@ -6,7 +6,7 @@ later deleting historical records of sessions and inactive anonymous users.
 import traceback
 import logging
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 import pykube
 import requests
@@ -93,6 +93,28 @@ def purge_expired_workshop_sessions():
                 # these, a reserved session which has been running for a while,
                 # will be incorrectly seen as orhpaned.
 
+                # A workshop session which was hibernated because it was idle
+                # can't be asked how long it has been idle, so the time since
+                # it was hibernated is used instead. As it was already idle
+                # for a period before being hibernated, this will only ever
+                # be less than the actual idle time.
+
+                hibernated_time = workshop_session_hibernated_time(session.name)
+
+                if hibernated_time is not None:
+                    if hibernated_time >= session.environment.orphaned:
+                        logger.info(
+                            "Schedule deletion of orphaned workshop session %s after being hibernated for %s seconds.",
+                            session.name,
+                            hibernated_time.total_seconds(),
+                        )
+
+                        report_analytics_event(session, "Session/Orphaned")
+
+                        delete_workshop_session(session).schedule()
+
+                    continue
+
                 try:
                     # Query the idle time from the workshop session instance.
                     # Use the internal Kubernetes service for accessing the
@@ -169,6 +191,32 @@ def purge_expired_workshop_sessions():
                     )
 
 
+def workshop_session_hibernated_time(name):
+    """Returns how long the workshop session has been hibernated, or None if
+    it isn't hibernated or the time it was hibernated isn't known."""
+
+    K8SWorkshopSession = pykube.object_factory(
+        api, "training.educates.dev/v1beta1", "WorkshopSession"
+    )
+
+    try:
+        resource = K8SWorkshopSession.objects(api).get(name=name)
+
+    except pykube.exceptions.PyKubeError:
+        return None
+
+    status = resource.obj.get("status", {}).get("educates", {})
+
+    if not status.get("hibernated") or not status.get("hibernatedAt"):
+        return None
+
+    hibernated_at = datetime.strptime(
+        status["hibernatedAt"], "%Y-%m-%dT%H:%M:%S%z"
+    )
+
+    return timezone.now() - hibernated_at
+
+
 @background_task
 @resources_lock
 def delete_workshop_session(session):
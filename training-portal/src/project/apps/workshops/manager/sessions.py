@@ -223,6 +223,42 @@ def update_session_status(name, phase, user=None):
         logger.exception("Failed to update status of workshop session %s.", name)
 
 
+def resume_workshop_session(name):
+    """Resume the workshop session if the operator had hibernated it because
+    it was idle. The operator scales the workshop session back up when the
+    hibernated flag is cleared. Returns whether the workshop session is being
+    resumed, in which case the workshop instance will not be available until
+    it has started up again.
+
+    """
+
+    try:
+        K8SWorkshopSession = pykube.object_factory(
+            api, "training.educates.dev/v1beta1", "WorkshopSession"
+        )
+
+        resource = K8SWorkshopSession.objects(api).get(name=name)
+
+        if resource.obj["spec"].get("session", {}).get("hibernated"):
+            resource.patch({"spec": {"session": {"hibernated": False}}})
+
+            logger.info("Requested resume of hibernated workshop session %s.", name)
+
+            return True
+
+        return bool(
+            resource.obj.get("status", {}).get("educates", {}).get("hibernated")
+        )
+
+    except pykube.exceptions.ObjectDoesNotExist:
+        pass
+
+    except pykube.exceptions.PyKubeError:
+        logger.exception("Failed to resume workshop session %s.", name)
+
+    return False
+
+
 def create_workshop_session(session, secret):
     """Triggers the deployment of a new workshop session to the cluster."""
 
@@ -332,6 +368,16 @@ def create_workshop_session(session, secret):
             "amplitude": {"trackingId": settings.AMPLITUDE_TRACKING_ID}
         }
 
+    # If the workshop session is being created for a user who is waiting on
+    # it, rather than as a reserved session, mark it as such so the operator
+    # can give priority to creating it. This needs to be known when the
+    # resource is created, as the status is only updated afterwards.
+
+    if session.owner:
+        session_body["metadata"]["annotations"] = {
+            "training.educates.dev/session.allocation": "on-demand"
+        }
+
     # Create the Kubernetes resource for the workshop session.
 
     K8SWorkshopSession = pykube.object_factory(
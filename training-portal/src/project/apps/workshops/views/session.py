@@ -38,7 +38,11 @@ from csp.decorators import csp_update
 
 from ..manager.locking import resources_lock
 from ..manager.cleanup import delete_workshop_session
-from ..manager.sessions import update_session_status, create_request_resources
+from ..manager.sessions import (
+    update_session_status,
+    create_request_resources,
+    resume_workshop_session,
+)
 from ..manager.analytics import report_analytics_event
 from ..models import TrainingPortal, SessionState
 from .helpers import update_query_params
@@ -90,6 +94,14 @@ def session(request, name):
             )
         )
 
+    # If the workshop session was hibernated because it was idle, it needs to
+    # be resumed now the user is accessing it again. The page waits for the
+    # workshop instance to start up again before displaying it, but as that
+    # can take longer than the startup timeout, such as when images need to
+    # be pulled again, the workshop session isn't restarted on a timeout.
+
+    resuming = resume_workshop_session(instance.name)
+
     context["session"] = instance
     context["session_owner"] = instance.owner and instance.owner.get_username() or ""
 
@@ -104,6 +116,11 @@ def session(request, name):
     )
     context["startup_timeout"] = instance.environment.overdue.total_seconds()
 
+    context["resuming"] = resuming
+
+    if resuming:
+        context["startup_timeout"] = 0
+
     try:
         with open("/opt/app-root/static/theme/training-portal.html") as fp:
             context["portal_head_html"] = fp.read()